@@ -0,0 +1,132 @@
+import math
+import time
+from threading import Lock
+
+# one cost unit is the fixed overhead of a series; fitting or predicting adds one
+# unit per this many row-trees (rows times boosting rounds), predictions being
+# much cheaper per row than training
+ROW_TREES_PER_UNIT = 300_000
+PREDICT_WEIGHT = 0.1
+
+
+def series_cost(train_rows, forecast_points, trees):
+    """Estimated compute cost, in cost units, of forecasting one series."""
+    return 1.0 + (train_rows + PREDICT_WEIGHT * forecast_points) * trees / ROW_TREES_PER_UNIT
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request does not fit the budgets; carries the HTTP status,
+    Retry-After and the budget it exceeded (``key_budget`` or ``inflight``).
+    """
+
+    def __init__(self, status, retry_after, message, reason):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Admits requests by their estimated cost.
+
+    Every API key has a token bucket holding up to ``key_budget`` cost units that
+    refills at ``key_budget`` per minute; a request over the remaining tokens is
+    rejected with 429. The cost of all admitted requests that are still running is
+    capped at ``inflight_budget``; a request over it is rejected with 503. Costs
+    above a budget are charged as the whole budget, so a single large request is
+    admitted once the bucket is full or nothing else is running. A budget of 0
+    disables that check.
+
+    Background jobs are admitted with ``inflight=False``: they are charged to their
+    key but not to the in-flight budget, which is left to interactive requests; the
+    job queue bounds how many of them run at once.
+    """
+
+    def __init__(self, key_budget=600, inflight_budget=300, retry_after_seconds=5):
+        self.key_budget = float(key_budget)
+        self.inflight_budget = float(inflight_budget)
+        self.retry_after_seconds = int(retry_after_seconds)
+        self._buckets = {}
+        self._inflight = 0.0
+        self._lock = Lock()
+
+    def admit(self, key, cost, inflight=True):
+        """
+        Charge ``cost`` to ``key`` and, with ``inflight``, to the in-flight budget;
+        returns the amount to ``release``.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.key_budget > 0:
+                tokens = self._tokens(key, now)
+                charge = min(cost, self.key_budget)
+                if charge > tokens:
+                    rate = self.key_budget / 60.0
+                    raise AdmissionRejected(
+                        429, math.ceil((charge - tokens) / rate),
+                        f"Request cost {cost:.1f} exceeds the remaining budget of this API key ({tokens:.1f}).",
+                        'key_budget')
+            charged = 0.0
+            if inflight and self.inflight_budget > 0:
+                charged = min(cost, self.inflight_budget)
+                if self._inflight > 0 and self._inflight + charged > self.inflight_budget:
+                    raise AdmissionRejected(
+                        503, self.retry_after_seconds,
+                        f"Server is busy (in-flight cost {self._inflight:.1f} of {self.inflight_budget:.1f}).",
+                        'inflight')
+            if self.key_budget > 0:
+                self._buckets[key] = (tokens - charge, now)
+            self._inflight += charged
+        return charged
+
+    def extend(self, key, cost, admitted_cost, inflight):
+        """
+        Charge ``cost`` more to a request already admitted at ``admitted_cost`` with
+        ``inflight`` in flight, e.g. the next entity of a body forecast while it is
+        read. The extra cost is checked like a new request in ``admit`` and raises
+        ``AdmissionRejected`` when it does not fit, leaving the charge unchanged:
+        the caller stops the request and releases what it holds. A request is
+        charged at most each budget in total, so one running alone may grow to the
+        whole in-flight budget. Returns its new in-flight amount.
+        """
+        now = time.monotonic()
+        total = admitted_cost + cost
+        with self._lock:
+            if self.key_budget > 0:
+                tokens = self._tokens(key, now)
+                extra = min(total, self.key_budget) - min(admitted_cost, self.key_budget)
+                if extra > tokens:
+                    rate = self.key_budget / 60.0
+                    raise AdmissionRejected(
+                        429, math.ceil((extra - tokens) / rate),
+                        f"Request cost {total:.1f} exceeds the remaining budget of this API key.",
+                        'key_budget')
+            charged = inflight
+            if self.inflight_budget > 0 and inflight > 0:
+                charged = min(total, self.inflight_budget)
+                # cost of the other running requests, up to round-off of the sums
+                others = self._inflight - inflight
+                if others > 1e-9 and others + charged > self.inflight_budget:
+                    raise AdmissionRejected(
+                        503, self.retry_after_seconds,
+                        f"Server is busy (in-flight cost {self._inflight:.1f} of {self.inflight_budget:.1f}).",
+                        'inflight')
+            if self.key_budget > 0:
+                self._buckets[key] = (tokens - extra, now)
+            self._inflight += charged - inflight
+        return charged
+
+    def release(self, inflight):
+        with self._lock:
+            self._inflight = max(0.0, self._inflight - inflight)
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def _tokens(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.key_budget, now))
+        return min(self.key_budget, tokens + (now - updated) * self.key_budget / 60.0)
@@ -1,11 +1,36 @@
+import math
 import os
-from flask import Flask, request, jsonify, abort
+import time
+import numpy as np
+from flask import Flask, Response, request, jsonify, abort, g, stream_with_context
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.exceptions import HTTPException
 from dotenv import load_dotenv
-from datetime import datetime
-from forecaster import forecast_xgb_timeseries
+from datetime import datetime, timezone
+from forecaster import (
+    forecast_xgb_timeseries, forecast_xgb_global, forecast_xgb_entity, train_xgb_model, predict_xgb_model
+)
+from series_pool import SeriesPool, outcome
+from ngsild import (
+    ALLOWED_INTERVALS, PayloadError, build_forecast_values, detect_interval, flatten_property,
+    parse_iso, property_keys
+)
+from model_cache import ModelCache
+from model_registry import ModelRegistry
+from features import feature_cache
+from thread_budget import thread_budget
+from jobs import JobQueue, QueueFull, JOB_SUCCEEDED, JOB_FAILED
+from admission import AdmissionController, AdmissionRejected, series_cost
+from broker import BrokerClient, BrokerError
+from coalesce import SingleFlight, canonical_fingerprint, job_fingerprint
+from ingest import NDJSON_MIMETYPES, HashingReader, iter_json_array, iter_ndjson
+from responses import (
+    accepted_encoding, compress_response, json_bytes, json_response, negotiated_response, stream_response
+)
+from metrics import Registry, StageTimer, SIZE_BUCKETS, BATCH_BUCKETS
 from functools import wraps
+from collections import deque, namedtuple
 # Load environment variables
 load_dotenv()
 API_KEY_FILE = os.environ["API_KEY_FILE"]
@@ -17,18 +42,169 @@ MAX_INTERVAL_SECONDS = int(os.environ["MAX_INTERVAL_SECONDS"])
 FIDELITY_MIN = float(os.environ["FIDELITY_MIN"])
 FIDELITY_MAX = float(os.environ["FIDELITY_MAX"])
 RATE_LIMIT = os.environ["RATE_LIMIT_PER_MINUTE"]
+FORECAST_EXECUTOR = os.getenv("FORECAST_EXECUTOR", "serial")
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", os.cpu_count() or 1))
+FIT_THREADS = int(os.getenv("FIT_THREADS", os.cpu_count() or 1))
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", 128))
+MODEL_CACHE_TTL_SECONDS = float(os.getenv("MODEL_CACHE_TTL_SECONDS", 900))
+INCREMENTAL_TRAINING = os.getenv("INCREMENTAL_TRAINING", "false").lower() in ('1', 'true', 'yes')
+GLOBAL_MODEL = os.getenv("GLOBAL_MODEL", "false").lower() in ('1', 'true', 'yes')
+ENTITY_MODEL = os.getenv("ENTITY_MODEL", "false").lower() in ('1', 'true', 'yes')
+AUTO_SIZE = os.getenv("AUTO_SIZE", "false").lower() in ('1', 'true', 'yes')
+FAST_PATH = os.getenv("FAST_PATH", "true").lower() in ('1', 'true', 'yes')
+DEFAULT_MODEL_SIZE_MODULATOR = 3.0
+MAX_FIT_ROWS = int(os.getenv("MAX_FIT_ROWS", 0))
+FEATURE_CACHE_MB = float(os.getenv("FEATURE_CACHE_MB", 64))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 1))
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", 16))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", 3600))
+JOB_STORE_DIR = os.getenv("JOB_STORE_DIR", "job_store")
+JOB_RETRY_AFTER_SECONDS = 5
+ADMISSION_KEY_BUDGET = float(os.getenv("ADMISSION_KEY_BUDGET", 600))
+ADMISSION_INFLIGHT_BUDGET = float(os.getenv("ADMISSION_INFLIGHT_BUDGET", 300))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", 10))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 32))
+SERIES_RESULT_CACHE_SIZE = int(os.getenv("SERIES_RESULT_CACHE_SIZE", 256))
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "model_registry")
+MODEL_REGISTRY_LOADED = int(os.getenv("MODEL_REGISTRY_LOADED", 256))
+STREAM_INPUT = os.getenv("STREAM_INPUT", "false").lower() in ('1', 'true', 'yes')
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() in ('1', 'true', 'yes')
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+# worker processes serving the app, exported by src/gunicorn.conf.py
+WEB_WORKER_PROCESSES = max(1, int(os.getenv("WEB_WORKER_PROCESSES", 1)))
+WARMUP = os.getenv("WARMUP", "true").lower() in ('1', 'true', 'yes')
+WARMUP_POINTS = 7 * 24
+BROKER_URL = os.getenv("BROKER_URL", "")
+BROKER_MAX_CONNECTIONS = int(os.getenv("BROKER_MAX_CONNECTIONS", 8))
+BROKER_SLICE_SECONDS = int(os.getenv("BROKER_SLICE_SECONDS", 86400))
+BROKER_TIMEOUT_SECONDS = float(os.getenv("BROKER_TIMEOUT_SECONDS", 30))
+BROKER_HISTORY_DAYS = float(os.getenv("BROKER_HISTORY_DAYS", 7))
+BROKER_MAX_HISTORY_DAYS = float(os.getenv("BROKER_MAX_HISTORY_DAYS", 31))
+BROKER_TENANT = os.getenv("BROKER_TENANT", "")
+BROKER_TOKEN = os.getenv("BROKER_TOKEN", "")
 from flask_cors import CORS
 # Load API keys
 with open(API_KEY_FILE) as f:
     VALID_KEYS = {line.strip() for line in f if line.strip()}
 
 app = Flask(__name__)
+series_pool = SeriesPool(mode=FORECAST_EXECUTOR, workers=FORECAST_WORKERS)
+# with FORECAST_EXECUTOR=process every worker process keeps its own copy of the cache
+model_cache = ModelCache(max_entries=MODEL_CACHE_SIZE, ttl_seconds=MODEL_CACHE_TTL_SECONDS)
+feature_cache.max_bytes = int(FEATURE_CACHE_MB * 2**20)
+# XGBoost threads shared by all concurrent fits; process workers split them
+thread_budget.cores = max(1, FIT_THREADS // FORECAST_WORKERS if FORECAST_EXECUTOR == 'process' else FIT_THREADS)
+# models trained through /ngsi-ld/train, shared by all workers through the directory
+registry = ModelRegistry(MODEL_REGISTRY_DIR, max_loaded=MODEL_REGISTRY_LOADED)
+# pull mode reads the history of the requested entities from the Context Broker
+broker = None
+if BROKER_URL:
+    broker_headers = {}
+    if BROKER_TENANT:
+        broker_headers['NGSILD-Tenant'] = BROKER_TENANT
+    if BROKER_TOKEN:
+        broker_headers['Authorization'] = f"Bearer {BROKER_TOKEN}"
+    broker = BrokerClient(
+        BROKER_URL, max_connections=BROKER_MAX_CONNECTIONS, slice_seconds=BROKER_SLICE_SECONDS,
+        timeout=BROKER_TIMEOUT_SECONDS, headers=broker_headers, max_points=MAX_TRAIN_POINTS
+    )
+# jobs are shared by all workers through the store directory
+job_queue = JobQueue(
+    workers=JOB_WORKERS, max_depth=JOB_QUEUE_DEPTH, result_ttl_seconds=JOB_RESULT_TTL_SECONDS,
+    store_dir=JOB_STORE_DIR
+)
+# every worker admits its share of the budgets, so all of them together keep to the configured ones
+admission = AdmissionController(
+    key_budget=ADMISSION_KEY_BUDGET / WEB_WORKER_PROCESSES,
+    inflight_budget=ADMISSION_INFLIGHT_BUDGET / WEB_WORKER_PROCESSES,
+    retry_after_seconds=JOB_RETRY_AFTER_SECONDS
+)
+# identical concurrent (or just repeated) batches and series are computed once
+request_flights = SingleFlight(ttl_seconds=RESULT_CACHE_TTL_SECONDS, max_entries=RESULT_CACHE_SIZE)
+series_flights = SingleFlight(ttl_seconds=RESULT_CACHE_TTL_SECONDS, max_entries=SERIES_RESULT_CACHE_SIZE)
+
+# Prometheus metrics, exposed on /metrics
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram(
+    'forecast_request_seconds', 'Request duration by endpoint.', labelnames=('endpoint',))
+REQUEST_STAGE_SECONDS = metrics.histogram(
+    'forecast_request_stage_seconds', 'Duration of request stages (parse, fetch, prepare, forecast, assemble, serialize).',
+    labelnames=('stage',))
+SERIES_STAGE_SECONDS = metrics.histogram(
+    'forecast_series_stage_seconds', 'Duration of per-series stages (resample, features, fit, predict, format).',
+    labelnames=('stage',))
+FIT_SECONDS = metrics.histogram('forecast_fit_seconds', 'XGBoost fit duration per trained model.')
+SERIES_PER_BATCH = metrics.histogram(
+    'forecast_series_per_batch', 'Forecasted series per batch.', buckets=BATCH_BUCKETS)
+POINTS_PER_SERIES = metrics.histogram(
+    'forecast_points_per_series', 'Training points received per series.', buckets=SIZE_BUCKETS)
+TREES_TRAINED = metrics.counter('forecast_trees_trained_total', 'Boosting rounds trained.')
+SERIES_TOTAL = metrics.counter('forecast_series_total', 'Forecasted series by outcome.', labelnames=('outcome',))
+REJECTED_REQUESTS = metrics.counter(
+    'forecast_rejected_requests_total',
+    'Requests turned away for load (429/503) by reason: rate_limit, key_budget, inflight or job_queue.',
+    labelnames=('endpoint', 'reason'))
+metrics.callback_counter('forecast_model_cache_hits_total', 'Model cache hits.', lambda: model_cache.hits)
+metrics.callback_counter('forecast_model_cache_misses_total', 'Model cache misses.', lambda: model_cache.misses)
+metrics.gauge('forecast_feature_cache_bytes', 'Bytes held by the feature cache.', lambda: feature_cache.stats()['bytes'])
+metrics.gauge('forecast_fit_threads_in_use', 'XGBoost threads held by running fits.', lambda: thread_budget.in_use)
+metrics.gauge('forecast_jobs_pending', 'Queued or running forecast jobs.', lambda: job_queue.pending)
+metrics.callback_counter('forecast_coalesced_requests_total',
+                         'Batch requests served by a concurrent or cached identical request.',
+                         lambda: request_flights.joined + request_flights.cached)
+metrics.callback_counter('forecast_coalesced_series_total',
+                         'Series served by a concurrent or cached identical series.',
+                         lambda: series_flights.joined + series_flights.cached)
+metrics.gauge('forecast_admission_inflight_cost', 'Estimated cost of admitted requests still running.',
+              lambda: admission.inflight)
+REQUEST_COST = metrics.histogram(
+    'forecast_request_cost', 'Estimated cost of forecast requests, in cost units.', buckets=BATCH_BUCKETS + (200, 500, 1000))
+
 limiter = Limiter(
     app,
     key_func=lambda: request.headers.get('X-API-KEY', get_remote_address()),
     default_limits=[RATE_LIMIT]
 )
 
+@app.before_request
+def start_request_timer():
+    g.timer = StageTimer()
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    timer = g.get('timer')
+    if timer is None:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint=endpoint)
+    for stage, seconds in timer.durations.items():
+        if not stage.startswith('series_'):
+            REQUEST_STAGE_SECONDS.observe(seconds, stage=stage)
+    # only load shedding: the flat rate limit (429) or an admission or job queue
+    # rejection (see retry_later); invalid input, auth and missing jobs are not counted
+    reason = g.get('rejected') or ('rate_limit' if response.status_code == 429 else None)
+    if reason is not None:
+        REJECTED_REQUESTS.inc(endpoint=endpoint, reason=reason)
+    if timer.durations and not response.is_streamed:
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+# registered after the metrics hook so it runs first and is included in Server-Timing
+@app.after_request
+def compress(response):
+    if not RESPONSE_COMPRESSION or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+    timer = g.get('timer') or StageTimer()
+    with timer.stage('compress'):
+        return compress_response(response, encoding, COMPRESS_MIN_BYTES)
+
 def require_api_key(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -60,22 +236,202 @@ def validate_params(params):
     if not (FIDELITY_MIN <= fidelity <= FIDELITY_MAX):
         abort(400, f"model_size_modulator must be between {FIDELITY_MIN} and {FIDELITY_MAX}")
 
-ALLOWED_INTERVALS = [
-    1, 2, 3, 4, 5, 10, 15, 30, 60,
-    120, 300, 600, 900, 1200, 1800, 3600,
-    7200, 10800, 14400, 18000, 21600,
-    28800, 43200, 86400, 172800
-]
+def query_flag(name, default=False):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
 
-@app.route('/ngsi-ld/batch_forecast', methods=['POST'])
-@require_api_key
-@limiter.limit(RATE_LIMIT)
-def ngsi_ld_batch_forecast():
-    payload = request.get_json(force=True)
-    if not isinstance(payload, list):
-        abort(400, "Payload must be a JSON array of entities.")
+def run_series(**job):
+    return forecast_xgb_timeseries(model_cache=model_cache, **job)
 
-    # parse and validate user window
+def run_global(**job):
+    return forecast_xgb_global(model_cache=model_cache, **job)
+
+def run_global_groups(jobs, slots):
+    # one model per property URI and interval, trained on all series of the group;
+    # a series that fails on its own gets its error, the others are still forecast
+    groups = {}
+    for i, ((_, prop_uri, _), job) in enumerate(zip(slots, jobs)):
+        groups.setdefault((prop_uri, job['interval_seconds']), []).append(i)
+    members = list(groups.values())
+    group_jobs = [{
+        'series': [jobs[i]['data'] for i in idxs],
+        'forecast_period': jobs[idxs[0]]['forecast_period'],
+        'interval_seconds': jobs[idxs[0]]['interval_seconds'],
+        'model_size_modulator': jobs[idxs[0]]['model_size_modulator'],
+        'auto_size': jobs[idxs[0]]['auto_size'],
+        'fast_path': jobs[idxs[0]]['fast_path'],
+        'max_train_rows': MAX_FIT_ROWS
+    } for idxs in members]
+
+    results = [None] * len(jobs)
+    for idxs, (frames, error) in zip(members, series_pool.map(run_global, group_jobs)):
+        for pos, i in enumerate(idxs):
+            if error is not None:
+                results[i] = (None, error)
+            elif isinstance(frames[pos], Exception):
+                results[i] = (None, frames[pos])
+            else:
+                results[i] = (frames[pos], None)
+    return results
+
+def run_entity(jobs):
+    """
+    Forecast the series of one entity. Series read at the same timestamps, with the
+    same interval and only finite readings share one ``forecast_xgb_entity`` call;
+    the others are forecast on their own. Returns ``(result, error)`` per job.
+    """
+    groups = []
+    for i, job in enumerate(jobs):
+        data = job['data']
+        if np.isfinite(data['value']).all():
+            for group in groups:
+                first = jobs[group[0]]
+                if first['interval_seconds'] == job['interval_seconds'] and first['data']['timestamp'].equals(data['timestamp']):
+                    group.append(i)
+                    break
+            else:
+                groups.append([i])
+        else:
+            groups.append([i])
+
+    results = [None] * len(jobs)
+    for group in groups:
+        first = jobs[group[0]]
+        try:
+            if len(group) == 1:
+                frames = [run_series(**first)]
+            else:
+                frames = forecast_xgb_entity(
+                    data={
+                        'timestamp': first['data']['timestamp'],
+                        'value': np.column_stack([jobs[i]['data']['value'] for i in group])
+                    },
+                    forecast_period=first['forecast_period'],
+                    interval_seconds=first['interval_seconds'],
+                    model_size_modulator=first['model_size_modulator'],
+                    auto_size=first['auto_size'],
+                    fast_path=first['fast_path'],
+                    max_train_rows=first['max_train_rows']
+                )
+        except Exception as exc:
+            for i in group:
+                results[i] = (None, exc)
+            continue
+        for i, frame in zip(group, frames):
+            results[i] = (frame, None)
+    return results
+
+def iter_entities(jobs, slots):
+    """
+    Forecast ``jobs`` entity by entity (see ``run_entity``) on the series pool.
+    ``jobs`` may be a lazy iterable: job ``i`` is read before ``slots[i]``, and
+    ``series_pool.lookahead`` entities are started ahead of the one waited for.
+    Yields ``(result, error, True)`` in job order as soon as each entity is done.
+    """
+    window = deque()
+    group, group_entity = [], None
+
+    def start_group():
+        window.append((len(group), series_pool.submit(run_entity, {'jobs': group})))
+
+    def finished_group():
+        count, future = window.popleft()
+        results, error = outcome(future)
+        return [(result, series_error, True) for result, series_error in results or [(None, error)] * count]
+
+    try:
+        for i, job in enumerate(jobs):
+            if group and slots[i][0] != group_entity:
+                start_group()
+                group = []
+                while len(window) > series_pool.lookahead:
+                    yield from finished_group()
+            group.append(job)
+            group_entity = slots[i][0]
+        if group:
+            start_group()
+        while window:
+            yield from finished_group()
+    finally:
+        for _, future in window:
+            future.cancel()
+
+def iter_coalesced(jobs):
+    """
+    Forecast ``jobs`` on the series pool, sharing series identical to ones already
+    running for a concurrent batch or finished moments ago. ``jobs`` may be a lazy
+    iterable; ``series_pool.lookahead`` jobs are started ahead of the one waited
+    for. Yields ``(result, error, computed)`` in job order as soon as each is
+    available; ``computed`` is false for results shared from another call.
+    """
+    # [key, flight, future of an unpublished leader or None, leader] in job order
+    window = deque()
+
+    def publish(entry):
+        key, flight, future, _ = entry
+        if future is not None:
+            result, error = outcome(future)
+            series_flights.publish(key, flight, result, error)
+            entry[2] = None
+
+    def finished(entry):
+        _, flight, _, leader = entry
+        if leader:
+            publish(entry)
+        elif not flight.done.is_set():
+            # publish before waiting on others, so batches waiting on each other never deadlock
+            for other in window:
+                publish(other)
+            flight.done.wait()
+        return flight.result, flight.error, leader
+
+    try:
+        for job in jobs:
+            key = job_fingerprint(job)
+            flight, leader = series_flights.claim(key)
+            window.append([key, flight, series_pool.submit(run_series, job) if leader else None, leader])
+            while len(window) > series_pool.lookahead:
+                yield finished(window.popleft())
+        while window:
+            yield finished(window.popleft())
+    finally:
+        for key, flight, future, _ in window:
+            if future is not None:
+                future.cancel()
+                series_flights.publish(key, flight, error=RuntimeError('Forecast was interrupted'))
+
+def run_coalesced(jobs):
+    """``iter_coalesced`` as lists: all results in job order and the ones computed by this call."""
+    results, computed = [], []
+    for result, error, leader in iter_coalesced(jobs):
+        results.append((result, error))
+        if leader:
+            computed.append((result, error))
+    return results, computed
+
+# Validated batch, ready to run: the output entities with placeholders for the
+# forecasted properties, one forecast job per placeholder and its slot
+# (entity index, property URI, metadata), the estimated cost of the batch (of
+# its first entity if ``jobs`` is a generator, see ``streamed_plan``), the
+# representation of the output (see REPRESENTATIONS) and whether the series
+# read together by an entity are forecast together.
+BatchPlan = namedtuple('BatchPlan', 'output jobs slots global_model cost representation entity_model',
+                       defaults=('normalized', False))
+
+# NGSI-LD normalized temporal values, the simplified temporal representation
+# ([value, observedAt] pairs) or plain value columns on a per-entity time index
+REPRESENTATIONS = ('normalized', 'simplified', 'columnar')
+
+def representation_param():
+    representation = request.args.get('format', 'normalized').lower()
+    if representation not in REPRESENTATIONS:
+        abort(400, f"format must be one of {', '.join(REPRESENTATIONS)}")
+    return representation
+
+def parse_window():
+    """Forecast window from the ``timerel``, ``time`` and ``endTime`` query parameters."""
     timerel      = request.args.get('timerel')
     time_str     = request.args.get('time')
     end_time_str = request.args.get('endTime')
@@ -88,139 +444,801 @@ def ngsi_ld_batch_forecast():
         abort(400, f"Invalid ISO timestamp for time or endTime: {time_str}, {end_time_str}")
     if period_end <= period_start:
         abort(400, "endTime must be after time")
+    return period_start, period_end
+
+def request_payload():
+    """
+    The request body: a parsed JSON array, or with streaming ingestion (NDJSON
+    bodies, or ``stream_input=true``) an iterator parsing one entity at a time from
+    the body stream. Returns it with the ``HashingReader`` of a streamed body.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        reader = HashingReader(request.stream)
+        return iter_ndjson(reader), reader
+    if query_flag('stream_input', STREAM_INPUT):
+        reader = HashingReader(request.stream)
+        return iter_json_array(reader), reader
+    return request.get_json(force=True), None
+
+def checked_entities(payload):
+    """
+    Entities of ``request_payload()`` with the series count validated; streamed
+    entities are counted as they arrive and their raw structure is dropped once
+    the caller moves on to the next one.
+    """
+    if isinstance(payload, list):
+        # series count validation
+        total_series = sum(len(property_keys(ent)) for ent in payload)
+        if total_series > MAX_SERIES_PER_BATCH:
+            abort(400, f"Too many series: max {MAX_SERIES_PER_BATCH} allowed (got {total_series}).")
+        yield from payload
+        return
+    if not hasattr(payload, '__next__'):
+        abort(400, "Payload must be a JSON array of entities.")
+    total_series = 0
+    try:
+        for entity in payload:
+            total_series += len(property_keys(entity))
+            if total_series > MAX_SERIES_PER_BATCH:
+                abort(400, f"Too many series: max {MAX_SERIES_PER_BATCH} allowed (got more).")
+            yield entity
+    except PayloadError as e:
+        abort(400, str(e))
+
+def model_size_modulator_param():
+    modulator = request.args.get('model_size_modulator', DEFAULT_MODEL_SIZE_MODULATOR, type=float)
+    if not (FIDELITY_MIN <= modulator <= FIDELITY_MAX):
+        abort(400, f"model_size_modulator must be between {FIDELITY_MIN} and {FIDELITY_MAX}")
+    return modulator
 
-    # series count validation
-    total_series = sum(
-        len([k for k in ent if k not in ('id','type','dateObserved','@context')])
-        for ent in payload
+def training_series(flat, entity, interval_override):
+    """Validate the readings of one numeric property and return its interval."""
+    n = len(flat.values)
+    POINTS_PER_SERIES.observe(n)
+    if n < 2:
+        abort(400, f"Need at least two readings for {entity.get('id')}")
+    if n > MAX_TRAIN_POINTS:
+        abort(400, f"Training data too long: max {MAX_TRAIN_POINTS} points allowed.")
+    interval = interval_override or detect_interval(flat.timestamps, ALLOWED_INTERVALS)
+    if not (MIN_INTERVAL_SECONDS <= interval <= MAX_INTERVAL_SECONDS):
+        abort(400, f"interval_seconds must be between {MIN_INTERVAL_SECONDS} and {MAX_INTERVAL_SECONDS}")
+    return interval
+
+def training_rows(flat, interval):
+    # resampled rows a fit will see, for admission cost estimates
+    rows = (flat.timestamps.asi8.max() - flat.timestamps.asi8.min()) // (interval * 10**9) + 1
+    return min(rows, MAX_FIT_ROWS) if MAX_FIT_ROWS else rows
+
+# query options of a forecast batch
+BatchOptions = namedtuple('BatchOptions', 'period_start period_end interval_override incremental global_model '
+                                          'entity_model auto_size fast_path modulator representation')
+
+def batch_options():
+    """Options of a batch request from its query parameters; aborts with 400 on invalid ones."""
+    period_start, period_end = parse_window()
+    global_model = query_flag('global_model', GLOBAL_MODEL)
+    entity_model = query_flag('entity_model', ENTITY_MODEL)
+    if global_model and entity_model:
+        abort(400, "global_model and entity_model cannot be combined")
+    return BatchOptions(
+        period_start, period_end,
+        interval_override=request.args.get('interval_seconds', type=int),
+        incremental=query_flag('incremental', INCREMENTAL_TRAINING),
+        global_model=global_model,
+        entity_model=entity_model,
+        auto_size=query_flag('auto_size', AUTO_SIZE),
+        fast_path=query_flag('fast_path', FAST_PATH),
+        modulator=model_size_modulator_param(),
+        representation=representation_param()
     )
-    if total_series > MAX_SERIES_PER_BATCH:
-        abort(400, f"Too many series: max {MAX_SERIES_PER_BATCH} allowed (got {total_series}).")
 
+def forecast_metadata(metadata, forecast_points, interval):
+    """
+    The input point metadata ``build_forecast_values`` can reach for a forecast of
+    about ``forecast_points`` points: one item per point, then the last one (an
+    hour of spare points covers a DST shift of naive window bounds).
+    """
+    reach = forecast_points + max(1, 3600 // interval)
+    return metadata[:reach] + metadata[-1:] if len(metadata) > reach else metadata
+
+def plan_entity(entity, opts, output, slots):
+    """
+    Validate one entity of a batch, append its output entity to ``output`` and the
+    slots of its forecasted properties to ``slots``; returns its jobs and cost.
+    """
+    # Prepare new entity structure without dateObserved
+    new_ent = {
+        'id': entity.get('id'),
+        'type': entity.get('type'),
+        '@context': entity.get('@context', [])
+    }
+    jobs = []
+    cost = 0.0
+
+    for prop_uri in property_keys(entity):
+        raw = entity[prop_uri]
+
+        # flatten & validate
+        try:
+            flat = flatten_property(raw, prop_uri)
+        except PayloadError as e:
+            abort(400, str(e))
+
+        # fallback for non-numeric
+        if flat.non_numeric:
+            if len(flat.values):
+                last_value = float(flat.values[-1])
+                last_ts = parse_iso(flat.observed[-1]).isoformat()
+                last_meta = flat.metadata[-1]
+                fc_values = [{
+                    'type': 'Property',
+                    'values': [{
+                        'metadata': last_meta,
+                        'value': last_value,
+                        'observedAt': last_ts
+                    }]
+                } for _ in range(len(flat.values))]
+                new_ent[prop_uri] = {'type': 'Property', 'values': fc_values}
+            else:
+                new_ent[prop_uri] = raw
+            continue
+
+        # data-length checks and interval
+        interval = training_series(flat, entity, opts.interval_override)
+        n = len(flat.values)
+        if n > MAX_FORECAST_POINTS:
+            abort(400, f"Forecast period too long: max {MAX_FORECAST_POINTS} points allowed.")
+
+        # use user window
+        start, end = opts.period_start, opts.period_end
+        forecast_points = int((end - start).total_seconds() // interval) + 1
+
+        # queue the forecast; the slot keeps the property position in the entity
+        new_ent[prop_uri] = None
+        jobs.append({
+            'data': {'timestamp': flat.timestamps, 'value': flat.values},
+            'forecast_period': [start.isoformat(), end.isoformat()],
+            'interval_seconds': interval,
+            'use_gap_detection': False,
+            'series_key': (entity.get('id'), prop_uri),
+            'incremental': opts.incremental,
+            'auto_size': opts.auto_size,
+            'fast_path': opts.fast_path,
+            'max_train_rows': MAX_FIT_ROWS,
+            'model_size_modulator': opts.modulator
+        })
+        slots.append((len(output), prop_uri, forecast_metadata(flat.metadata, forecast_points, interval)))
+
+        # admission cost from the resampled rows, forecast points and trees
+        cost += series_cost(training_rows(flat, interval), forecast_points, max(1, int(opts.modulator * 100)))
+
+    output.append(new_ent)
+    return jobs, cost
+
+def prepare_batch(payload):
+    """Validate a batch request and queue its series; aborts with 400 on invalid input."""
+    opts = batch_options()
+    output = []
+    jobs, slots = [], []
+    cost = 0.0
+    for entity in checked_entities(payload):
+        entity_jobs, entity_cost = plan_entity(entity, opts, output, slots)
+        jobs.extend(entity_jobs)
+        cost += entity_cost
+
+    REQUEST_COST.observe(cost)
+    return BatchPlan(output, jobs, slots, opts.global_model, cost, opts.representation, opts.entity_model)
+
+def streamed_plan(payload):
+    """
+    Plan of a streamed body that is forecast while it is parsed: its ``jobs`` are
+    a generator reading the next entity from the body only when the forecasts need
+    more series, appending to ``output`` and ``slots`` as it goes, so a batch never
+    holds more than the entities in flight. The first entity is read right away
+    and admitted with its cost; every later one is charged as it is read
+    (``AdmissionController.extend``). Either raises ``AdmissionRejected`` when the
+    cost does not fit, and an invalid later entity aborts with 400 while the jobs
+    are read. Returns the plan and a function releasing its charge.
+    """
+    opts = batch_options()
+    key = request.headers.get('X-API-KEY')
+    entities = checked_entities(payload)
+    output, slots = [], []
+    first = next(entities, None)
+    first_jobs, cost = plan_entity(first, opts, output, slots) if first is not None else ([], 0.0)
+    first = None
+    charge = {'cost': cost, 'inflight': admission.admit(key, cost)}
+
+    def jobs():
+        yield from first_jobs
+        first_jobs.clear()
+        for entity in entities:
+            entity_jobs, entity_cost = plan_entity(entity, opts, output, slots)
+            entity = None
+            charge['inflight'] = admission.extend(key, entity_cost, charge['cost'], charge['inflight'])
+            charge['cost'] += entity_cost
+            yield from entity_jobs
+        REQUEST_COST.observe(charge['cost'])
+
+    def release():
+        admission.release(charge['inflight'])
+
+    plan = BatchPlan(output, jobs(), slots, False, cost, opts.representation, opts.entity_model)
+    return plan, release
+
+def prepare_training(payload):
+    """Validate a training request and queue its series; aborts with 400 on invalid input."""
     interval_override = request.args.get('interval_seconds', type=int)
+    auto_size = query_flag('auto_size', AUTO_SIZE)
+    fast_path = query_flag('fast_path', FAST_PATH)
+    modulator = model_size_modulator_param()
     output = []
+    jobs, slots = [], []
+    cost = 0.0
 
-    for entity in payload:
-        # Prepare new entity structure without dateObserved
+    for entity in checked_entities(payload):
         new_ent = {
             'id': entity.get('id'),
             'type': entity.get('type'),
             '@context': entity.get('@context', [])
         }
-        first_fc_timestamps = None
+        for prop_uri in property_keys(entity):
+            try:
+                flat = flatten_property(entity[prop_uri], prop_uri)
+            except PayloadError as e:
+                abort(400, str(e))
+            if flat.non_numeric:
+                new_ent[prop_uri] = {'type': 'Property', 'value': None, 'error': 'Non-numeric values are not trained'}
+                continue
 
-        for prop_uri in (k for k in entity if k not in ('id','type','dateObserved','@context')):
-            raw = entity[prop_uri]
-            data, metadata_list = [], []
-            non_numeric = False
+            interval = training_series(flat, entity, interval_override)
+            new_ent[prop_uri] = None
+            jobs.append({
+                'data': {'timestamp': flat.timestamps, 'value': flat.values},
+                'interval_seconds': interval,
+                'model_size_modulator': modulator,
+                'auto_size': auto_size,
+                'fast_path': fast_path,
+                'max_train_rows': MAX_FIT_ROWS
+            })
+            # the last point metadata is stored with the model for the forecasts
+            slots.append((len(output), prop_uri, flat.metadata[-1:] or [{}]))
+            cost += series_cost(training_rows(flat, interval), 0, max(1, int(modulator * 100)))
+        output.append(new_ent)
 
-            # flatten & validate
-            for batch in raw.get('values', []):
-                for pt in batch.get('values', []):
-                    try:
-                        num = float(pt.get('value'))
-                    except (TypeError, ValueError):
-                        non_numeric = True
-                        break
-                    try:
-                        ts = datetime.fromisoformat(pt.get('observedAt').replace('Z','+00:00'))
-                    except (TypeError, ValueError):
-                        abort(400, f"Invalid timestamp for {prop_uri}: {pt.get('observedAt')}")
-                    data.append({'timestamp': ts.isoformat(), 'value': num})
-                    metadata_list.append(pt.get('metadata', {}))
-                if non_numeric:
-                    break
+    return BatchPlan(output, jobs, slots, False, cost)
 
-            # fallback for non-numeric
-            if non_numeric:
-                if data:
-                    last, last_meta = data[-1], metadata_list[-1]
-                    fc_values = [{
-                        'type': 'Property',
-                        'values': [{
-                            'metadata': last_meta,
-                            'value': last['value'],
-                            'observedAt': last['timestamp']
-                        }]
-                    } for _ in data]
-                    new_ent[prop_uri] = {'type': 'Property', 'values': fc_values}
-                else:
-                    new_ent[prop_uri] = raw
-                continue
+def compute_batch(plan, timer=None):
+    """Run the forecasts of a prepared batch and return the NGSI-LD output entities."""
+    output, jobs, slots = plan.output, plan.jobs, plan.slots
+    timer = timer or StageTimer()
 
-            # data-length checks
-            n = len(data)
-            if n < 2:
-                abort(400, f"Need at least two readings for {entity.get('id')}")
-            if n > MAX_TRAIN_POINTS:
-                abort(400, f"Training data too long: max {MAX_TRAIN_POINTS} points allowed.")
+    # generate forecasts (serially or on the series pool, see FORECAST_EXECUTOR)
+    with timer.stage('forecast'):
+        if plan.global_model:
+            results = computed = run_global_groups(jobs, slots)
+        elif plan.entity_model:
+            results = computed = [(df_fc, error) for df_fc, error, _ in iter_entities(jobs, slots)]
+        else:
+            results, computed = run_coalesced(jobs)
+    SERIES_PER_BATCH.observe(len(results))
+    record_series_metrics(computed, timer)
 
-            # determine interval
-            if interval_override:
-                interval = interval_override
-            else:
-                times = [datetime.fromisoformat(d['timestamp']) for d in data]
-                diffs = [(times[i] - times[i-1]).total_seconds() for i in range(1, len(times))]
-                diffs_sorted = sorted(diffs)
-                trim = int(len(diffs_sorted) * 0.15)
-                trimmed = diffs_sorted[trim:-trim] if len(diffs_sorted) > 2*trim else diffs_sorted
-                avg = sum(trimmed) / len(trimmed)
-                interval = min(ALLOWED_INTERVALS, key=lambda x: abs(x - avg))
-
-            if not (MIN_INTERVAL_SECONDS <= interval <= MAX_INTERVAL_SECONDS):
-                abort(400, f"interval_seconds must be between {MIN_INTERVAL_SECONDS} and {MAX_INTERVAL_SECONDS}")
-            if n > MAX_FORECAST_POINTS:
-                abort(400, f"Forecast period too long: max {MAX_FORECAST_POINTS} points allowed.")
-
-            # use user window
-            start, end = period_start, period_end
-
-            # generate forecast
-            df_fc = forecast_xgb_timeseries(
-                data=data,
-                forecast_period=[start.isoformat(), end.isoformat()],
-                interval_seconds=interval,
-                use_gap_detection=False
-            )
-
-            # ensure metadata_list covers all forecasted rows
-            m = len(df_fc)
-            if len(metadata_list) >= m:
-                fc_metadata = metadata_list[:m]
-            else:
-                last_meta = metadata_list[-1]
-                fc_metadata = metadata_list + [last_meta] * (m - len(metadata_list))
-
-            # rebuild nested values
-            fc_values = []
-            for idx, (ts, row) in enumerate(df_fc.iterrows()):
-                ts_str = ts if isinstance(ts, str) else ts.isoformat()
-                fc_values.append({
-                    'type': 'Property',
-                    'values': [{
-                        'metadata': fc_metadata[idx],
-                        'value': float(row['forecast']),
-                        'observedAt': ts_str
-                    }]
-                })
+    with timer.stage('assemble'):
+        return assemble_batch(output, slots, results, plan.representation)
+
+def iter_batch(plan, timer=None):
+    """
+    Like ``compute_batch``, but yields the output entities one at a time, each as
+    soon as all of its series are forecast, and drops them from the plan afterwards.
+    The jobs of the plan may be a generator that fills ``output`` and ``slots``.
+    """
+    output, jobs, slots = plan.output, plan.jobs, plan.slots
+    timer = timer or StageTimer()
 
-            # capture timestamps from the first forecasted series
-            if first_fc_timestamps is None:
-                first_fc_timestamps = [item['values'][0]['observedAt'] for item in fc_values]
+    if plan.global_model:
+        results = ((df_fc, error, True) for df_fc, error in run_global_groups(jobs, slots))
+    elif plan.entity_model:
+        results = iter_entities(jobs, slots)
+    else:
+        results = iter_coalesced(jobs)
+
+    def finished_entity(ent_idx, entity_results):
+        new_ent = assemble_entity(output[ent_idx], entity_results, plan.representation)
+        output[ent_idx] = None
+        return new_ent
+
+    ent_idx, entity_results, series = 0, [], 0
+    try:
+        # slot i is known once job i has been read, so the result comes first
+        for i, (df_fc, error, computed) in enumerate(results):
+            slot = slots[i]
+            while ent_idx < slot[0]:
+                yield finished_entity(ent_idx, entity_results)
+                ent_idx, entity_results = ent_idx + 1, []
+            if computed:
+                record_series_metrics([(df_fc, error)], timer)
+            entity_results.append((slot, (df_fc, error)))
+            series += 1
+        while ent_idx < len(output):
+            yield finished_entity(ent_idx, entity_results)
+            ent_idx, entity_results = ent_idx + 1, []
+    finally:
+        results.close()
+    SERIES_PER_BATCH.observe(series)
 
-            new_ent[prop_uri] = {'type': 'Property', 'values': fc_values}
+def record_series_metrics(results, timer):
+    for df_fc, error in results:
+        if error is not None:
+            SERIES_TOTAL.inc(outcome='error')
+            continue
+        SERIES_TOTAL.inc(outcome='ok')
+        for stage, seconds in df_fc.attrs.get('timings', {}).items():
+            SERIES_STAGE_SECONDS.observe(seconds, stage=stage)
+            # summed over all series of the batch (they may have run in parallel)
+            timer.add(f"series_{stage}", seconds)
+        if 'fit' in df_fc.attrs.get('timings', {}):
+            FIT_SECONDS.observe(df_fc.attrs['timings']['fit'])
+        TREES_TRAINED.inc(df_fc.attrs.get('trees_trained', 0))
 
-        # after processing all properties, set dateObserved to forecasted timestamps
-        if first_fc_timestamps:
-            new_ent['dateObserved'] = {
-                'type': 'Property',
-                'values': first_fc_timestamps
+def forecast_info(df_fc):
+    # NGSI-LD sub-property describing how the forecast was produced
+    return {
+        'type': 'Property',
+        'value': {
+            'path': df_fc.attrs.get('path'),
+            'trees': df_fc.attrs.get('trees_used'),
+            'autoSized': df_fc.attrs.get('auto_sized', False)
+        }
+    }
+
+def assemble_batch(output, slots, results, representation='normalized'):
+    by_entity = {}
+    for slot, result in zip(slots, results):
+        by_entity.setdefault(slot[0], []).append((slot, result))
+    for ent_idx, new_ent in enumerate(output):
+        assemble_entity(new_ent, by_entity.get(ent_idx, []), representation)
+    return output
+
+def assemble_entity(new_ent, slot_results, representation='normalized'):
+    """
+    Fill the forecasted properties of one output entity and its time axis:
+    ``dateObserved`` for the normalized representation, ``timeIndex`` (start,
+    interval, count) for the columnar one. Properties on a different grid than
+    the first one carry their own ``timeIndex``.
+    """
+    first_fc_timestamps = None
+    time_index = None
+    for (_, prop_uri, metadata_list), (df_fc, error) in slot_results:
+        if error is not None:
+            app.logger.warning("Forecast failed for %s %s: %s", new_ent.get('id'), prop_uri, error)
+            new_ent[prop_uri] = {'type': 'Property', 'values': [], 'error': str(error)}
+            continue
+
+        timestamps = df_fc.index.tolist()
+        forecasts = df_fc['forecast'].tolist()
+        if representation == 'simplified':
+            prop = {'type': 'Property', 'values': list(zip(forecasts, timestamps))}
+        elif representation == 'columnar':
+            prop = {'type': 'Property', 'values': forecasts}
+            grid = {
+                'start': timestamps[0] if timestamps else None,
+                'intervalSeconds': df_fc.attrs.get('interval_seconds'),
+                'count': len(timestamps)
             }
+            if time_index is None:
+                time_index = grid
+            elif grid != time_index:
+                prop['timeIndex'] = grid
+        else:
+            prop = {'type': 'Property', 'values': build_forecast_values(timestamps, forecasts, metadata_list)}
+        prop['forecastInfo'] = forecast_info(df_fc)
+        new_ent[prop_uri] = prop
 
-        output.append(new_ent)
+        # capture timestamps from the first forecasted series
+        if first_fc_timestamps is None:
+            first_fc_timestamps = timestamps
+
+    # after processing all properties, set dateObserved to forecasted timestamps
+    if representation == 'normalized' and first_fc_timestamps:
+        new_ent['dateObserved'] = {
+            'type': 'Property',
+            'values': first_fc_timestamps
+        }
+    elif representation == 'columnar' and time_index is not None:
+        new_ent['timeIndex'] = time_index
+    return new_ent
+
+def retry_later(message, status, retry_after, reason):
+    g.rejected = reason
+    response = json_response({'error': message}, status=status)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def compute_admitted(plan, inflight, timer=None):
+    try:
+        return compute_batch(plan, timer)
+    finally:
+        admission.release(inflight)
+
+# The forecast endpoints are not under the flat rate limit: every request is
+# charged its estimated cost instead (see ADMISSION_KEY_BUDGET and
+# ADMISSION_INFLIGHT_BUDGET), after validation and before any model is trained.
+def admitted_batch(payload):
+    with g.timer.stage('prepare'):
+        plan = prepare_batch(payload)
+    return admitted_plan(plan)
+
+def admitted_plan(plan):
+    inflight = admission.admit(request.headers.get('X-API-KEY'), plan.cost)
+    return compute_admitted(plan, inflight, g.timer)
+
+def stream_format():
+    """
+    ``'json'`` or ``'ndjson'`` if the response should be streamed (``stream`` query
+    parameter, or an NDJSON ``Accept`` header), else ``None``.
+    """
+    fmt = request.args.get('stream')
+    if fmt is None:
+        best = request.accept_mimetypes.best_match(('application/json',) + NDJSON_MIMETYPES)
+        return 'ndjson' if best in NDJSON_MIMETYPES else None
+    fmt = fmt.lower()
+    if fmt in ('0', 'false', 'no'):
+        return None
+    if fmt not in ('json', 'ndjson'):
+        abort(400, "stream must be json or ndjson")
+    return fmt
+
+def streamed_batch(payload, fmt):
+    # entities are written as they complete; series are still coalesced, whole requests are not
+    with g.timer.stage('prepare'):
+        plan = prepare_batch(payload)
+    try:
+        inflight = admission.admit(request.headers.get('X-API-KEY'), plan.cost)
+    except AdmissionRejected as exc:
+        return retry_later(exc.message, exc.status, exc.retry_after, exc.reason)
+    response = stream_response(iter_batch(plan), fmt)
+    response.call_on_close(lambda: admission.release(inflight))
+    return response
+
+def stream_error(exc):
+    """Error object closing a streamed response that failed after its status was sent."""
+    if isinstance(exc, AdmissionRejected):
+        REJECTED_REQUESTS.inc(endpoint=request.endpoint, reason=exc.reason)
+        return {'error': exc.message, 'status': exc.status, 'retryAfter': exc.retry_after}
+    if isinstance(exc, HTTPException):
+        return {'error': exc.description, 'status': exc.code}
+    app.logger.exception("Streamed forecast failed")
+    return {'error': 'Internal server error', 'status': 500}
+
+def pipelined_batch(payload, fmt):
+    # a streamed body is forecast while it is read (see streamed_plan); its series
+    # are still coalesced, the whole request is not as its hash is only known at the end
+    try:
+        with g.timer.stage('prepare'):
+            plan, release = streamed_plan(payload)
+    except AdmissionRejected as exc:
+        return retry_later(exc.message, exc.status, exc.retry_after, exc.reason)
+    if fmt is None:
+        try:
+            output = compute_batch(plan, g.timer)
+        except AdmissionRejected as exc:
+            return retry_later(exc.message, exc.status, exc.retry_after, exc.reason)
+        finally:
+            release()
+        with g.timer.stage('serialize'):
+            return negotiated_response(output)
+
+    # the first entity is forecast before the status is sent, so the entities read
+    # ahead meanwhile still fail with their own status; later failures close the
+    # stream with an error object (see stream_error)
+    entities = iter_batch(plan)
+    try:
+        first = next(entities, None)
+    except AdmissionRejected as exc:
+        release()
+        return retry_later(exc.message, exc.status, exc.retry_after, exc.reason)
+    except BaseException:
+        release()
+        raise
+
+    def body():
+        try:
+            if first is not None:
+                yield first
+                yield from entities
+        except Exception as exc:
+            yield stream_error(exc)
+        finally:
+            entities.close()
+
+    response = stream_response(stream_with_context(body()), fmt)
+    response.call_on_close(release)
+    return response
+
+@app.route('/ngsi-ld/batch_forecast', methods=['POST'])
+@require_api_key
+@limiter.exempt
+def ngsi_ld_batch_forecast():
+    fmt = stream_format()
+    with g.timer.stage('parse'):
+        payload, reader = request_payload()
+    if reader is not None and not query_flag('global_model', GLOBAL_MODEL):
+        return pipelined_batch(payload, fmt)
+    if fmt is not None:
+        return streamed_batch(payload, fmt)
+    # identical batches share one computation; requests served that way are not charged
+    try:
+        if reader is None:
+            key = canonical_fingerprint(payload, sorted(request.args.items(multi=True)))
+            output, _ = request_flights.run(key, admitted_batch, payload)
+        else:
+            # a global model needs every series first: the streamed body is parsed
+            # while the batch is prepared and keyed by its hash
+            with g.timer.stage('prepare'):
+                plan = prepare_batch(payload)
+            key = canonical_fingerprint(reader.hexdigest(), sorted(request.args.items(multi=True)))
+            output, _ = request_flights.run(key, admitted_plan, plan)
+    except AdmissionRejected as exc:
+        return retry_later(exc.message, exc.status, exc.retry_after, exc.reason)
+    with g.timer.stage('serialize'):
+        return negotiated_response(output)
+
+
+def aware(dt):
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+def history_time(body, name, default):
+    value = body.get(name)
+    if value is None:
+        return default
+    try:
+        return aware(datetime.fromisoformat(str(value).replace('Z', '+00:00')))
+    except ValueError:
+        abort(400, f"Invalid ISO timestamp for {name}: {value}")
+
+def pull_request_body():
+    """
+    Entities to pull (``{'id', 'attrs', '@context'}``) and the history window from
+    the body of a pull request. The history ends at ``historyEnd`` (default: the
+    start of the forecast window) and starts at ``historyStart`` (default:
+    ``BROKER_HISTORY_DAYS`` earlier). The window and the number of entities are
+    capped, as every day of every entity costs broker requests before anything is
+    validated.
+    """
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('entities'), list) or not body['entities']:
+        abort(400, "Body must be a JSON object with a non-empty entities array")
+    if len(body['entities']) > MAX_SERIES_PER_BATCH:
+        abort(400, f"Too many entities: max {MAX_SERIES_PER_BATCH} allowed.")
+    specs = []
+    for entity in body['entities']:
+        if not isinstance(entity, dict) or not isinstance(entity.get('id'), str) or not entity['id']:
+            abort(400, "Every entity needs an id")
+        attrs = entity.get('attrs') or []
+        if isinstance(attrs, str):
+            attrs = [attr for attr in attrs.split(',') if attr]
+        if not isinstance(attrs, list) or not all(isinstance(attr, str) and attr for attr in attrs):
+            abort(400, f"attrs of {entity['id']} must be a list of attribute names")
+        specs.append({'id': entity['id'], 'attrs': attrs, '@context': entity.get('@context', [])})
+
+    period_start, _ = parse_window()
+    history_end = history_time(body, 'historyEnd', aware(period_start))
+    history_start = history_time(body, 'historyStart', history_end - timedelta(days=BROKER_HISTORY_DAYS))
+    if history_end <= history_start:
+        abort(400, "historyEnd must be after historyStart")
+    if BROKER_MAX_HISTORY_DAYS > 0 and history_end - history_start > timedelta(days=BROKER_MAX_HISTORY_DAYS):
+        abort(400, f"History window too long: max {BROKER_MAX_HISTORY_DAYS:g} days allowed.")
+    return specs, history_start, history_end
+
+def pulled_payload(specs, history_start, history_end):
+    with g.timer.stage('fetch'):
+        return broker.fetch_entities(specs, history_start, history_end)
+
+def pulled_batch(specs, history_start, history_end):
+    return admitted_batch(pulled_payload(specs, history_start, history_end))
 
-    return jsonify(output)
+@app.route('/ngsi-ld/pull_forecast', methods=['POST'])
+@require_api_key
+@limiter.exempt
+def ngsi_ld_pull_forecast():
+    if broker is None:
+        abort(503, "Pull mode is not configured: set BROKER_URL")
+    fmt = stream_format()
+    with g.timer.stage('parse'):
+        specs, history_start, history_end = pull_request_body()
+    try:
+        if fmt is not None:
+            return streamed_batch(pulled_payload(specs, history_start, history_end), fmt)
+        # identical pulls share one fetch and one computation, like identical batches
+        key = canonical_fingerprint('pull', specs, history_start, history_end, sorted(request.args.items(multi=True)))
+        output, _ = request_flights.run(key, pulled_batch, specs, history_start, history_end)
+    except BrokerError as exc:
+        abort(exc.status, exc.message)
+    except AdmissionRejected as exc:
+        return retry_later(exc.message, exc.status, exc.retry_after, exc.reason)
+    with g.timer.stage('serialize'):
+        return negotiated_response(output)
+
+
+# registry metadata reported for a trained model
+MODEL_INFO_KEYS = ('path', 'trees', 'interval_seconds', 'history_start', 'history_end', 'rows', 'auto_sized', 'trained_at')
+
+def train_plan(plan, inflight):
+    try:
+        with g.timer.stage('train'):
+            results = series_pool.map(train_xgb_model, plan.jobs)
+    finally:
+        admission.release(inflight)
+
+    with g.timer.stage('save'):
+        for (ent_idx, prop_uri, metadata_list), (trained, error) in zip(plan.slots, results):
+            new_ent = plan.output[ent_idx]
+            if error is not None:
+                app.logger.warning("Training failed for %s %s: %s", new_ent.get('id'), prop_uri, error)
+                SERIES_TOTAL.inc(outcome='error')
+                new_ent[prop_uri] = {'type': 'Property', 'value': None, 'error': str(error)}
+                continue
+            booster, meta = trained
+            SERIES_TOTAL.inc(outcome='ok')
+            for stage, seconds in meta.pop('timings').items():
+                SERIES_STAGE_SECONDS.observe(seconds, stage=stage)
+            TREES_TRAINED.inc(meta['trees'])
+            meta = registry.save(new_ent.get('id'), prop_uri, booster, {**meta, 'metadata': metadata_list[-1]})
+            new_ent[prop_uri] = {'type': 'Property', 'value': {k: meta.get(k) for k in MODEL_INFO_KEYS}}
+    return plan.output
+
+@app.route('/ngsi-ld/train', methods=['POST'])
+@require_api_key
+@limiter.exempt
+def train_models():
+    with g.timer.stage('parse'):
+        payload, _ = request_payload()
+    with g.timer.stage('prepare'):
+        plan = prepare_training(payload)
+    try:
+        inflight = admission.admit(request.headers.get('X-API-KEY'), plan.cost)
+    except AdmissionRejected as exc:
+        return retry_later(exc.message, exc.status, exc.retry_after, exc.reason)
+    output = train_plan(plan, inflight)
+    with g.timer.stage('serialize'):
+        return json_response(output)
+
+
+@app.route('/ngsi-ld/predict', methods=['POST'])
+@require_api_key
+@limiter.limit(RATE_LIMIT)
+def predict_models():
+    # only entity ids and property names are read from the body
+    with g.timer.stage('parse'):
+        payload, _ = request_payload()
+    start, end = parse_window()
+    representation = representation_param()
+    forecast_period = [start.isoformat(), end.isoformat()]
+
+    output, slots, results = [], [], []
+    with g.timer.stage('predict'):
+        for entity in checked_entities(payload):
+            new_ent = {
+                'id': entity.get('id'),
+                'type': entity.get('type'),
+                '@context': entity.get('@context', [])
+            }
+            for prop_uri in property_keys(entity):
+                new_ent[prop_uri] = None
+                stored = registry.load(entity.get('id'), prop_uri)
+                metadata_list = [{}]
+                if stored is None:
+                    results.append((None, LookupError(f"No trained model for {entity.get('id')} {prop_uri}")))
+                else:
+                    booster, meta = stored
+                    metadata_list = [meta.get('metadata') or {}]
+                    if (end - start).total_seconds() // meta['interval_seconds'] + 1 > MAX_FORECAST_POINTS:
+                        abort(400, f"Forecast period too long: max {MAX_FORECAST_POINTS} points allowed.")
+                    try:
+                        results.append((predict_xgb_model(booster, meta, forecast_period), None))
+                    except Exception as exc:
+                        results.append((None, exc))
+                slots.append((len(output), prop_uri, metadata_list))
+            output.append(new_ent)
+
+    with g.timer.stage('assemble'):
+        output = assemble_batch(output, slots, results, representation)
+    with g.timer.stage('serialize'):
+        return negotiated_response(output)
+
+
+@app.route('/ngsi-ld/jobs', methods=['POST'])
+@require_api_key
+@limiter.exempt
+def submit_forecast_job():
+    # validate synchronously so bad input is still rejected with 400 right away
+    with g.timer.stage('parse'):
+        payload, _ = request_payload()
+    with g.timer.stage('prepare'):
+        plan = prepare_batch(payload)
+    try:
+        # jobs stay off the in-flight budget so queued batches never block interactive
+        # requests; JOB_WORKERS bounds how many run at once
+        admission.admit(request.headers.get('X-API-KEY'), plan.cost, inflight=False)
+    except AdmissionRejected as exc:
+        return retry_later(exc.message, exc.status, exc.retry_after, exc.reason)
+    try:
+        job = job_queue.submit(compute_batch, plan, owner=request.headers.get('X-API-KEY'))
+    except QueueFull:
+        return retry_later('Forecast job queue is full, retry later.', 503, JOB_RETRY_AFTER_SECONDS, 'job_queue')
+    response = json_response(job.describe(), status=202)
+    response.headers['Location'] = f"/ngsi-ld/jobs/{job.id}"
+    return response
+
+
+def owned_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None or job.owner != request.headers.get('X-API-KEY'):
+        abort(404, f"Unknown or expired job: {job_id}")
+    return job
+
+
+@app.route('/ngsi-ld/jobs/<job_id>', methods=['GET'])
+@require_api_key
+def forecast_job_status(job_id):
+    return json_response(owned_job(job_id).describe())
+
+
+@app.route('/ngsi-ld/jobs/<job_id>/result', methods=['GET'])
+@require_api_key
+def forecast_job_result(job_id):
+    job = owned_job(job_id)
+    if job.status == JOB_SUCCEEDED:
+        return negotiated_response(job.result)
+    if job.status == JOB_FAILED:
+        status = job.error_status or 500
+        return json_response({'error': job.error}, status=status)
+    response = json_response(job.describe(), status=202)
+    response.headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+    return response
+
+
+@app.route('/ngsi-ld/model_cache', methods=['GET'])
+@require_api_key
+def model_cache_stats():
+    stats = model_cache.stats()
+    stats['feature_cache'] = feature_cache.stats()
+    stats['registry'] = registry.stats()
+    stats['thread_budget'] = thread_budget.stats()
+    if broker is not None:
+        stats['broker'] = broker.stats()
+    stats['coalescing'] = {'requests': request_flights.stats(), 'series': series_flights.stats()}
+    return jsonify(stats)
+
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def warmup():
+    """
+    Forecast a synthetic week of hourly readings and serialize the result, so the
+    first fit of a process (XGBoost and OpenMP initialisation, first allocations,
+    feature blocks) is paid before it serves traffic. Returns the seconds taken.
+    """
+    started = time.perf_counter()
+    end = datetime(2025, 1, 8, tzinfo=timezone.utc)
+    data = [{
+        'timestamp': (end - timedelta(hours=WARMUP_POINTS - i)).isoformat(),
+        'value': 20.0 + 5.0 * math.sin(2 * math.pi * i / 24)
+    } for i in range(WARMUP_POINTS)]
+    df_fc = forecast_xgb_timeseries(
+        data, [end.isoformat(), (end + timedelta(days=1)).isoformat()], 3600,
+        model_size_modulator=FIDELITY_MIN, fast_path=False
+    )
+    json_bytes(df_fc['forecast'].tolist())
+    return time.perf_counter() - started
 
 
 if __name__ == '__main__':
+    if WARMUP:
+        app.logger.info("Warmup forecast took %.2fs", warmup())
     app.run(host='0.0.0.0', port=int(os.getenv('PORT', 9013)))
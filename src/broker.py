@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ngsild import parse_iso
+
+TEMPORAL_PATH = '/ngsi-ld/v1/temporal/entities/'
+
+# sub-properties of a temporal instance that are not copied into the point metadata
+INSTANCE_KEYS = ('type', 'value', 'observedAt', 'instanceId')
+
+# consecutive truncated pages of one slice before giving up
+MAX_PAGES_PER_SLICE = 1000
+
+
+class BrokerError(Exception):
+    """Raised when the broker cannot provide the history; carries the HTTP status for the client."""
+
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class BrokerClient:
+    """
+    Reads the temporal history of entities from the NGSI-LD temporal API of a
+    Context Broker.
+
+    All requests to the broker share one keep-alive ``requests`` session whose
+    connection pool holds ``max_connections`` connections, and at most that many
+    requests run at once, however many forecast requests are pulling. The history
+    window of every entity is split into slices of ``slice_seconds`` that are
+    fetched concurrently. A slice the broker truncates (``206 Partial Content``) is
+    continued from the earliest last instance of its attributes, and instances
+    returned twice are merged. With ``max_points``, paging stops with a 400
+    ``BrokerError`` once a slice holds more instances of one attribute, so a dense
+    history cannot turn into an unbounded number of broker requests.
+    """
+
+    def __init__(self, base_url, max_connections=8, slice_seconds=86400, timeout=30, headers=None,
+                 max_points=0):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max(1, int(max_connections))
+        self.slice_seconds = int(slice_seconds)
+        self.timeout = float(timeout)
+        self.max_points = int(max_points)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept': 'application/json', **(headers or {})})
+        self._executor = None
+        self._lock = Lock()
+        self.requests = 0
+        self.partial = 0
+
+    def _get_executor(self):
+        # created lazily so importing the app never spawns threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix='broker')
+            return self._executor
+
+    def fetch_entities(self, specs, start, end):
+        """
+        History between the aware datetimes ``start`` and ``end`` of the entities
+        ``specs`` (``{'id', 'attrs'}``; all attributes if ``attrs`` is empty), as
+        NGSI-LD entities in the batch input format, in the order of ``specs``.
+        """
+        slices = self.slices(start, end)
+        executor = self._get_executor()
+        futures = [
+            [executor.submit(self._fetch_slice, spec['id'], spec.get('attrs'), t0, t1) for t0, t1 in slices]
+            for spec in specs
+        ]
+        try:
+            return [self._merge(spec, [fut.result() for fut in entity_futures])
+                    for spec, entity_futures in zip(specs, futures)]
+        finally:
+            for entity_futures in futures:
+                for fut in entity_futures:
+                    fut.cancel()
+
+    def slices(self, start, end):
+        """Consecutive ``[t0, t1)`` windows covering ``start`` to ``end``."""
+        if self.slice_seconds <= 0:
+            return [(start, end)]
+        step = timedelta(seconds=self.slice_seconds)
+        bounds = []
+        t0 = start
+        while t0 < end:
+            bounds.append((t0, min(t0 + step, end)))
+            t0 += step
+        return bounds or [(start, end)]
+
+    def _fetch_slice(self, entity_id, attrs, t0, t1):
+        """``(entity, {attr: {observedAt: instance}})`` of one time slice."""
+        url = self.base_url + TEMPORAL_PATH + quote(entity_id, safe='')
+        params = {'timerel': 'between', 'endTimeAt': _iso(t1)}
+        if attrs:
+            params['attrs'] = ','.join(attrs)
+        instances = {}
+        entity = None
+        time_at = t0
+        for _ in range(MAX_PAGES_PER_SLICE):
+            entity, partial = self._get(url, {**params, 'timeAt': _iso(time_at)}, entity_id)
+            page = {key: _instances(value) for key, value in entity.items() if key not in ('id', 'type', '@context')}
+            for key, items in page.items():
+                merged = instances.setdefault(key, {})
+                for item in items:
+                    merged[item['observedAt']] = item
+                if self.max_points and len(merged) > self.max_points:
+                    raise BrokerError(f"History of {key} of {entity_id} has more than {self.max_points} readings",
+                                      status=400)
+            if not partial:
+                return entity, instances
+            # continue after the attribute that got the least far
+            last = min((max(parse_iso(item['observedAt']) for item in items)
+                        for items in page.values() if items), default=None)
+            if last is None or last <= time_at:
+                raise BrokerError(f"Broker returned a truncated page without progress for {entity_id}")
+            time_at = last
+        raise BrokerError(f"Too many pages for {entity_id}")
+
+    def _get(self, url, params, entity_id):
+        # the entity of one temporal query and whether the broker truncated it
+        with self._lock:
+            self.requests += 1
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+        except requests.RequestException as exc:
+            raise BrokerError(f"Broker request failed for {entity_id}: {exc}") from None
+        if response.status_code == 404:
+            raise BrokerError(f"Entity {entity_id} not found in the broker", status=404)
+        if response.status_code not in (200, 206):
+            raise BrokerError(f"Broker answered {response.status_code} for {entity_id}")
+        try:
+            entity = response.json()
+        except ValueError:
+            raise BrokerError(f"Broker returned invalid JSON for {entity_id}") from None
+        if not isinstance(entity, dict):
+            raise BrokerError(f"Broker returned an invalid entity for {entity_id}")
+        partial = response.status_code == 206
+        if partial:
+            with self._lock:
+                self.partial += 1
+        return entity, partial
+
+    @staticmethod
+    def _merge(spec, parts):
+        # one entity in the batch input format from the slices of its history
+        first = parts[0][0]
+        entity = {
+            'id': first.get('id', spec['id']),
+            'type': first.get('type'),
+            '@context': spec.get('@context') or first.get('@context', [])
+        }
+        attrs = spec.get('attrs') or [key for _, instances in parts for key in instances]
+        for attr in dict.fromkeys(attrs):
+            merged = {}
+            for _, instances in parts:
+                merged.update(instances.get(attr, {}))
+            points = sorted(merged.values(), key=lambda item: parse_iso(item['observedAt']))
+            if not points:
+                continue
+            entity[attr] = {'type': 'Property', 'values': [{
+                'type': 'Property',
+                'values': [{
+                    'metadata': {k: v for k, v in item.items() if k not in INSTANCE_KEYS},
+                    'value': item.get('value'),
+                    'observedAt': item['observedAt']
+                }]
+            } for item in points]}
+        return entity
+
+    def stats(self):
+        return {
+            'url': self.base_url,
+            'max_connections': self.max_connections,
+            'slice_seconds': self.slice_seconds,
+            'requests': self.requests,
+            'partial': self.partial,
+        }
+
+
+def _instances(value):
+    # temporal instances of one attribute (a single instance may come unwrapped)
+    items = value if isinstance(value, list) else [value]
+    return [item for item in items if isinstance(item, dict) and item.get('observedAt')]
+
+
+def _iso(dt):
+    return dt.isoformat().replace('+00:00', 'Z')
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the standard library encoder
+    orjson = None
+
+
+def canonical_fingerprint(*parts):
+    """
+    SHA-256 of JSON-like ``parts`` with sorted keys, so payloads that only differ
+    in key order or whitespace hash the same.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if orjson is not None:
+            h.update(orjson.dumps(part, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY, default=str))
+        else:
+            h.update(json.dumps(part, sort_keys=True, separators=(',', ':'), default=str).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def job_fingerprint(job):
+    """Hash of a forecast job (keyword arguments of ``forecast_xgb_timeseries``)."""
+    h = hashlib.sha256()
+    data = job['data']
+    h.update(np.ascontiguousarray(data['timestamp'].asi8).tobytes())
+    h.update(np.ascontiguousarray(data['value'], dtype=np.float64).tobytes())
+    options = {k: v for k, v in job.items() if k != 'data'}
+    h.update(canonical_fingerprint(options).encode())
+    return h.hexdigest()
+
+
+class Flight:
+    """One computation in progress; waiters block on ``done``."""
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Thread-safe single-flight group with a short-lived result cache.
+
+    The first caller of a key becomes its leader and computes the result; callers
+    arriving while it runs wait for it and share the result. Successful results
+    stay in a bounded LRU cache for ``ttl_seconds`` and serve repeats arriving
+    right after. ``ttl_seconds=0`` keeps only the in-flight sharing.
+    """
+
+    def __init__(self, ttl_seconds=10, max_entries=32):
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self._flights = {}
+        self._results = OrderedDict()
+        self._lock = Lock()
+        self.joined = 0
+        self.cached = 0
+
+    def claim(self, key):
+        """
+        ``(flight, leader)`` for ``key``. A leader must ``publish`` the flight; other
+        callers wait on ``flight.done`` (already set for cached results).
+        """
+        with self._lock:
+            item = self._results.get(key)
+            if item is not None:
+                stored_at, result = item
+                if time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._results.move_to_end(key)
+                    self.cached += 1
+                    flight = Flight()
+                    flight.result = result
+                    flight.done.set()
+                    return flight, False
+                del self._results[key]
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.joined += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def publish(self, key, flight, result=None, error=None):
+        flight.result, flight.error = result, error
+        with self._lock:
+            self._flights.pop(key, None)
+            if error is None and self.ttl_seconds > 0 and self.max_entries > 0:
+                self._results[key] = (time.monotonic(), result)
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        flight.done.set()
+
+    def run(self, key, fn, *args):
+        """
+        ``fn(*args)`` computed once for all concurrent callers of ``key``. Returns the
+        result and whether it came from another caller. Failures are not shared: if
+        the leader raises, every waiter runs ``fn`` itself.
+        """
+        while True:
+            flight, leader = self.claim(key)
+            if leader:
+                try:
+                    result = fn(*args)
+                except BaseException as exc:
+                    self.publish(key, flight, error=exc)
+                    raise
+                self.publish(key, flight, result)
+                return result, False
+            flight.done.wait()
+            if flight.error is None:
+                return flight.result, True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'results': len(self._results),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'joined': self.joined,
+                'cached': self.cached,
+            }
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+SEC_DAY = 86400
+SEC_WEEK = SEC_DAY * 7
+SEC_YEAR = SEC_DAY * 365.25
+
+
+def fourier_tiers(span):
+    """Seasonal (period, order) terms used for a training history covering ``span``."""
+    tiers = [(SEC_DAY, 2)]
+    if span >= pd.Timedelta(days=7):
+        tiers.append((SEC_WEEK, 2))
+    if span >= pd.Timedelta(days=365):
+        tiers.append((SEC_YEAR, 3))
+    return tuple(tiers)
+
+
+def feature_names(tiers):
+    names = ['t']
+    for period, order in tiers:
+        for k in range(1, order + 1):
+            names += [f"sin_{period}_{k}", f"cos_{period}_{k}"]
+    return names
+
+
+def time_features(epoch_ns, tiers):
+    """
+    Float32 matrix with the time index ``t`` (epoch seconds) followed by a sin/cos
+    pair per Fourier term, in ``feature_names`` order. Terms are computed in float64
+    and rounded once, which is what XGBoost would do to a float64 input.
+    """
+    t = np.asarray(epoch_ns, dtype=np.int64) / 1e9
+    block = np.empty((len(t), len(feature_names(tiers))), dtype=np.float32)
+    block[:, 0] = t
+    col = 1
+    for period, order in tiers:
+        for k in range(1, order + 1):
+            angle = 2 * np.pi * k * t / period
+            block[:, col] = np.sin(angle)
+            block[:, col + 1] = np.cos(angle)
+            col += 2
+    return block
+
+
+class FeatureCache:
+    """
+    Bounded LRU cache of read-only feature blocks for regular time grids.
+
+    A grid is identified by (start, interval, length, tiers), so all series that
+    share a resampled timeline or a forecast window reuse the same block.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = int(max_bytes)
+        self._blocks = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def block(self, start_ns, interval_ns, length, tiers):
+        key = (int(start_ns), int(interval_ns), int(length), tuple(tiers))
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return block
+            self.misses += 1
+
+        epoch_ns = key[0] + np.arange(key[2], dtype=np.int64) * key[1]
+        block = time_features(epoch_ns, tiers)
+        block.flags.writeable = False
+        if block.nbytes > self.max_bytes:
+            return block
+
+        with self._lock:
+            if key not in self._blocks:
+                self._blocks[key] = block
+                self._bytes += block.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return block
+
+    def stats(self):
+        with self._lock:
+            return {
+                'blocks': len(self._blocks),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# shared by every forecast of the process; the app resizes it from FEATURE_CACHE_MB
+feature_cache = FeatureCache()
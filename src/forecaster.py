@@ -1,7 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, timezone
+
 import pandas as pd
 import numpy as np
 from dateutil import tz
 from xgboost import XGBRegressor
+from xgboost.callback import EarlyStopping
+from model_cache import series_fingerprint, lineage_fingerprint
+from features import SEC_DAY, feature_cache, fourier_tiers, time_features
+from metrics import StageTimer
+from resample import interpolate_gaps, resample_mean
+from thread_budget import PREDICT_ROWS_PER_THREAD, thread_budget
 
 # 1) NumPy-level (affects underlying repr of arrays):
 np.set_printoptions(suppress=True)
@@ -9,50 +18,121 @@ np.set_printoptions(suppress=True)
 # 2) pandas-level (affects DataFrame pretty-printing):
 pd.options.display.float_format = '{:.6f}'.format
 
-def forecast_xgb_timeseries(
-    data,
-    forecast_period,
-    interval_seconds,
-    use_gap_detection=False,
-    training_period=None,
-    predictor_options=None,
-    model_size_modulator=3.0,
-):
+# a warm-started lineage is retrained from scratch once it holds this many
+# times the trees of a full fit
+MAX_WARM_START_GROWTH = 2
+
+# auto-sizing: share of the most recent rows held out for early stopping, rounds
+# without validation improvement before stopping, smallest improvement that
+# counts (relative to the spread of the series) and the smallest history it is
+# attempted on
+AUTO_SIZE_HOLDOUT = 0.2
+AUTO_SIZE_PATIENCE = 10
+AUTO_SIZE_MIN_GAIN = 1e-3
+AUTO_SIZE_MIN_ROWS = 20
+
+# trivial-series fast path: a series is answered in closed form when its spread
+# is within round-off of its level (at most this share of its magnitude, or of 1
+# below it; a small share of the level would flatten offset signals such as air
+# pressure or Kelvin temperatures), when it has fewer resampled rows than this,
+# when fewer than this share of its rows hold a reading (the rest being
+# interpolated), or when its readings take at most this many distinct values
+TRIVIAL_MAX_SPREAD = 1e-9
+TRIVIAL_MIN_ROWS = 12
+TRIVIAL_MIN_COVERAGE = 0.1
+TRIVIAL_MAX_DISTINCT = 3
+
+# training-set reduction: each older tier of a capped history is aggregated
+# this many times coarser than the next newer one, and is never given fewer
+# rows than the minimum (the oldest tier takes whatever factor fits)
+REDUCE_TIER_FACTOR = 4
+REDUCE_MIN_TIER_ROWS = 64
+
+
+def isoformat_index(index):
     """
-    Forecast a time series using XGBoost with optional gap trimming and custom training period.
+    ``[ts.isoformat() for ts in index]`` for a tz-aware DatetimeIndex, computed on
+    the int64 representation instead of one Timestamp object per row.
+    """
+    local = index.tz_localize(None)
+    local_ns = local.asi8
+    if (local_ns % 1000).any():
+        unit = 'ns'
+    elif (local_ns % 1_000_000_000).any():
+        unit = 'us'
+    else:
+        unit = 's'
+    body = np.datetime_as_string(local.values, unit=unit)
 
-    Automatically handles any datetime string or datetime object (with or without tz),
-    uses UTC internally, and returns forecasts in the same tz as input.
+    offsets = (local_ns - index.asi8) // 1_000_000_000
+    uniq, inverse = np.unique(offsets, return_inverse=True)
+    if len(uniq) == 1:
+        suffix = _format_utc_offset(int(uniq[0]))
+        return [ts + suffix for ts in body.tolist()]
+    suffixes = np.array([_format_utc_offset(int(o)) for o in uniq])
+    return np.char.add(body, suffixes[inverse]).tolist()
+
+
+def _format_utc_offset(seconds):
+    sign = '+' if seconds >= 0 else '-'
+    hours, rest = divmod(abs(seconds), 3600)
+    minutes, secs = divmod(rest, 60)
+    text = f"{sign}{hours:02d}:{minutes:02d}"
+    return f"{text}:{secs:02d}" if secs else text
+
+
+def build_time_features(index, tiers):
+    """Float32 time index + Fourier terms for a UTC DatetimeIndex (read-only when cached)."""
+    if index.freq is not None and len(index) > 1:
+        return feature_cache.block(index.asi8[0], index.freq.nanos, len(index), tiers)
+    return time_features(index.asi8, tiers)
+
+
+def model_options(model_size_modulator=3.0, predictor_options=None):
+    trees = max(1, int(model_size_modulator * 100))
+    opts = {
+        'objective': 'reg:squarederror',
+        'n_estimators': trees,
+        'max_depth': int(6 + model_size_modulator**0.25),
+        'learning_rate': 50 / trees,
+        'subsample': 1.0,
+        'colsample_bytree': 1.0
+    }
+    if isinstance(predictor_options, dict):
+        opts.update(predictor_options)
+    return opts
+
+
+def to_utc(ts_series, input_tz):
+    """Localize naive timestamps to ``input_tz`` (or convert aware ones) to UTC."""
+    if ts_series.dt.tz is None:
+        return (
+            ts_series
+            .dt.tz_localize(input_tz, ambiguous=True, nonexistent='shift_forward')
+            .dt.tz_convert(tz.UTC)
+        )
+    else:
+        return ts_series.dt.tz_convert(tz.UTC)
+
+
+def prepare_series(data, interval_seconds, use_gap_detection=False, training_period=None):
     """
-    # Load into DataFrame and parse timestamps
-    df = pd.DataFrame(data)
-    df['timestamp'] = pd.to_datetime(df['timestamp'], utc=False)
-
-    # Detect input timezone using first timestamp (default UTC if none)
-    first_ts = df['timestamp'].iloc[0]
-    input_tz = first_ts.tzinfo or tz.UTC
-
-    # Helper to localize or convert to UTC
-    def to_utc(ts_series):
-        if ts_series.dt.tz is None:
-            return (
-                ts_series
-                .dt.tz_localize(input_tz, ambiguous=True, nonexistent='shift_forward')
-                .dt.tz_convert(tz.UTC)
-            )
-        else:
-            return ts_series.dt.tz_convert(tz.UTC)
+    Parse, trim and resample ``data`` onto a uniform UTC grid.
 
-    # Convert all timestamps to UTC
-    df['timestamp'] = to_utc(df['timestamp'])
-    df = df.sort_values('timestamp').reset_index(drop=True)
+    Returns the resampled frame (single ``value`` column) and the input timezone.
+    """
+    # Load into DataFrame, parse timestamps and convert them to UTC
+    df = pd.DataFrame(data)
+    df['timestamp'], input_tz = parse_timestamps(df['timestamp'])
+    if not df['timestamp'].is_monotonic_increasing:
+        df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
 
     # Apply training-period slicing or gap detection
     if training_period is not None:
         t0 = pd.to_datetime(training_period[0], utc=False)
         t1 = pd.to_datetime(training_period[1], utc=False)
-        t0_utc = to_utc(pd.Series(t0)).iloc[0]
-        t1_utc = to_utc(pd.Series(t1)).iloc[0]
+        t0_utc = to_utc(pd.Series(t0), input_tz).iloc[0]
+        t1_utc = to_utc(pd.Series(t1), input_tz).iloc[0]
         df = df[(df['timestamp'] >= t0_utc) & (df['timestamp'] <= t1_utc)].reset_index(drop=True)
     elif use_gap_detection:
         diffs = df['timestamp'].diff().dropna()
@@ -62,71 +142,697 @@ def forecast_xgb_timeseries(
             last_gap = gaps[gaps].index.max()
             df = df.loc[last_gap+1:].reset_index(drop=True)
 
-    # Resample & interpolate to uniform interval
-    freq_str = f"{int(interval_seconds)}S"
-    df = df.set_index('timestamp').resample(freq_str).mean()
-    df['value'] = df['value'].interpolate()
+    # Resample & interpolate to uniform interval (see resample_mean)
+    index, values, observed = _resample(df['timestamp'], df['value'].values, interval_seconds)
+    df = pd.DataFrame({'value': values}, index=index)
+    # rows holding at least one reading, as opposed to interpolated ones
+    df.attrs['observed'] = observed
+    return df, input_tz
 
-    # Feature engineering: time index + Fourier terms
-    df_feat = df.copy()
-    df_feat['t'] = df_feat.index.view(np.int64) / 1e9
-    span = df_feat.index.max() - df_feat.index.min()
-
-    def add_fourier(dframe, period, order):
-        for k in range(1, order + 1):
-            dframe[f"sin_{period}_{k}"] = np.sin(2 * np.pi * k * dframe['t'] / period)
-            dframe[f"cos_{period}_{k}"] = np.cos(2 * np.pi * k * dframe['t'] / period)
-
-    sec_day = 86400
-    add_fourier(df_feat, sec_day, 2)
-    sec_week = sec_day * 7
-    if span >= pd.Timedelta(days=7):
-        add_fourier(df_feat, sec_week, 2)
-    sec_year = sec_day * 365.25
-    if span >= pd.Timedelta(days=365):
-        add_fourier(df_feat, sec_year, 3)
-
-    # Train XGB model
-    trees = max(1, int(model_size_modulator * 100))
-    opts = {
-        'objective': 'reg:squarederror',
-        'n_estimators': trees,
-        'max_depth': int(6 + model_size_modulator**0.25),
-        'learning_rate': 50 / trees,
-        'subsample': 1.0,
-        'colsample_bytree': 1.0
-    }
-    if isinstance(predictor_options, dict):
-        opts.update(predictor_options)
-    model = XGBRegressor(**opts)
-    model.fit(df_feat.drop(columns=['value']), df_feat['value'])
 
-    # Build future UTC index for forecasting
+def prepare_entity(data, interval_seconds):
+    """
+    ``prepare_series`` for several properties read at the same timestamps, e.g. the
+    measurements of one station: ``data`` maps ``'timestamp'`` to the timestamps
+    and ``'value'`` to a 2-D array with one column per property. The timestamps are
+    parsed, sorted and binned once. Returns one resampled frame per column, all on
+    the same grid, and the input timezone.
+    """
+    timestamps, input_tz = parse_timestamps(pd.Series(data['timestamp']))
+    values = np.asarray(data['value'], dtype=np.float64)
+    if not timestamps.is_monotonic_increasing:
+        order = np.argsort(timestamps.values, kind='stable')
+        timestamps, values = timestamps.iloc[order], values[order]
+
+    index, values, observed = _resample(timestamps, values, interval_seconds)
+    frames = []
+    for j in range(values.shape[1]):
+        df = pd.DataFrame({'value': values[:, j]}, index=index)
+        df.attrs['observed'] = observed[:, j]
+        frames.append(df)
+    return frames, input_tz
+
+
+def parse_timestamps(timestamps):
+    """
+    UTC timestamps of the Series ``timestamps`` and the input timezone, taken from
+    the first one (UTC if it is naive).
+    """
+    # timestamps already parsed (e.g. a DatetimeIndex from ngsild) are used as they are
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps, utc=False)
+    input_tz = timestamps.iloc[0].tzinfo or tz.UTC
+    return to_utc(timestamps, input_tz), input_tz
+
+
+def _resample(timestamps, values, interval_seconds):
+    # grid, interpolated values and observed mask of sorted UTC timestamps
+    start_ns, values = resample_mean(
+        timestamps.to_numpy(dtype='datetime64[ns]').view(np.int64), values, int(interval_seconds) * 10**9
+    )
+    observed = ~np.isnan(values)
+    index = pd.date_range(
+        start=pd.Timestamp(start_ns, tz=tz.UTC), periods=len(values), freq=f"{int(interval_seconds)}S", name='timestamp'
+    )
+    return index, interpolate_gaps(values), observed
+
+
+def forecast_index(forecast_period, interval_seconds, input_tz):
+    """Future UTC grid covering ``forecast_period`` (naive bounds are in ``input_tz``)."""
     start, end = forecast_period
     start_ts = pd.to_datetime(start, utc=False)
     end_ts = pd.to_datetime(end, utc=False)
-    start_utc = to_utc(pd.Series(start_ts)).iloc[0]
-    end_utc = to_utc(pd.Series(end_ts)).iloc[0]
-    idx_utc = pd.date_range(start=start_utc, end=end_utc, freq=freq_str, tz=tz.UTC)
-
-    # Prepare features for forecast
-    df_pred = pd.DataFrame(index=idx_utc)
-    df_pred['t'] = df_pred.index.view(np.int64) / 1e9
-    add_fourier(df_pred, sec_day, 2)
-    if span >= pd.Timedelta(days=7):
-        add_fourier(df_pred, sec_week, 2)
-    if span >= pd.Timedelta(days=365):
-        add_fourier(df_pred, sec_year, 3)
-
-    df_pred['forecast'] = model.predict(df_pred)
-
-    # Convert forecasts back to original timezone and format
-    df_pred = df_pred.tz_convert(input_tz)
+    start_utc = to_utc(pd.Series(start_ts), input_tz).iloc[0]
+    end_utc = to_utc(pd.Series(end_ts), input_tz).iloc[0]
+    return pd.date_range(start=start_utc, end=end_utc, freq=f"{int(interval_seconds)}S", tz=tz.UTC)
+
+
+def format_forecast(predictions, idx_utc, input_tz):
+    """Forecast frame indexed by isoformat timestamps in the input timezone."""
     out = pd.DataFrame({
-        'forecast': df_pred['forecast'].values
-    }, index=[ts.isoformat() for ts in df_pred.index])
+        'forecast': predictions
+    }, index=isoformat_index(idx_utc.tz_convert(input_tz)))
 
     # Filter small values: set any forecast < 1e-5 to zero
     out['forecast'] = out['forecast'].mask(out['forecast'] < 1e-5, 0.0)
+    if idx_utc.freq is not None:
+        out.attrs['interval_seconds'] = idx_utc.freq.nanos // 10**9
+    return out
+
+
+def forecast_xgb_timeseries(
+    data,
+    forecast_period,
+    interval_seconds,
+    use_gap_detection=False,
+    training_period=None,
+    predictor_options=None,
+    model_size_modulator=3.0,
+    model_cache=None,
+    series_key=None,
+    incremental=False,
+    auto_size=False,
+    fast_path=True,
+    max_train_rows=None,
+):
+    """
+    Forecast a time series using XGBoost with optional gap trimming and custom training period.
+
+    Automatically handles any datetime string or datetime object (with or without tz),
+    uses UTC internally, and returns forecasts in the same tz as input.
+
+    ``data`` is either a list of ``{'timestamp', 'value'}`` records or a mapping of
+    ``'timestamp'`` and ``'value'`` columns (e.g. a DatetimeIndex and a float array).
+
+    If ``model_cache`` is given, trained models are looked up by a fingerprint of
+    ``series_key`` (entity id, property URI), the resampled training data, the
+    interval and the model options; on a hit the fit is skipped.
+
+    With ``incremental=True`` a cached model whose training data is a prefix of the
+    current data is continued (XGBoost ``xgb_model``) on the appended rows only, with
+    a number of extra trees proportional to the share of new rows. Any other change
+    falls back to a full retrain.
+
+    With ``auto_size=True`` the number of trees is chosen by early stopping on the
+    most recent part of the history (``hist`` tree method), with
+    ``model_size_modulator*100`` trees as the upper bound; the model is then refit on
+    the full history with that many trees.
+
+    With ``fast_path=True`` constant, near-constant, very short or sparse series
+    (see ``classify_series``) get a closed-form forecast and no model is trained.
+    The method used is reported as ``attrs['path']`` of the returned frame.
+
+    With ``max_train_rows`` longer histories are reduced before fitting (see
+    ``reduce_training_rows``): recent rows stay at full resolution and older ones
+    are averaged into progressively coarser rows. Fourier tiers still follow the
+    span of the full history.
+    """
+    timer = StageTimer()
+    with timer.stage('resample'):
+        df, input_tz = prepare_series(data, interval_seconds, use_gap_detection, training_period)
+
+    if fast_path:
+        with timer.stage('classify'):
+            method = classify_series(df)
+        if method is not None:
+            with timer.stage('predict'):
+                idx_utc = forecast_index(forecast_period, interval_seconds, input_tz)
+                predictions = closed_form_forecast(df, idx_utc, method)
+            with timer.stage('format'):
+                out = format_forecast(predictions, idx_utc, input_tz)
+            _annotate(out, timer, len(df), 0, 0, path=method)
+            return out
+
+    # Feature engineering: time index + Fourier terms
+    span = df.index.max() - df.index.min()
+    tiers = fourier_tiers(span)
+    opts = model_options(model_size_modulator, predictor_options)
+    auto_size = auto_size and len(df) >= AUTO_SIZE_MIN_ROWS
+    cache_opts = {**opts, 'auto_size': True} if auto_size else opts
+
+    # Train XGB model, unless an identical one is cached
+    cache_key = None
+    model = None
+    trees_trained = 0
+    train_rows = 0
+    if model_cache is not None:
+        cache_key = series_fingerprint(series_key, df.index, df['value'].values, interval_seconds, cache_opts)
+        model = model_cache.get(cache_key)
+    if model is None:
+        lineage_key = None
+        previous = None
+        if model_cache is not None and incremental:
+            lineage_key = lineage_fingerprint(series_key, interval_seconds, cache_opts)
+            previous = model_cache.latest(lineage_key)
+
+        warm_rows = _warm_start_rows(previous, df, tiers, opts)
+        if warm_rows is not None:
+            # continue boosting on the rows appended since the stored fit
+            df_new = df.iloc[warm_rows:]
+            train_rows = len(df_new)
+            trees_trained = max(1, int(np.ceil(opts['n_estimators'] * len(df_new) / len(df))))
+            with timer.stage('features'):
+                train_x = build_time_features(df_new.index, tiers)
+            with timer.stage('fit'):
+                model = _fit_model({**opts, 'n_estimators': trees_trained}, train_x, df_new['value'].values,
+                                   xgb_model=previous['model'].get_booster())
+            total_trees = previous['trees'] + trees_trained
+        else:
+            model, trees_trained, train_rows = _fit_full(df, tiers, opts, auto_size, max_train_rows, timer)
+            total_trees = model.get_booster().num_boosted_rounds()
+
+        if cache_key is not None:
+            model_cache.put(cache_key, model)
+        if lineage_key is not None:
+            model_cache.put_latest(lineage_key, {
+                'model': model,
+                'start': df.index[0].value,
+                'values': df['value'].values.copy(),
+                'tiers': tiers,
+                'trees': total_trees,
+            }, warm_start=warm_rows is not None)
 
+    # Predict on the future UTC grid
+    with timer.stage('predict'):
+        idx_utc = forecast_index(forecast_period, interval_seconds, input_tz)
+        pred_x = build_time_features(idx_utc, tiers)
+        predictions = _predict(model.predict, pred_x)
+    with timer.stage('format'):
+        out = format_forecast(predictions, idx_utc, input_tz)
+    _annotate(out, timer, train_rows, trees_trained, model.get_booster().num_boosted_rounds(), auto_size)
     return out
+
+
+def train_xgb_model(
+    data,
+    interval_seconds,
+    predictor_options=None,
+    model_size_modulator=3.0,
+    auto_size=False,
+    fast_path=True,
+    max_train_rows=None,
+):
+    """
+    Fit a model on ``data`` for later ``predict_xgb_model`` calls, e.g. to keep it in
+    a model registry.
+
+    Returns the booster and a JSON-serialisable description of everything needed to
+    predict with it (interval, Fourier tiers, input UTC offset). Constant and
+    near-constant series (``'last_value'``/``'mean'`` of ``classify_series``) are
+    described by their level only and come back without a booster.
+    """
+    timer = StageTimer()
+    with timer.stage('resample'):
+        df, input_tz = prepare_series(data, interval_seconds)
+    meta = {
+        'interval_seconds': int(interval_seconds),
+        'utc_offset_seconds': int(pd.Timestamp(df.index[-1]).tz_convert(input_tz).utcoffset().total_seconds()),
+        'history_start': df.index[0].isoformat(),
+        'history_end': df.index[-1].isoformat(),
+        'rows': len(df),
+    }
+
+    method = classify_series(df) if fast_path else None
+    if method in ('last_value', 'mean'):
+        level = closed_form_forecast(df, df.index[-1:], method)[0]
+        meta.update(path=method, level=float(level), trees=0, auto_sized=False, timings=timer.durations)
+        return None, meta
+
+    tiers = fourier_tiers(df.index.max() - df.index.min())
+    opts = model_options(model_size_modulator, predictor_options)
+    auto_size = auto_size and len(df) >= AUTO_SIZE_MIN_ROWS
+    model, _, train_rows = _fit_full(df, tiers, opts, auto_size, max_train_rows, timer)
+    booster = model.get_booster()
+    meta.update(
+        path='xgboost',
+        tiers=[list(tier) for tier in tiers],
+        trees=booster.num_boosted_rounds(),
+        train_rows=train_rows,
+        auto_sized=auto_size,
+        timings=timer.durations,
+    )
+    return booster, meta
+
+
+def predict_xgb_model(booster, meta, forecast_period):
+    """
+    Forecast ``forecast_period`` with a model from ``train_xgb_model``, in the same
+    format as ``forecast_xgb_timeseries``.
+    """
+    timer = StageTimer()
+    input_tz = timezone(timedelta(seconds=meta['utc_offset_seconds']))
+    with timer.stage('predict'):
+        idx_utc = forecast_index(forecast_period, meta['interval_seconds'], input_tz)
+        if booster is None:
+            predictions = np.full(len(idx_utc), meta['level'])
+        else:
+            tiers = tuple(tuple(tier) for tier in meta['tiers'])
+            predictions = _predict(booster.inplace_predict, build_time_features(idx_utc, tiers))
+    with timer.stage('format'):
+        out = format_forecast(predictions, idx_utc, input_tz)
+    _annotate(out, timer, 0, 0, meta['trees'], meta.get('auto_sized', False), path=meta['path'])
+    return out
+
+
+def forecast_xgb_global(
+    series,
+    forecast_period,
+    interval_seconds,
+    predictor_options=None,
+    model_size_modulator=3.0,
+    max_train_rows=None,
+    auto_size=False,
+    fast_path=True,
+    model_cache=None,
+):
+    """
+    Forecast several related series (e.g. one property across many entities) with
+    a single XGBoost model.
+
+    The training rows of all series are stacked with an extra ``series_id`` feature,
+    one booster is fit on them and one ``predict`` call covers the forecast grids of
+    every series. Fourier tiers follow the longest history. Returns one forecast
+    frame per entry of ``series``, in the same order and format as
+    ``forecast_xgb_timeseries``. A series that cannot be prepared (e.g. unparseable
+    timestamps or non-finite readings) gets the exception instead of a frame, and
+    is left out of the model. Timings and trees of the shared model are reported on
+    the first frame only. ``max_train_rows`` caps the rows of each series.
+
+    With ``fast_path`` trivial series (see ``classify_series``) get their
+    closed-form forecast and are left out of the model. With ``auto_size`` the
+    number of trees is chosen by early stopping on the most recent rows of every
+    series. With ``model_cache`` the shared model is cached under a fingerprint of
+    all its training data and options.
+    """
+    timer = StageTimer()
+    prepared = [None] * len(series)
+    outputs = [None] * len(series)
+    with timer.stage('resample'):
+        for i, data in enumerate(series):
+            try:
+                df, input_tz = prepare_series(data, interval_seconds)
+                if not np.isfinite(df['value'].values).all():
+                    raise ValueError("Non-finite readings cannot be forecast with a global model")
+                prepared[i] = (df, input_tz)
+            except Exception as exc:
+                outputs[i] = exc
+    ready = [i for i, item in enumerate(prepared) if item is not None]
+
+    methods = {}
+    if fast_path:
+        with timer.stage('classify'):
+            methods = {i: classify_series(prepared[i][0]) for i in ready}
+    grids = {i: forecast_index(forecast_period, interval_seconds, prepared[i][1]) for i in ready}
+    predictions = {}
+    with timer.stage('predict'):
+        for i, method in methods.items():
+            if method is not None:
+                predictions[i] = closed_form_forecast(prepared[i][0], grids[i], method)
+
+    targets = [i for i in ready if methods.get(i) is None]
+    train_rows, trees_trained, trees_used = {}, 0, 0
+    auto_size = auto_size and all(len(prepared[i][0]) >= AUTO_SIZE_MIN_ROWS for i in targets)
+    if targets:
+        span = max(prepared[i][0].index.max() - prepared[i][0].index.min() for i in targets)
+        tiers = fourier_tiers(span)
+        opts = model_options(model_size_modulator, predictor_options)
+        cache_opts = {**opts, 'auto_size': True} if auto_size else opts
+
+        train_dfs = [prepared[i][0] for i in targets]
+        if max_train_rows and any(len(df) > max_train_rows for df in train_dfs):
+            with timer.stage('reduce'):
+                train_dfs = [reduce_training_rows(df, max_train_rows) for df in train_dfs]
+        train_rows = {i: len(df) for i, df in zip(targets, train_dfs)}
+
+        model = cache_key = None
+        if model_cache is not None:
+            cache_key = series_fingerprint(
+                ['global'] + [series_fingerprint(None, df.index, df['value'].values, interval_seconds, {})
+                              for df in train_dfs],
+                pd.DatetimeIndex([]), [], interval_seconds, cache_opts)
+            model = model_cache.get(cache_key)
+        if model is None:
+            # Stack training features with the series identifier
+            with timer.stage('features'):
+                train_x = _stack_with_series_id([build_time_features(df.index, tiers) for df in train_dfs])
+            targets_y = np.concatenate([df['value'].values for df in train_dfs])
+
+            with timer.stage('fit'):
+                if auto_size:
+                    holdout = np.concatenate([
+                        np.arange(len(df)) >= len(df) - max(1, int(len(df) * AUTO_SIZE_HOLDOUT)) for df in train_dfs
+                    ])
+                    model, trees_trained = _fit_auto_sized(train_x, targets_y, opts, holdout)
+                else:
+                    model = _fit_model(opts, train_x, targets_y)
+                    trees_trained = opts['n_estimators']
+            if cache_key is not None:
+                model_cache.put(cache_key, model)
+        trees_used = model.get_booster().num_boosted_rounds()
+
+        # One predict call over the forecast grids of all series
+        with timer.stage('predict'):
+            pred_grids = [grids[i] for i in targets]
+            joint = _predict(model.predict, _stack_with_series_id([build_time_features(idx_utc, tiers) for idx_utc in pred_grids]))
+            splits = np.cumsum([len(idx_utc) for idx_utc in pred_grids])[:-1]
+            predictions.update(zip(targets, np.split(joint, splits)))
+
+    with timer.stage('format'):
+        for i in ready:
+            outputs[i] = format_forecast(predictions[i], grids[i], prepared[i][1])
+    first = True
+    for i in ready:
+        frame_timer = timer if first else StageTimer()
+        if methods.get(i) is not None:
+            _annotate(outputs[i], frame_timer, len(prepared[i][0]), 0, 0, path=methods[i])
+        else:
+            _annotate(outputs[i], frame_timer, train_rows[i], trees_trained if first else 0, trees_used,
+                      auto_size, path='global')
+        first = False
+    return outputs
+
+
+def forecast_xgb_entity(
+    data,
+    forecast_period,
+    interval_seconds,
+    predictor_options=None,
+    model_size_modulator=3.0,
+    auto_size=False,
+    fast_path=True,
+    max_train_rows=None,
+):
+    """
+    Forecast several properties of one entity read at the same timestamps (e.g. the
+    pollutants of an air quality station) in one pass.
+
+    ``data`` is as for ``prepare_entity``. The timestamps are resampled once, the
+    training and forecast features are built once for the shared grid, and the
+    properties that need a model are fitted as the targets of one multi-output
+    booster (one tree per target and round, so each forecast is the same as a
+    separate fit) and predicted with one call. Trivial columns get their
+    closed-form forecast as with ``fast_path`` of ``forecast_xgb_timeseries``. With
+    ``auto_size`` every target gets its own early-stopped fit on the shared features.
+
+    Returns one forecast frame per column, in the same order and format as
+    ``forecast_xgb_timeseries``. Timings of the shared stages are reported on the
+    first frame only.
+    """
+    timer = StageTimer()
+    with timer.stage('resample'):
+        frames, input_tz = prepare_entity(data, interval_seconds)
+    idx_utc = forecast_index(forecast_period, interval_seconds, input_tz)
+
+    methods = [None] * len(frames)
+    if fast_path:
+        with timer.stage('classify'):
+            methods = [classify_series(df) for df in frames]
+    predictions = [None] * len(frames)
+    with timer.stage('predict'):
+        for j, method in enumerate(methods):
+            if method is not None:
+                predictions[j] = closed_form_forecast(frames[j], idx_utc, method)
+
+    targets = [j for j, method in enumerate(methods) if method is None]
+    train_rows, trees = 0, [0] * len(frames)
+    auto_size = auto_size and len(frames[0]) >= AUTO_SIZE_MIN_ROWS
+    if targets:
+        df = frames[0]
+        tiers = fourier_tiers(df.index.max() - df.index.min())
+        opts = model_options(model_size_modulator, predictor_options)
+        train_dfs = [frames[j] for j in targets]
+        if max_train_rows and len(df) > max_train_rows:
+            # the reduction only depends on the grid, so all targets keep the same rows
+            with timer.stage('reduce'):
+                train_dfs = [reduce_training_rows(train_df, max_train_rows) for train_df in train_dfs]
+        train_rows = len(train_dfs[0])
+        with timer.stage('features'):
+            train_x = build_time_features(train_dfs[0].index, tiers)
+            pred_x = build_time_features(idx_utc, tiers)
+
+        with timer.stage('fit'):
+            if auto_size:
+                models = [_fit_auto_sized(train_x, train_df['value'].values, opts) for train_df in train_dfs]
+            else:
+                y = np.column_stack([train_df['value'].values for train_df in train_dfs])
+                model = _fit_model(opts, train_x, y[:, 0] if len(targets) == 1 else y)
+        with timer.stage('predict'):
+            if auto_size:
+                for j, (model, trees_trained) in zip(targets, models):
+                    predictions[j] = _predict(model.predict, pred_x)
+                    trees[j] = trees_trained
+            else:
+                joint = _predict(model.predict, pred_x).reshape(len(idx_utc), len(targets))
+                for pos, j in enumerate(targets):
+                    predictions[j] = joint[:, pos]
+                    trees[j] = opts['n_estimators']
+
+    with timer.stage('format'):
+        outputs = [format_forecast(pred, idx_utc, input_tz) for pred in predictions]
+    for j, (out, method) in enumerate(zip(outputs, methods)):
+        frame_timer = timer if j == 0 else StageTimer()
+        if method is not None:
+            _annotate(out, frame_timer, len(frames[j]), 0, 0, path=method)
+        else:
+            trees_used = models[targets.index(j)][0].get_booster().num_boosted_rounds() if auto_size else trees[j]
+            _annotate(out, frame_timer, train_rows, trees[j], trees_used, auto_size, path='entity')
+    return outputs
+
+
+def _fit_full(df, tiers, opts, auto_size, max_train_rows, timer):
+    """Fit a new model on all of ``df``; returns it with the trees and rows trained."""
+    train_df = df
+    if max_train_rows and len(df) > max_train_rows:
+        with timer.stage('reduce'):
+            train_df = reduce_training_rows(df, max_train_rows)
+    with timer.stage('features'):
+        train_x = build_time_features(train_df.index, tiers)
+    with timer.stage('fit'):
+        if auto_size:
+            model, trees_trained = _fit_auto_sized(train_x, train_df['value'].values, opts)
+        else:
+            model = _fit_model(opts, train_x, train_df['value'].values)
+            trees_trained = opts['n_estimators']
+    return model, trees_trained, len(train_df)
+
+
+def reduce_training_rows(df, max_rows):
+    """
+    At most ``max_rows`` training rows for the resampled series ``df``.
+
+    The newest half of the budget keeps full resolution; each older tier gets
+    half of the remaining budget at ``REDUCE_TIER_FACTOR`` times the previous
+    aggregation, until the rest of the history fits the budget left at that
+    factor. The oldest tier then uses the smallest factor that fits, and one
+    less for its newest rows, so it fills the budget: a history just above the
+    cap loses only the rows over it. Aggregated rows hold the mean value of
+    their bin and are placed at its midpoint, so the result is no longer a
+    regular grid.
+    """
+    n = len(df)
+    if n <= max_rows:
+        return df
+    index_ns = df.index.asi8
+    values = df['value'].values
+    interval_ns = int(index_ns[1] - index_ns[0])
+
+    parts = []
+    end, budget, factor = n, int(max_rows), 1
+    while end > budget * factor and budget // 2 >= REDUCE_MIN_TIER_ROWS:
+        share = budget // 2
+        start = end - share * factor
+        parts.append(_aggregate_rows(index_ns[start:end], values[start:end], factor, interval_ns))
+        end, budget, factor = start, budget - share, factor * REDUCE_TIER_FACTOR
+    parts.append(_aggregate_oldest(index_ns[:end], values[:end], budget, interval_ns))
+
+    index_ns = np.concatenate([ns for ns, _ in reversed(parts)])
+    values = np.concatenate([v for _, v in reversed(parts)])
+    return pd.DataFrame({'value': values}, index=pd.DatetimeIndex(index_ns, tz=df.index.tz))
+
+
+def _aggregate_oldest(index_ns, values, budget, interval_ns):
+    # at most ``budget`` rows: bins of the smallest factor that fits, and bins one
+    # row shorter for the newest rows so that exactly ``budget`` rows are left
+    n = len(values)
+    if n <= budget:
+        return index_ns, values
+    factor = -(-n // budget)
+    split = (n - budget * (factor - 1)) * factor
+    older = _aggregate_rows(index_ns[:split], values[:split], factor, interval_ns)
+    newer = _aggregate_rows(index_ns[split:], values[split:], factor - 1, interval_ns)
+    return np.concatenate([older[0], newer[0]]), np.concatenate([older[1], newer[1]])
+
+
+def _aggregate_rows(index_ns, values, factor, interval_ns):
+    # bins of ``factor`` rows aligned to the newest row; the oldest one may be partial
+    if factor == 1:
+        return index_ns, values
+    n = len(values)
+    starts = np.arange(n % factor, n, factor)
+    if n % factor:
+        starts = np.concatenate([[0], starts])
+    counts = np.diff(np.append(starts, n))
+    means = np.add.reduceat(values, starts) / counts
+    return index_ns[starts] + (counts - 1) * interval_ns // 2, means
+
+
+def classify_series(df):
+    """
+    Closed-form method for a resampled series that is not worth a model, or
+    ``None`` if it should go to XGBoost:
+
+    - ``'last_value'`` for constant series and for histories too short to fit
+    - ``'mean'`` for series that are constant up to round-off (spread within
+      ``TRIVIAL_MAX_SPREAD`` of the magnitude of their level, or of 1 below it),
+      and for sparse or few-valued ones shorter than a day
+    - ``'seasonal_naive'`` (same time of the last observed day) for sparse series
+      and series with at most ``TRIVIAL_MAX_DISTINCT`` distinct readings
+    """
+    values = df['value'].values
+    observed = df.attrs.get('observed')
+    if observed is None:
+        observed = ~np.isnan(values)
+    readings = values[observed]
+
+    spread = float(np.ptp(values))
+    if spread == 0:
+        return 'last_value'
+    if spread <= TRIVIAL_MAX_SPREAD * max(1.0, abs(float(np.mean(values)))):
+        return 'mean'
+    if len(values) < TRIVIAL_MIN_ROWS:
+        return 'last_value'
+
+    sparse = observed.mean() < TRIVIAL_MIN_COVERAGE
+    if sparse or len(np.unique(readings)) <= TRIVIAL_MAX_DISTINCT:
+        if df.index[-1] - df.index[0] >= pd.Timedelta(seconds=SEC_DAY):
+            return 'seasonal_naive'
+        return 'mean'
+    return None
+
+
+def closed_form_forecast(df, idx_utc, method):
+    """Predictions of ``method`` (see ``classify_series``) on the UTC grid ``idx_utc``."""
+    values = df['value'].values
+    if method == 'last_value':
+        return np.full(len(idx_utc), values[-1])
+    if method == 'mean':
+        return np.full(len(idx_utc), values.mean())
+    if method == 'seasonal_naive':
+        # shift every target back by whole days into the history, then read the
+        # resampled series there
+        history_ns = df.index.asi8
+        target_ns = idx_utc.asi8
+        day_ns = SEC_DAY * 10**9
+        days_back = np.maximum(np.ceil((target_ns - history_ns[-1]) / day_ns), 0).astype(np.int64)
+        return np.interp(target_ns - days_back * day_ns, history_ns, values)
+    raise ValueError(f"Unknown closed-form method: {method}")
+
+
+def _fit_auto_sized(train_x, y, opts, holdout=None):
+    """
+    Choose the tree count by early stopping on the most recent rows (or on the rows
+    of the boolean mask ``holdout``), then refit on all rows. Returns the model and
+    the number of trees trained in total.
+    """
+    if holdout is None:
+        holdout = np.arange(len(y)) >= len(y) - max(1, int(len(y) * AUTO_SIZE_HOLDOUT))
+    sizing_opts = {**opts, 'tree_method': 'hist'}
+    stopping = EarlyStopping(
+        rounds=AUTO_SIZE_PATIENCE,
+        metric_name='rmse',
+        min_delta=AUTO_SIZE_MIN_GAIN * (float(np.std(y)) or 1.0),
+    )
+    probe = _fit_model({**sizing_opts, 'eval_metric': 'rmse', 'callbacks': [stopping]},
+                       train_x[~holdout], y[~holdout],
+                       eval_set=[(train_x[holdout], y[holdout])], verbose=False)
+    trees = probe.best_iteration + 1
+
+    model = _fit_model({**sizing_opts, 'n_estimators': trees}, train_x, y)
+    return model, probe.get_booster().num_boosted_rounds() + trees
+
+
+def _fit_model(opts, train_x, y, **fit_kwargs):
+    """
+    Fit an ``XGBRegressor`` with the threads ``thread_budget`` grants for the size
+    of ``y``. The fitted model is left single-threaded, as a cached model may be
+    used by several series at once; ``_predict`` parallelises long grids itself.
+    """
+    with thread_budget.reserve(len(y)) as threads:
+        model = XGBRegressor(**{**opts, 'n_jobs': threads})
+        model.fit(train_x, y, **fit_kwargs)
+    model.set_params(n_jobs=1)
+    return model
+
+
+def _predict(predict, pred_x):
+    """
+    ``predict(pred_x)`` (``predict`` or ``inplace_predict`` of a fitted model)
+    with the threads ``thread_budget`` grants for the length of the forecast
+    grid: a long grid is split into one block of rows per thread, predicted
+    concurrently (XGBoost predicts thread-safely and releases the GIL). Short
+    grids predict directly, without touching the budget.
+    """
+    if thread_budget.threads_for(len(pred_x), PREDICT_ROWS_PER_THREAD) == 1:
+        return predict(pred_x)
+    with thread_budget.reserve(len(pred_x), PREDICT_ROWS_PER_THREAD) as threads:
+        if threads == 1:
+            return predict(pred_x)
+        with ThreadPoolExecutor(threads) as pool:
+            return np.concatenate(list(pool.map(predict, np.array_split(pred_x, threads))))
+
+
+def _annotate(out, timer, train_rows, trees_trained, trees_used, auto_sized=False, path='xgboost'):
+    # per-series diagnostics travel with the frame (also across process pools)
+    out.attrs['path'] = path
+    out.attrs['timings'] = timer.durations
+    out.attrs['train_rows'] = train_rows
+    out.attrs['trees_trained'] = trees_trained
+    out.attrs['trees_used'] = trees_used
+    out.attrs['auto_sized'] = auto_sized
+
+
+def _stack_with_series_id(blocks):
+    ids = np.concatenate([np.full(len(block), series_id, dtype=np.float32) for series_id, block in enumerate(blocks)])
+    return np.column_stack([np.vstack(blocks), ids])
+
+
+def _warm_start_rows(previous, df, tiers, opts):
+    """
+    Number of leading rows of ``df`` already learnt by ``previous``, or ``None`` if
+    the stored model cannot be continued on ``df``.
+    """
+    if previous is None:
+        return None
+    prev_values = previous['values']
+    n_prev = len(prev_values)
+    if n_prev < 2 or len(df) < n_prev or previous['start'] != df.index[0].value:
+        return None
+    if previous['tiers'] != tiers:
+        return None
+    if previous['trees'] >= MAX_WARM_START_GROWTH * opts['n_estimators']:
+        return None
+    # the last stored bin may have received more readings since, so it is
+    # compared loosely and trained on again together with the new rows
+    if not np.array_equal(prev_values[:-1], df['value'].values[:n_prev - 1], equal_nan=True):
+        return None
+    return n_prev - 1
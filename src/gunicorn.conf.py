@@ -0,0 +1,71 @@
+"""
+Production serving: ``gunicorn -c src/gunicorn.conf.py`` from the repository root.
+
+The app (pandas, XGBoost and the Flask app itself) is imported once in the master
+and shared copy-on-write by the forked workers. Every worker then runs a warmup
+forecast before it accepts requests; XGBoost is not run in the master because the
+OpenMP runtime does not survive a fork. Workers whose resident memory grows past
+``WORKER_MAX_RSS_MB`` finish their current requests and are replaced.
+"""
+import os
+import resource
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_cores = os.cpu_count() or 1
+
+wsgi_app = 'app:app'
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+bind = f"0.0.0.0:{os.getenv('PORT', 9013)}"
+preload_app = True
+
+# one worker by default: caches, request coalescing, metrics and rate limits are per
+# process, so extra workers split them (background jobs and the admission budgets
+# are shared, see app.py); threads and XGBoost's own threads use the cores
+workers = int(os.getenv('WEB_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 4))
+# forecasts of large batches take a while; streamed responses keep the worker busy
+timeout = int(os.getenv('WEB_TIMEOUT', 300))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# recycle workers after a number of requests (jittered so they do not restart
+# together) and when their memory grows past the limit
+max_requests = int(os.getenv('WORKER_MAX_REQUESTS', 2000))
+max_requests_jitter = max(1, max_requests // 10) if max_requests else 0
+WORKER_MAX_RSS_MB = float(os.getenv('WORKER_MAX_RSS_MB', 1024))
+
+# every worker fits with its share of the cores (see thread_budget) and admits its
+# share of the admission budgets
+os.environ.setdefault('FIT_THREADS', str(max(1, _cores // max(1, workers))))
+os.environ['WEB_WORKER_PROCESSES'] = str(max(1, workers))
+
+accesslog = os.getenv('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        # peak rather than current size where /proc is not available (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if os.uname().sysname == 'Darwin' else peak / 2**10
+
+
+def post_fork(server, worker):
+    import app
+    if app.WARMUP:
+        server.log.info("Worker %s warmed up in %.2fs", worker.pid, app.warmup())
+
+
+def post_request(worker, req, environ, resp):
+    if WORKER_MAX_RSS_MB > 0 and worker.alive:
+        rss = _rss_mb()
+        if rss > WORKER_MAX_RSS_MB:
+            worker.log.info("Worker %s uses %.0f MB (limit %.0f MB), restarting", worker.pid, rss, WORKER_MAX_RSS_MB)
+            worker.alive = False
@@ -0,0 +1,125 @@
+import codecs
+import hashlib
+import json
+
+from ngsild import PayloadError
+
+# request content types read as one JSON entity per line
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\r\n'
+
+
+class HashingReader:
+    """Wraps a binary stream and hashes everything read from it (SHA-256)."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self._hash.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of a top-level JSON array read incrementally from a binary
+    stream, so only the element being parsed is held as text. Raises
+    ``PayloadError`` for malformed input.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf, pos, eof = '', 0, False
+    state = 'start'
+
+    def read_more(size):
+        nonlocal buf, pos, eof
+        data = stream.read(size)
+        eof = not data
+        buf, pos = buf[pos:] + text.decode(data, final=eof), 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                if state == 'end':
+                    return
+                raise PayloadError("Unexpected end of the JSON array.")
+            read_more(chunk_size)
+            continue
+
+        ch = buf[pos]
+        if state == 'start':
+            if ch != '[':
+                raise PayloadError("Payload must be a JSON array of entities.")
+            pos += 1
+            state = 'first'
+        elif state == 'end':
+            raise PayloadError("Unexpected data after the JSON array.")
+        elif state in ('first', 'next') and ch == ']':
+            pos += 1
+            state = 'end'
+        elif state == 'next':
+            if ch != ',':
+                raise PayloadError(f"Expected ',' or ']' in the JSON array, got {ch!r}.")
+            pos += 1
+            state = 'value'
+        else:
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as exc:
+                if eof:
+                    raise PayloadError(f"Invalid JSON in payload: {exc.msg}") from None
+                # read at least as much as is buffered, so a large element is
+                # rescanned only a logarithmic number of times
+                read_more(max(chunk_size, len(buf) - pos))
+                continue
+            buf, pos = buf[end:], 0
+            state = 'next'
+            yield _entity(element)
+
+
+def iter_ndjson(stream, chunk_size=CHUNK_SIZE):
+    """Yield one entity per non-empty line of a binary NDJSON stream."""
+    parts = []
+    lineno = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        start = 0
+        while True:
+            newline = chunk.find(b'\n', start)
+            if newline < 0:
+                parts.append(chunk[start:])
+                break
+            parts.append(chunk[start:newline])
+            line, parts = b''.join(parts), []
+            lineno += 1
+            if line.strip():
+                yield _parse_line(line, lineno)
+            start = newline + 1
+    line = b''.join(parts)
+    if line.strip():
+        yield _parse_line(line, lineno + 1)
+
+
+def _parse_line(line, lineno):
+    try:
+        return _entity(json.loads(line))
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise PayloadError(f"Invalid JSON on line {lineno}: {exc}") from None
+
+
+def _entity(element):
+    if not isinstance(element, dict):
+        raise PayloadError("Every entity must be a JSON object.")
+    return element
@@ -0,0 +1,240 @@
+import json
+import os
+import re
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from werkzeug.exceptions import HTTPException
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+JOB_ID = re.compile(r'[0-9a-f]{32}')
+# seconds between sweeps of expired jobs out of the store
+SWEEP_SECONDS = 60
+# persisted fields of a job; the result is stored in its own file
+RECORD_KEYS = ('id', 'owner', 'status', 'created', 'started', 'finished', 'error', 'error_status', 'host', 'pid')
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while ``max_depth`` jobs are pending."""
+
+
+class Job:
+    def __init__(self, owner=None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = JOB_QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.error_status = None
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self.result_path = None
+        self._result = None
+
+    @property
+    def result(self):
+        # results of jobs run by another process are read from the store on first use
+        if self._result is None and self.result_path is not None:
+            try:
+                with open(self.result_path, encoding='utf-8') as f:
+                    self._result = json.load(f)
+            except FileNotFoundError:
+                return None
+        return self._result
+
+    @result.setter
+    def result(self, value):
+        self._result = value
+
+    def record(self):
+        return {key: getattr(self, key) for key in RECORD_KEYS}
+
+    @classmethod
+    def from_record(cls, record, result_path):
+        job = cls.__new__(cls)
+        for key in RECORD_KEYS:
+            setattr(job, key, record.get(key))
+        job.result_path = result_path if record.get('status') == JOB_SUCCEEDED else None
+        job._result = None
+        return job
+
+    def describe(self):
+        info = {
+            'jobId': self.id,
+            'status': self.status,
+            'createdAt': _iso(self.created),
+            'startedAt': _iso(self.started),
+            'finishedAt': _iso(self.finished),
+            'result': f"/ngsi-ld/jobs/{self.id}/result",
+        }
+        if self.error is not None:
+            info['error'] = self.error
+        return info
+
+
+class JobQueue:
+    """
+    Bounded background queue for long-running batches.
+
+    ``workers`` jobs run at a time; at most ``max_depth`` jobs may be queued or
+    running, further submissions raise ``QueueFull``. Finished jobs are kept for
+    ``result_ttl_seconds`` and then forgotten.
+
+    With ``store_dir``, the state and result of every job are also written to that
+    directory (replaced atomically), so all processes sharing it, such as the
+    gunicorn workers, can report any job. A job whose process on this host exited
+    before the job finished is reported as failed.
+    """
+
+    def __init__(self, workers=1, max_depth=16, result_ttl_seconds=3600, store_dir=None):
+        self.max_depth = int(max_depth)
+        self.result_ttl_seconds = float(result_ttl_seconds)
+        self.store_dir = store_dir or None
+        if self.store_dir:
+            os.makedirs(self.store_dir, exist_ok=True)
+        self._swept = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='job')
+        self._jobs = {}
+        self._pending = 0
+        self._lock = Lock()
+
+    def submit(self, fn, *args, owner=None):
+        with self._lock:
+            self._expire()
+            if self._pending >= self.max_depth:
+                raise QueueFull()
+            job = Job(owner=owner)
+            self._jobs[job.id] = job
+            self._pending += 1
+        self._save(job)
+        self._executor.submit(self._run, job, fn, args)
+        self._sweep()
+        return job
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+        if job is None and self.store_dir and JOB_ID.fullmatch(job_id):
+            job = self._load(job_id)
+        return job
+
+    def _run(self, job, fn, args):
+        job.started = time.time()
+        job.status = JOB_RUNNING
+        self._save(job)
+        try:
+            job.result = fn(*args)
+            self._save_result(job)
+            job.status = JOB_SUCCEEDED
+        except HTTPException as exc:
+            job.error, job.error_status = exc.description, exc.code
+            job.status = JOB_FAILED
+        except Exception as exc:
+            job.error = str(exc)
+            job.status = JOB_FAILED
+        finally:
+            job.finished = time.time()
+            self._save(job)
+            with self._lock:
+                self._pending -= 1
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._remove(job_id)
+
+    def _path(self, job_id, suffix='.json'):
+        return os.path.join(self.store_dir, job_id + suffix)
+
+    def _write(self, path, obj):
+        tmp = f"{path}.{uuid.uuid4().hex[:12]}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, default=str)
+        os.replace(tmp, path)
+
+    def _save(self, job):
+        if self.store_dir:
+            self._write(self._path(job.id), job.record())
+
+    def _save_result(self, job):
+        if self.store_dir:
+            job.result_path = self._path(job.id, '.result.json')
+            self._write(job.result_path, job.result)
+
+    def _remove(self, job_id):
+        if self.store_dir:
+            for suffix in ('.json', '.result.json'):
+                try:
+                    os.remove(self._path(job_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _sweep(self):
+        # jobs of any process that expired, or whose process exited, at least a TTL ago
+        now = time.time()
+        if not self.store_dir or now - self._swept < SWEEP_SECONDS:
+            return
+        self._swept = now
+        cutoff = now - self.result_ttl_seconds
+        for name in os.listdir(self.store_dir):
+            job_id = name[:-len('.json')]
+            if not JOB_ID.fullmatch(job_id):
+                continue
+            try:
+                if os.stat(self._path(job_id)).st_mtime >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            job = self._load(job_id)
+            if job is not None and job.finished is None and job.status == JOB_FAILED:
+                self._remove(job_id)
+
+    def _load(self, job_id):
+        # a job submitted to another process sharing the store
+        try:
+            with open(self._path(job_id), encoding='utf-8') as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        job = Job.from_record(record, self._path(job_id, '.result.json'))
+        if job.finished is not None:
+            if job.finished < time.time() - self.result_ttl_seconds:
+                self._remove(job_id)
+                return None
+        elif job.host == socket.gethostname() and not _alive(job.pid):
+            job.status = JOB_FAILED
+            job.error = 'The worker running the job exited before it finished.'
+        return job
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, TypeError):
+        return True
+    return True
+
+
+def _iso(epoch):
+    if epoch is None:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+
+def series_fingerprint(series_key, index, values, interval_seconds, options):
+    """
+    Content hash of everything a trained model depends on: the series identity
+    (entity id, property URI), the resampled training data, the interval and the
+    model options.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(list(series_key or ()), default=str).encode())
+    h.update(np.ascontiguousarray(index.asi8).tobytes())
+    h.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    h.update(str(int(interval_seconds)).encode())
+    h.update(json.dumps(options, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def lineage_fingerprint(series_key, interval_seconds, options):
+    """
+    Hash of the series identity and model settings only, without the data. Models
+    sharing it can be continued from one another when their data is a prefix.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(list(series_key or ()), default=str).encode())
+    h.update(str(int(interval_seconds)).encode())
+    h.update(json.dumps(options, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class ModelCache:
+    """
+    Thread-safe in-process LRU cache of trained models with a time-to-live.
+
+    ``max_entries`` bounds the number of models kept; the least recently used one
+    is evicted first. Entries older than ``ttl_seconds`` are treated as misses.
+
+    Besides exact entries, the cache remembers the latest training run of every
+    series lineage (see ``lineage_fingerprint``) for incremental warm starts.
+    """
+
+    def __init__(self, max_entries=128, ttl_seconds=3600):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self._entries = OrderedDict()
+        self._lineages = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.warm_starts = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._lookup(self._entries, key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._store(self._entries, key, value)
+
+    def latest(self, lineage_key):
+        """Latest training record stored for a series lineage, or ``None``."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._lookup(self._lineages, lineage_key)
+
+    def put_latest(self, lineage_key, record, warm_start=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._store(self._lineages, lineage_key, record)
+            if warm_start:
+                self.warm_starts += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lineages.clear()
+
+    def _lookup(self, entries, key):
+        item = entries.get(key)
+        if item is None:
+            return None
+        stored_at, value = item
+        if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+            del entries[key]
+            self.evictions += 1
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _store(self, entries, key, value):
+        entries[key] = (time.monotonic(), value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'lineages': len(self._lineages),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'warm_starts': self.warm_starts,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            }
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock
+
+from xgboost import Booster
+from xgboost.core import XGBoostError
+
+
+def registry_key(entity_id, prop_uri):
+    """File name stem of the model of one entity property."""
+    return hashlib.sha256(json.dumps([entity_id, prop_uri]).encode()).hexdigest()[:32]
+
+
+class ModelRegistry:
+    """
+    Trained models on disk, one per entity property.
+
+    Every property has a ``<key>.json`` sidecar with the metadata needed to predict
+    (see ``forecaster.train_xgb_model``) and the name of its booster file,
+    ``<key>.<version>.ubj`` in XGBoost's binary UBJSON format. Models without a
+    booster (closed-form forecasts) only have the sidecar. A new version is written
+    next to the old one and the sidecar is replaced atomically, so readers never
+    see a partial or mismatched model.
+
+    Models are loaded lazily on first use and the ``max_loaded`` most recently
+    used ones stay in memory; a model rewritten on disk (e.g. by another worker)
+    is reloaded when its sidecar changes.
+    """
+
+    def __init__(self, root, max_loaded=256):
+        self.root = root
+        self.max_loaded = int(max_loaded)
+        self._loaded = OrderedDict()
+        self._lock = Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def _meta_path(self, entity_id, prop_uri):
+        return os.path.join(self.root, registry_key(entity_id, prop_uri) + '.json')
+
+    def save(self, entity_id, prop_uri, booster, meta):
+        """Store ``booster`` (or ``None``) and ``meta``; returns the stored metadata."""
+        os.makedirs(self.root, exist_ok=True)
+        meta_path = self._meta_path(entity_id, prop_uri)
+        previous = self._read_meta(meta_path)
+        version = uuid.uuid4().hex[:12]
+        meta = {**meta, 'id': entity_id, 'property': prop_uri, 'model_file': None,
+                'trained_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        if booster is not None:
+            meta['model_file'] = f"{registry_key(entity_id, prop_uri)}.{version}.ubj"
+            booster.save_model(os.path.join(self.root, meta['model_file']))
+
+        # the sidecar names the model file, so replacing it switches both at once
+        tmp = f"{meta_path}.{version}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+        if previous and previous.get('model_file'):
+            try:
+                os.remove(os.path.join(self.root, previous['model_file']))
+            except FileNotFoundError:
+                pass
+        return meta
+
+    def load(self, entity_id, prop_uri):
+        """``(booster, meta)`` of a stored model, or ``None`` if there is none."""
+        meta_path = self._meta_path(entity_id, prop_uri)
+        key = (entity_id, prop_uri)
+        for _ in range(3):
+            try:
+                mtime = os.stat(meta_path).st_mtime_ns
+            except FileNotFoundError:
+                return None
+            with self._lock:
+                item = self._loaded.get(key)
+                if item is not None and item[0] == mtime:
+                    self._loaded.move_to_end(key)
+                    self.hits += 1
+                    return item[1], item[2]
+
+            meta = self._read_meta(meta_path)
+            if meta is None:
+                return None
+            booster = None
+            if meta.get('model_file'):
+                booster = Booster()
+                try:
+                    booster.load_model(os.path.join(self.root, meta['model_file']))
+                except XGBoostError:
+                    # replaced by a concurrent save between reading the sidecar and the model
+                    continue
+                # loaded models default to every core; predictions on forecast grids are small
+                booster.set_param('nthread', 1)
+
+            with self._lock:
+                self.loads += 1
+                if self.max_loaded > 0:
+                    self._loaded[key] = (mtime, booster, meta)
+                    self._loaded.move_to_end(key)
+                    while len(self._loaded) > self.max_loaded:
+                        self._loaded.popitem(last=False)
+            return booster, meta
+        return None
+
+    @staticmethod
+    def _read_meta(meta_path):
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'root': self.root,
+                'loaded': len(self._loaded),
+                'max_loaded': self.max_loaded,
+                'loads': self.loads,
+                'hits': self.hits,
+            }
@@ -0,0 +1,124 @@
+from collections import namedtuple
+from datetime import datetime
+from itertools import chain, repeat
+
+import numpy as np
+import pandas as pd
+
+# keys of an NGSI-LD entity that are not forecastable properties
+RESERVED_KEYS = ('id', 'type', 'dateObserved', '@context')
+
+# candidate intervals for interval detection, in seconds
+ALLOWED_INTERVALS = [
+    1, 2, 3, 4, 5, 10, 15, 30, 60,
+    120, 300, 600, 900, 1200, 1800, 3600,
+    7200, 10800, 14400, 18000, 21600,
+    28800, 43200, 86400, 172800
+]
+
+# Columnar view of one NGSI-LD temporal property.
+#   timestamps  - tz-aware DatetimeIndex in the offset of the first reading
+#   values      - float64 array
+#   metadata    - per-point metadata dicts
+#   observed    - raw observedAt strings
+#   non_numeric - True if the flattening stopped at a non-numeric value; the
+#                 columns then hold the numeric readings before it
+FlatSeries = namedtuple('FlatSeries', 'timestamps values metadata observed non_numeric')
+
+
+class PayloadError(ValueError):
+    """Raised for malformed NGSI-LD input; the message is safe to return to clients."""
+
+
+def property_keys(entity):
+    return [k for k in entity if k not in RESERVED_KEYS]
+
+
+def parse_iso(ts_str):
+    return datetime.fromisoformat(ts_str.replace('Z', '+00:00'))
+
+
+def flatten_property(raw, prop_uri):
+    """
+    Flatten ``raw['values'][*]['values'][*]`` into columns, parsing all values and
+    timestamps in bulk.
+    """
+    points = [pt for batch in raw.get('values', []) for pt in batch.get('values', [])]
+    values, n_numeric = _parse_values([pt.get('value') for pt in points])
+    non_numeric = n_numeric < len(points)
+    if non_numeric:
+        points = points[:n_numeric]
+        values = values[:n_numeric]
+
+    observed = [pt.get('observedAt') for pt in points]
+    timestamps = _parse_timestamps(observed, prop_uri)
+    metadata = [pt.get('metadata', {}) for pt in points]
+    return FlatSeries(timestamps, values, metadata, observed, non_numeric)
+
+
+def detect_interval(timestamps, allowed_intervals):
+    """
+    Closest allowed interval to the 15%-trimmed mean spacing of ``timestamps``
+    (in the order they were received).
+    """
+    diffs = np.sort(np.diff(timestamps.asi8)) / 1e9
+    trim = int(len(diffs) * 0.15)
+    avg = diffs[trim:len(diffs) - trim].mean()
+    allowed = np.asarray(allowed_intervals)
+    return int(allowed[np.argmin(np.abs(allowed - avg))])
+
+
+def build_forecast_values(timestamps, forecasts, metadata_list):
+    """
+    Nested NGSI-LD ``values`` list for a forecast. Metadata objects are shared with
+    the input points; rows past the end of the input reuse the last one.
+    """
+    fc_metadata = chain(metadata_list, repeat(metadata_list[-1]))
+    return [{
+        'type': 'Property',
+        'values': [{
+            'metadata': meta,
+            'value': value,
+            'observedAt': ts_str
+        }]
+    } for meta, value, ts_str in zip(fc_metadata, forecasts, timestamps)]
+
+
+def _parse_values(raw_values):
+    """
+    Convert values to float64. Returns the array and the number of leading values
+    that are numeric (everything after the first non-numeric one is dropped).
+    """
+    n = len(raw_values)
+    try:
+        values = np.fromiter(raw_values, dtype=object, count=n).astype(np.float64)
+    except (TypeError, ValueError):
+        values = None
+    # numpy turns None into NaN, so any NaN needs the exact per-value check
+    if values is not None and not np.isnan(values).any():
+        return values, n
+
+    parsed = []
+    for v in raw_values:
+        try:
+            parsed.append(float(v))
+        except (TypeError, ValueError):
+            break
+    return np.asarray(parsed, dtype=np.float64), len(parsed)
+
+
+def _parse_timestamps(observed, prop_uri):
+    if not observed:
+        return pd.DatetimeIndex([], tz='UTC')
+    parsed = pd.to_datetime(pd.Series(observed, dtype=object), utc=True, format='ISO8601', errors='coerce')
+    invalid = parsed.isna().values
+    if invalid.any():
+        raise PayloadError(f"Invalid timestamp for {prop_uri}: {observed[int(invalid.argmax())]}")
+
+    # report forecasts in the offset of the first reading; naive input is taken as UTC
+    try:
+        first_tz = parse_iso(observed[0]).tzinfo
+    except (AttributeError, TypeError, ValueError):
+        first_tz = None
+    index = pd.DatetimeIndex(parsed)
+    return index.tz_convert(first_tz) if first_tz is not None else index
@@ -0,0 +1,83 @@
+import numpy as np
+
+NS_DAY = 86400 * 10**9
+
+
+def resample_mean(epoch_ns, values, interval_ns):
+    """
+    Mean of ``values`` per ``interval_ns`` bin, as pandas ``resample(freq).mean()``
+    with its default ``origin='start_day'``: bins are closed on the left, labelled
+    by their left edge and aligned to midnight UTC of the first timestamp, and the
+    grid runs from the first to the last occupied bin. ``epoch_ns`` must be sorted.
+
+    ``values`` has one entry per timestamp, or one row per timestamp and a column
+    per property read at those timestamps. Returns the left edge of the first bin
+    (epoch ns) and the means per bin in the same layout (NaN for bins without a
+    reading). Input that already has one reading per bin (the usual sensor feed) is
+    returned as is, without binning.
+    """
+    epoch_ns = np.asarray(epoch_ns, dtype=np.int64)
+    values = np.array(values, dtype=np.float64)
+    origin = epoch_ns[0] - epoch_ns[0] % NS_DAY
+    bins = (epoch_ns - origin) // interval_ns
+    start = int(origin + bins[0] * interval_ns)
+    bins -= bins[0]
+    if np.all(np.diff(bins) == 1):
+        return start, values
+
+    n = int(bins[-1]) + 1
+    if values.ndim == 2:
+        return start, np.column_stack([_bin_means(bins, column, n) for column in values.T])
+    return start, _bin_means(bins, values, n)
+
+
+def _bin_means(bins, values, n):
+    valid = ~np.isnan(values)
+    bins, values = bins[valid], values[valid]
+    counts = np.bincount(bins, minlength=n)
+    sums = _compensated_sums(bins, values, counts)
+    with np.errstate(invalid='ignore'):
+        # empty bins are 0 / 0
+        return sums / counts
+
+
+def _compensated_sums(bins, values, counts):
+    """
+    Kahan-compensated sum per bin of ``values`` in their order, as pandas' group
+    mean computes it, so the means match bit for bit. ``bins`` is sorted; every
+    pass adds the k-th reading of all bins that have one.
+    """
+    sums = np.zeros(len(counts))
+    compensation = np.zeros(len(counts))
+    rank = np.arange(len(bins)) - (np.cumsum(counts) - counts)[bins]
+    order = np.argsort(rank, kind='stable')
+    bounds = np.searchsorted(rank[order], np.arange(counts.max(initial=0) + 1))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        idx = order[lo:hi]
+        b = bins[idx]
+        y = values[idx] - compensation[b]
+        t = sums[b] + y
+        compensation[b] = t - sums[b] - y
+        sums[b] = t
+    return sums
+
+
+def interpolate_gaps(values):
+    """
+    Fill NaN gaps of a regular grid in place by linear interpolation between their
+    neighbours, as pandas ``interpolate()``: NaNs before the first reading are kept
+    and trailing ones take the last reading. A 2-D ``values`` is filled column by
+    column. Returns ``values``.
+    """
+    if values.ndim == 2:
+        for column in values.T:
+            interpolate_gaps(column)
+        return values
+    missing = np.isnan(values)
+    if not missing.any() or missing.all():
+        return values
+    # grid positions rather than epochs: the same result as pandas, and exact in float64
+    known = np.flatnonzero(~missing)
+    values[missing] = np.interp(np.flatnonzero(missing), known, values[known])
+    values[:known[0]] = np.nan
+    return values
@@ -0,0 +1,134 @@
+import gzip
+import json
+import zlib
+
+from flask import Response, jsonify, request
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to Flask's encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, MessagePack responses are then not offered
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used instead
+    brotli = None
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def json_response(obj, status=200):
+    """JSON response encoded with orjson when it is installed, else ``jsonify``."""
+    if orjson is None:
+        response = jsonify(obj)
+        response.status_code = status
+        return response
+    return Response(
+        orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY),
+        status=status,
+        mimetype='application/json'
+    )
+
+
+def negotiated_response(obj, status=200):
+    """
+    ``json_response``, or MessagePack when the request prefers it in its ``Accept``
+    header and ``msgpack`` is installed.
+    """
+    if msgpack is not None:
+        best = request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES)
+        if best in MSGPACK_MIMETYPES:
+            return Response(msgpack.packb(obj, use_bin_type=True), status=status, mimetype=best)
+    return json_response(obj, status)
+
+
+def json_bytes(obj):
+    """``obj`` encoded as compact JSON bytes (orjson when installed)."""
+    if orjson is None:
+        return json.dumps(obj, separators=(',', ':')).encode()
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def stream_response(items, fmt='json', status=200):
+    """
+    Chunked response writing every item of the iterable ``items`` as soon as it is
+    produced, either as the elements of one JSON array (``fmt='json'``) or as one
+    JSON document per line (``fmt='ndjson'``).
+    """
+    if fmt == 'ndjson':
+        body = (json_bytes(item) + b'\n' for item in items)
+        mimetype = 'application/x-ndjson'
+    else:
+        body = _json_array_chunks(items)
+        mimetype = 'application/json'
+    response = Response(body, status=status, mimetype=mimetype)
+    # ask reverse proxies not to buffer the chunks
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _json_array_chunks(items):
+    yield b'['
+    separator = b''
+    for item in items:
+        yield separator + json_bytes(item)
+        separator = b','
+    yield b']'
+
+
+def accepted_encoding():
+    """Best content encoding the request accepts (``br`` needs ``brotli``), or ``None``."""
+    offered = ('br', 'gzip') if brotli is not None else ('gzip',)
+    return request.accept_encodings.best_match(offered)
+
+
+def compress_response(response, encoding, min_bytes=1024):
+    """
+    Compress the body of ``response`` with ``encoding`` (``gzip`` or ``br``) in
+    place. Streamed bodies are compressed chunk by chunk, each flushed so the
+    client can decode it right away; other bodies only from ``min_bytes`` on.
+    """
+    if response.is_streamed:
+        response.response = _compressed_chunks(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _compressed_chunks(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+    try:
+        for chunk in chunks:
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        # closing the wrapper must still close the original body
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
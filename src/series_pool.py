@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from threading import Lock
+
+EXECUTOR_MODES = ('serial', 'thread', 'process')
+
+
+class SeriesPool:
+    """
+    Runs one forecast call per series, either inline or on a shared pool.
+
+    Results come back in submission order. Every series is isolated: an exception
+    raised while forecasting one series is returned in its slot instead of being
+    propagated, so the remaining series of the batch still complete.
+    """
+
+    def __init__(self, mode='serial', workers=None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode {mode!r}; expected one of {EXECUTOR_MODES}")
+        self.mode = mode
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self._executor = None
+        self._lock = Lock()
+
+    def _get_executor(self):
+        # created lazily so importing the app never forks or spawns threads
+        with self._lock:
+            if self._executor is None:
+                if self.mode == 'process':
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='series'
+                    )
+            return self._executor
+
+    def map(self, fn, jobs):
+        """
+        Call ``fn(**job)`` for every job and return a list of ``(result, error)`` pairs
+        in the same order as ``jobs``. Exactly one of the two is ``None``.
+        """
+        return list(self.imap(fn, jobs))
+
+    def imap(self, fn, jobs):
+        """
+        Like ``map``, but yields the pairs in order as they become available. In
+        serial mode every job runs only when its result is requested; on a pool all
+        jobs are submitted up front.
+        """
+        if self.mode == 'serial' or len(jobs) <= 1:
+            for job in jobs:
+                yield _call(fn, job)
+            return
+
+        executor = self._get_executor()
+        futures = [executor.submit(fn, **job) for job in jobs]
+        try:
+            for fut in futures:
+                try:
+                    yield fut.result(), None
+                except Exception as exc:
+                    yield None, exc
+        finally:
+            # the consumer stopped early: drop the jobs that have not started
+            for fut in futures:
+                fut.cancel()
+
+    @property
+    def lookahead(self):
+        """Jobs worth starting ahead of the one waited for: none inline, two per pool worker."""
+        return 0 if self.mode == 'serial' else 2 * self.workers
+
+    def submit(self, fn, job):
+        """
+        Start ``fn(**job)`` and return a ``Future`` of its ``(result, error)`` pair
+        (see ``outcome``). In serial mode the job runs before ``submit`` returns.
+        """
+        if self.mode == 'serial':
+            future = Future()
+            future.set_result(_call(fn, job))
+            return future
+        return self._get_executor().submit(_call, fn, job)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def outcome(future):
+    """``(result, error)`` of a ``submit`` future, also when the pool itself failed."""
+    try:
+        return future.result()
+    except Exception as exc:
+        return None, exc
+
+
+def _call(fn, job):
+    try:
+        return fn(**job), None
+    except Exception as exc:
+        return None, exc
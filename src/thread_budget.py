@@ -0,0 +1,73 @@
+import os
+from contextlib import contextmanager
+from threading import Condition
+
+# training rows per XGBoost thread: below this the per-tree synchronisation of
+# extra threads costs more than it saves
+ROWS_PER_THREAD = 2000
+# forecast grid rows per thread of a prediction, which costs one tree walk per
+# row and tree instead of the passes of a fit
+PREDICT_ROWS_PER_THREAD = 10000
+
+
+class ThreadBudget:
+    """
+    Hands out XGBoost threads from a fixed number of cores.
+
+    A fit asks for one thread per ``rows_per_thread`` training rows (at least one,
+    at most ``cores``), a prediction one per ``PREDICT_ROWS_PER_THREAD`` grid
+    rows, and either is granted no more than the cores that are free and its
+    fair share of them among the fits running or waiting, so concurrent fits never
+    hold more threads than ``cores`` in total. A fit waits only if every core is
+    taken.
+    """
+
+    def __init__(self, cores=None, rows_per_thread=ROWS_PER_THREAD):
+        self.cores = max(1, int(cores or os.cpu_count() or 1))
+        self.rows_per_thread = int(rows_per_thread)
+        self._in_use = 0
+        self._active = 0
+        self._cond = Condition()
+        self.waits = 0
+
+    def threads_for(self, rows, rows_per_thread=None):
+        """Threads worth using for a fit on ``rows`` training rows (or ``rows_per_thread`` rows each)."""
+        return max(1, min(self.cores, int(rows) // (rows_per_thread or self.rows_per_thread)))
+
+    @contextmanager
+    def reserve(self, rows, rows_per_thread=None):
+        """Context manager granting threads for a fit on ``rows`` rows; yields their number."""
+        wanted = self.threads_for(rows, rows_per_thread)
+        with self._cond:
+            self._active += 1
+            if self._in_use >= self.cores:
+                self.waits += 1
+                while self._in_use >= self.cores:
+                    self._cond.wait()
+            fair_share = max(1, self.cores // self._active)
+            granted = min(wanted, fair_share, self.cores - self._in_use)
+            self._in_use += granted
+        try:
+            yield granted
+        finally:
+            with self._cond:
+                self._in_use -= granted
+                self._active -= 1
+                self._cond.notify_all()
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def stats(self):
+        with self._cond:
+            return {
+                'cores': self.cores,
+                'in_use': self._in_use,
+                'active': self._active,
+                'rows_per_thread': self.rows_per_thread,
+                'waits': self.waits,
+            }
+
+
+thread_budget = ThreadBudget()
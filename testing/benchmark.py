@@ -0,0 +1,219 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# Offline, per-stage benchmark of the forecasting pipeline (no HTTP server needed).
+#
+# Usage (from the repository root):
+#   python testing/benchmark.py                          # example payloads + synthetic series
+#   python testing/benchmark.py --quick                  # small sizes, for a smoke run
+#   python testing/benchmark.py --output new.json --baseline old.json
+#
+# Every scenario times each stage of the pipeline separately:
+#   flatten -> interval -> resample -> features -> fit -> predict -> serialize
+# and the results are written as JSON so two runs can be compared. With --baseline
+# the script prints the per-stage ratio against a previous run and exits with
+# status 1 if any stage got slower than --tolerance allows.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+from xgboost import XGBRegressor  # noqa: E402
+import pandas as pd  # noqa: E402
+import xgboost  # noqa: E402
+from features import fourier_tiers, time_features  # noqa: E402
+from forecaster import prepare_series, forecast_index, format_forecast, model_options  # noqa: E402
+from ngsild import ALLOWED_INTERVALS, build_forecast_values, detect_interval, flatten_property, property_keys  # noqa: E402
+
+try:
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def dumps(obj):
+        return json.dumps(obj).encode()
+
+STAGES = ('flatten', 'interval', 'resample', 'features', 'fit', 'predict', 'serialize')
+
+
+def timed(samples, repeats, fn):
+    """Run ``fn`` ``repeats`` times, append the durations to ``samples`` and return the last result."""
+    result = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return result
+
+
+def synthetic_property(num_points, interval_seconds=60, seed=0):
+    """NGSI-LD temporal property with a daily cycle plus noise, ending now."""
+    rng = np.random.RandomState(seed)
+    end = datetime.now(timezone(timedelta(hours=3))).replace(microsecond=0)
+    start = end - timedelta(seconds=interval_seconds * (num_points - 1))
+    values = []
+    for i in range(num_points):
+        ts = start + timedelta(seconds=interval_seconds * i)
+        value = 20 + 5 * np.sin(2 * np.pi * ts.timestamp() / 86400) + rng.normal(0, 0.5)
+        values.append({
+            'type': 'Property',
+            'values': [{'metadata': {}, 'value': str(round(value, 3)), 'observedAt': ts.isoformat()}]
+        })
+    return {'type': 'Property', 'values': values}
+
+
+def bench_property(name, raw, prop_uri, modulator, forecast_points, repeats, fit_repeats):
+    samples = {stage: [] for stage in STAGES}
+
+    flat = timed(samples['flatten'], repeats, lambda: flatten_property(raw, prop_uri))
+    if flat.non_numeric or len(flat.values) < 2:
+        return None
+    interval = timed(samples['interval'], repeats, lambda: detect_interval(flat.timestamps, ALLOWED_INTERVALS))
+    data = {'timestamp': flat.timestamps, 'value': flat.values}
+    df, input_tz = timed(samples['resample'], repeats, lambda: prepare_series(data, interval))
+
+    tiers = fourier_tiers(df.index.max() - df.index.min())
+    train_x = timed(samples['features'], repeats, lambda: time_features(df.index.asi8, tiers))
+    opts = model_options(modulator)
+    model = timed(samples['fit'], fit_repeats, lambda: XGBRegressor(**opts).fit(train_x, df['value'].values))
+
+    start = flat.timestamps[-1] + pd.Timedelta(seconds=interval)
+    end = start + pd.Timedelta(seconds=interval * (forecast_points - 1))
+    idx_utc = forecast_index([start.isoformat(), end.isoformat()], interval, input_tz)
+    pred_x = time_features(idx_utc.asi8, tiers)
+    predictions = timed(samples['predict'], repeats, lambda: model.predict(pred_x))
+
+    def serialize():
+        out = format_forecast(predictions, idx_utc, input_tz)
+        return dumps(build_forecast_values(out.index.tolist(), out['forecast'].tolist(), flat.metadata))
+    timed(samples['serialize'], repeats, serialize)
+
+    return {
+        'scenario': name,
+        'property': prop_uri,
+        'points': len(flat.values),
+        'resampled_points': len(df),
+        'interval_seconds': interval,
+        'forecast_points': len(idx_utc),
+        'model_size_modulator': modulator,
+        'trees': opts['n_estimators'],
+        'stages': {
+            stage: {
+                'median_s': statistics.median(values),
+                'min_s': min(values),
+                'runs': len(values),
+            } for stage, values in samples.items()
+        },
+    }
+
+
+def scenarios(args):
+    """Yield (name, raw property, property URI) for every benchmarked series."""
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, 'example_payloads', 'payload*.json'))):
+        with open(path, encoding='utf-8') as f:
+            payload = json.load(f)
+        name = os.path.basename(path)
+        for entity in payload[:args.max_entities]:
+            for prop_uri in property_keys(entity):
+                raw = entity[prop_uri]
+                if isinstance(raw, dict) and 'values' in raw:
+                    yield f"{name}:{entity.get('id')}", raw, prop_uri
+    for length in args.lengths:
+        yield f"synthetic:{length}", synthetic_property(length), 'synthetic'
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'xgboost': xgboost.__version__,
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    def key(r):
+        return (r['scenario'], r['property'], r['model_size_modulator'])
+    previous = {key(r): r for r in baseline['results']}
+
+    regressions = 0
+    print(f"\n{'scenario':50} {'stage':10} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for r in results:
+        old = previous.get(key(r))
+        if old is None:
+            continue
+        for stage in STAGES:
+            old_s = old['stages'][stage]['median_s']
+            new_s = r['stages'][stage]['median_s']
+            ratio = new_s / old_s if old_s > 0 else float('inf')
+            flag = ''
+            if ratio > 1 + tolerance and new_s - old_s > 1e-3:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{r['scenario'][:50]:50} {stage:10} {old_s * 1e3:10.2f} {new_s * 1e3:10.2f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage benchmark of the forecasting pipeline')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='synthetic series lengths')
+    parser.add_argument('--modulators', type=float, nargs='+', default=[0.5, 1.0, 3.0],
+                        help='model_size_modulator values')
+    parser.add_argument('--forecast-points', type=int, default=1440)
+    parser.add_argument('--repeats', type=int, default=5, help='runs per cheap stage')
+    parser.add_argument('--fit-repeats', type=int, default=1, help='runs of the fit stage')
+    parser.add_argument('--max-entities', type=int, default=2, help='entities used per example payload')
+    parser.add_argument('--quick', action='store_true', help='small sizes for a smoke run')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown ratio before flagging')
+    args = parser.parse_args()
+    if args.quick:
+        args.lengths, args.modulators, args.repeats, args.max_entities = [1000], [0.5], 2, 1
+
+    results = []
+    for name, raw, prop_uri in scenarios(args):
+        for modulator in args.modulators:
+            r = bench_property(name, raw, prop_uri, modulator, args.forecast_points, args.repeats, args.fit_repeats)
+            if r is None:
+                continue
+            results.append(r)
+            timings = ' '.join(f"{stage}={r['stages'][stage]['median_s'] * 1e3:.1f}ms" for stage in STAGES)
+            print(f"{name[:40]:40} n={r['points']:<6} m={modulator:<4} {timings}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        print(f"\n{regressions} stage regression(s) above {args.tolerance:.0%}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+# Shared setup of the pytest suites in this directory: the service modules are
+# imported from src/, with the result cache and admission budgets off so that
+# identical requests are recomputed and never turned away. Tests of a component
+# with its own settings build their own instance of it.
+#
+# Usage (from the repository root):
+#   python -m pytest testing
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOAD = os.path.join(REPO_ROOT, 'example_payloads', 'payload.json')
+API_KEY = 'regression-test-key'
+
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+sys.path.append(os.path.join(REPO_ROOT, 'testing'))
+os.environ['RESULT_CACHE_TTL_SECONDS'] = '0'
+os.environ['ADMISSION_KEY_BUDGET'] = '0'
+os.environ['ADMISSION_INFLIGHT_BUDGET'] = '0'
+
+# pytest puts this directory first on sys.path again for every test module, where
+# the ngsild.py script would shadow the service module of the same name
+import ngsild  # noqa: E402,F401
+
+
+@pytest.fixture(scope='session')
+def service():
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT)
+    import app as service_app
+    service_app.VALID_KEYS.add(API_KEY)
+    yield service_app
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope='session')
+def client(service):
+    return service.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def headers():
+    return {'X-API-KEY': API_KEY}
+
+
+@pytest.fixture(scope='session')
+def payload():
+    with open(PAYLOAD, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='session')
+def broker(service):
+    # testing/mock_broker.py serving the example payload on a free port, read by
+    # the service's pull mode
+    import mock_broker
+    from broker import BrokerClient
+    mock_broker.load([PAYLOAD])
+    server = make_server('127.0.0.1', 0, mock_broker.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    previous = service.broker
+    service.broker = BrokerClient(f'http://127.0.0.1:{server.server_port}', max_connections=4,
+                                  max_points=service.MAX_TRAIN_POINTS)
+    yield service.broker
+    service.broker = previous
+    server.shutdown()
@@ -0,0 +1,560 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import requests
+from dotenv import dotenv_values
+
+# Concurrent load test of POST /ngsi-ld/batch_forecast, with a cost model of the
+# request latency for capacity planning.
+#
+# Usage (from the repository root):
+#   python testing/loadtest.py                                   # gunicorn, concurrency 1, 2, 4
+#   python testing/loadtest.py --quick                           # small mix, short steps
+#   python testing/loadtest.py --rate 0.5 1 2 --duration 60      # open loop, Poisson arrivals
+#   python testing/loadtest.py --server flask --env FORECAST_EXECUTOR=thread
+#   python testing/loadtest.py --url http://localhost:9013 --pid 1234
+#
+# The harness starts the app (gunicorn with src/gunicorn.conf.py, or the Flask dev
+# server) on a free port unless --url is given, then replays a mix of batches:
+# the example payloads and synthetic entities with every combination of --series,
+# --history and --horizons. Every request is made unique by nudging the first
+# reading of each series, so neither request coalescing nor the model cache turn
+# it into a cache hit, while the work it asks for stays the same.
+#
+# Each load step (a --concurrency level for a closed loop, or a --rate for an open
+# loop whose latencies include the time spent queued behind earlier requests)
+# reports throughput, latency percentiles, errors by status and the peak resident
+# memory of the server processes. Finally
+#   latency ~ c0 + c_points * points + c_series * series + c_trees * trees
+# is fitted by least squares on the successful requests of the lowest load step
+# (where latency is mostly service time), and used to estimate the latency of the
+# largest batch the MAX_* limits of .env admit.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+from ngsild import parse_iso, property_keys  # noqa: E402
+
+try:
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    loads = orjson.loads
+except ImportError:
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':'))
+
+    loads = json.loads
+
+ENDPOINT = '/ngsi-ld/batch_forecast'
+PROPERTY_PREFIX = 'https://smartdatamodels.org/dataModel.Environment/'
+PROPERTIES_PER_ENTITY = 4
+SLOT = re.compile(r'"@@(\d+)@@"')
+# server settings that would otherwise throttle a single load-test client
+SERVER_ENV = {'ADMISSION_KEY_BUDGET': '0'}
+
+
+class Scenario:
+    """
+    One kind of batch: a payload whose first reading per series is a slot, so
+    ``body(n)`` renders a distinct but equally expensive request ``n``.
+    """
+
+    def __init__(self, name, entities, window):
+        self.name = name
+        self.window = window
+        self.series = 0
+        self.points = 0
+        self.firsts = []
+        for entity in entities:
+            for prop_uri in property_keys(entity):
+                batches = entity[prop_uri].get('values', []) if isinstance(entity[prop_uri], dict) else []
+                if not batches:
+                    continue
+                self.series += 1
+                self.points += sum(len(batch.get('values', [])) for batch in batches)
+                first = batches[0]['values'][0]
+                self.firsts.append(first['value'])
+                first['value'] = f"@@{len(self.firsts) - 1}@@"
+        self.parts = SLOT.split(dumps(entities))
+
+    def body(self, n):
+        out = []
+        for i, part in enumerate(self.parts):
+            out.append(part if i % 2 == 0 else _nudged(self.firsts[int(part)], n))
+        return ''.join(out).encode()
+
+
+def _nudged(value, n):
+    # JSON of ``value`` moved by a tiny, request-specific amount (strings stay strings)
+    try:
+        nudged = float(value) + n * 1e-6
+    except (TypeError, ValueError):
+        return dumps(value)
+    return dumps(repr(nudged) if isinstance(value, str) else nudged)
+
+
+def window_after(last, hours):
+    start = last.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return start, start + timedelta(hours=hours)
+
+
+def payload_scenarios(paths, horizons):
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            entities = json.load(f)
+        last = max(
+            parse_iso(point['observedAt'])
+            for entity in entities for prop_uri in property_keys(entity) if isinstance(entity[prop_uri], dict)
+            for batch in entity[prop_uri].get('values', []) for point in batch.get('values', [])
+        )
+        for hours in horizons:
+            yield Scenario(f"{os.path.basename(path)}/{hours}h", json.loads(json.dumps(entities)),
+                           window_after(last, hours))
+
+
+def synthetic_entities(series, points, interval_seconds, seed):
+    """Air-quality-like entities with up to PROPERTIES_PER_ENTITY properties read together, ending now."""
+    rng = np.random.RandomState(seed)
+    end = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    epochs = end.timestamp() - interval_seconds * np.arange(points - 1, -1, -1)
+    stamps = [datetime.fromtimestamp(t, timezone.utc).isoformat() for t in epochs]
+    daily = np.sin(2 * np.pi * epochs / 86400)
+    entities = []
+    for k in range(series):
+        if k % PROPERTIES_PER_ENTITY == 0:
+            entities.append({'id': f"urn:ngsi-ld:AirQualityObserved:loadtest-{series}-{points}-{k // PROPERTIES_PER_ENTITY}",
+                             'type': 'AirQualityObserved'})
+        values = np.round(20 + 5 * daily + rng.normal(0, 0.5, points) + k, 3)
+        entities[-1][f"{PROPERTY_PREFIX}p{k % PROPERTIES_PER_ENTITY}"] = {'type': 'Property', 'values': [
+            {'type': 'Property', 'values': [{'metadata': {}, 'value': float(v), 'observedAt': ts}]}
+            for v, ts in zip(values, stamps)
+        ]}
+    return entities, end
+
+
+def synthetic_scenarios(args):
+    for series, points in itertools.product(args.series, args.history):
+        entities, end = synthetic_entities(series, points, args.interval_seconds, args.seed)
+        for hours in args.horizons:
+            yield Scenario(f"synthetic:{series}x{points}/{hours}h", json.loads(json.dumps(entities)),
+                           window_after(end, hours))
+
+
+class RssSampler(threading.Thread):
+    """Samples the resident memory of a process and its descendants (Linux /proc)."""
+
+    def __init__(self, pid, period=0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.period = period
+        self.stopped = threading.Event()
+        self.reset()
+
+    def reset(self):
+        self.peak_total_mb = 0.0
+        self.peak_process_mb = 0.0
+
+    def run(self):
+        while not self.stopped.wait(self.period):
+            sizes = [_rss_mb(pid) for pid in _descendants(self.pid)]
+            sizes = [size for size in sizes if size is not None]
+            if sizes:
+                self.peak_total_mb = max(self.peak_total_mb, sum(sizes))
+                self.peak_process_mb = max(self.peak_process_mb, max(sizes))
+
+
+def _rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+def _descendants(root):
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # the command name may contain spaces; the parent pid follows its closing parenthesis
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+    found, frontier = {root}, [root]
+    while frontier:
+        pid = frontier.pop()
+        children = [child for child, parent in parents.items() if parent == pid]
+        found.update(children)
+        frontier.extend(children)
+    return found
+
+
+def start_server(args, port):
+    env = {**os.environ, **SERVER_ENV, 'PORT': str(port)}
+    env.update(item.split('=', 1) for item in args.env)
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join('src', 'gunicorn.conf.py')]
+    else:
+        command = [sys.executable, os.path.join('src', 'app.py')]
+    log = open(args.server_log, 'ab') if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with status {process.returncode} (see --server-log)")
+        try:
+            if requests.get(url + '/metrics', timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    sys.exit(f"Server did not answer within {args.startup_timeout}s")
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Client:
+    """Sends numbered requests of randomly chosen scenarios; one keep-alive session per thread."""
+
+    def __init__(self, url, api_key, scenarios, query, timeout, seed):
+        self.url = url + ENDPOINT
+        self.headers = {'X-API-KEY': api_key, 'Content-Type': 'application/json'}
+        self.scenarios = scenarios
+        self.query = query
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def next_request(self):
+        with self.lock:
+            return next(self.counter), self.rng.choice(self.scenarios)
+
+    def send(self, n, scenario, scheduled=None):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        start, end = scenario.window
+        params = f"timerel=between&time={start.isoformat()}&endTime={end.isoformat()}".replace('+00:00', 'Z')
+        body = scenario.body(n)
+        began = time.perf_counter() if scheduled is None else scheduled
+        record = {'scenario': scenario.name, 'series': scenario.series, 'points': scenario.points, 'trees': 0,
+                  'forecast_points': 0, 'bytes_sent': len(body)}
+        try:
+            response = session.post(f"{self.url}?{params}{'&' + self.query if self.query else ''}", data=body,
+                                    headers=self.headers, timeout=self.timeout)
+            content = response.content
+            record['latency_s'] = time.perf_counter() - began
+            record['status'] = response.status_code
+        except requests.RequestException as exc:
+            record['latency_s'] = time.perf_counter() - began
+            record['status'] = type(exc).__name__
+            return record
+        if response.status_code == 200:
+            for entity in loads(content):
+                for value in entity.values():
+                    if isinstance(value, dict) and 'forecastInfo' in value:
+                        record['trees'] += value['forecastInfo']['value'].get('trees') or 0
+                        record['forecast_points'] += len(value.get('values', []))
+        return record
+
+
+def closed_loop(client, concurrency, duration, max_requests):
+    # ``max_requests`` counts the requests of this step; the client's numbering,
+    # which makes requests unique, runs on across the warmup and all steps
+    records = []
+    deadline = time.perf_counter() + duration
+    taken = itertools.count()
+
+    def worker():
+        while time.perf_counter() < deadline:
+            if max_requests and next(taken) >= max_requests:
+                return
+            records.append(client.send(*client.next_request()))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+
+def open_loop(client, rate, duration, max_requests, max_inflight, seed):
+    # Poisson arrivals; latency counts from the scheduled arrival, so time spent
+    # waiting for a free client thread is not hidden
+    rng = random.Random(seed)
+    futures = []
+    began = time.perf_counter()
+    arrival = began
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        while not max_requests or len(futures) < max_requests:
+            arrival += rng.expovariate(rate)
+            if arrival - began >= duration:
+                break
+            n, scenario = client.next_request()
+            time.sleep(max(0.0, arrival - time.perf_counter()))
+            futures.append(pool.submit(client.send, n, scenario, arrival))
+    return [future.result() for future in futures]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def summarize(step, records, elapsed, sampler):
+    ok = [r for r in records if r['status'] == 200]
+    latencies = [r['latency_s'] for r in ok]
+    errors = {}
+    for r in records:
+        if r['status'] != 200:
+            errors[str(r['status'])] = errors.get(str(r['status']), 0) + 1
+    return {
+        'step': step,
+        'requests': len(records),
+        'ok': len(ok),
+        'errors': errors,
+        'error_rate': (len(records) - len(ok)) / len(records) if records else 0.0,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(ok) / elapsed if elapsed > 0 else 0.0,
+        'series_per_s': sum(r['series'] for r in ok) / elapsed if elapsed > 0 else 0.0,
+        'latency_s': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else None,
+        },
+        'peak_rss_mb': {
+            'total': sampler.peak_total_mb if sampler else None,
+            'largest_process': sampler.peak_process_mb if sampler else None,
+        },
+    }
+
+
+COST_TERMS = ('points', 'series', 'trees')
+
+
+def fit_cost_model(records):
+    """Least-squares fit of latency on an intercept and COST_TERMS; None with too few distinct requests."""
+    ok = [r for r in records if r['status'] == 200]
+    if len(ok) < len(COST_TERMS) + 2:
+        return None
+    x = np.array([[1.0] + [r[term] for term in COST_TERMS] for r in ok])
+    y = np.array([r['latency_s'] for r in ok])
+    coef, _, rank, _ = np.linalg.lstsq(x, y, rcond=None)
+    residual = y - x @ coef
+    total = float(((y - y.mean()) ** 2).sum())
+    return {
+        'coefficients': dict(zip(('intercept',) + COST_TERMS, map(float, coef))),
+        'r2': 1 - float((residual ** 2).sum()) / total if total > 0 else None,
+        'samples': len(ok),
+        'rank': int(rank),
+    }
+
+
+def capacity(model, records, slo_seconds):
+    """Latency of the largest batch the .env limits admit, and the history per series that meets the SLO."""
+    limits = dotenv_values(os.path.join(REPO_ROOT, '.env'))
+    try:
+        max_series = int(os.getenv('MAX_SERIES_PER_BATCH', limits.get('MAX_SERIES_PER_BATCH')))
+        max_points = int(os.getenv('MAX_TRAIN_POINTS', limits.get('MAX_TRAIN_POINTS')))
+    except (TypeError, ValueError):
+        return None
+    fitted = [r for r in records if r['status'] == 200 and r['trees'] > 0]
+    trees_per_series = (sum(r['trees'] for r in fitted) / sum(r['series'] for r in fitted)) if fitted else 0.0
+    c = model['coefficients']
+    fixed = c['intercept'] + c['series'] * max_series + c['trees'] * trees_per_series * max_series
+    points_for_slo = (slo_seconds - fixed) / (c['points'] * max_series) if c['points'] > 0 else math.inf
+    return {
+        'MAX_SERIES_PER_BATCH': max_series,
+        'MAX_TRAIN_POINTS': max_points,
+        'trees_per_series': trees_per_series,
+        'largest_batch_latency_s': fixed + c['points'] * max_points * max_series,
+        'slo_seconds': slo_seconds,
+        'points_per_series_within_slo': max(0, int(points_for_slo)) if math.isfinite(points_for_slo) else None,
+    }
+
+
+def environment(args):
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'server': 'external' if args.url else args.server,
+        'server_env': dict(SERVER_ENV, **dict(item.split('=', 1) for item in args.env)) if not args.url else None,
+        'query': args.query,
+    }
+
+
+def print_step(s):
+    lat = s['latency_s']
+    ms = {k: f"{v * 1e3:.0f}" if v is not None else '-' for k, v in lat.items()}
+    rss = s['peak_rss_mb']['total']
+    print(f"{s['step']:>14} {s['requests']:>6} {s['throughput_rps']:>8.2f} {s['series_per_s']:>9.1f} "
+          f"{ms['p50']:>8} {ms['p95']:>8} {ms['p99']:>8} {ms['max']:>8} {s['error_rate']:>7.1%} "
+          f"{f'{rss:.0f}' if rss else '-':>8}  {json.dumps(s['errors']) if s['errors'] else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load test and cost model of the batch forecast endpoint')
+    parser.add_argument('--url', help='test an already running server instead of starting one')
+    parser.add_argument('--pid', type=int, help='with --url, the server pid whose memory is sampled')
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='setting for the started server (repeatable), e.g. WEB_WORKERS=2')
+    parser.add_argument('--server-log', help='file receiving the output of the started server')
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--api-key', help='defaults to the first key of api_keys.txt')
+    parser.add_argument('--concurrency', type=int, nargs='+', help='closed-loop steps (default 1 2 4)')
+    parser.add_argument('--rate', type=float, nargs='+', help='open-loop steps, in requests per second')
+    parser.add_argument('--max-inflight', type=int, default=64, help='client threads of an open-loop step')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per step')
+    parser.add_argument('--requests', type=int, default=0, help='stop every step after this many requests')
+    parser.add_argument('--warmup', type=int, default=2, help='unrecorded requests before the first step')
+    parser.add_argument('--payloads', nargs='*', help='payload files (default example_payloads/payload*.json)')
+    parser.add_argument('--series', type=int, nargs='*', default=[1, 8, 32], help='series per synthetic batch')
+    parser.add_argument('--history', type=int, nargs='*', default=[672, 2688, 8064],
+                        help='readings per synthetic series')
+    parser.add_argument('--interval-seconds', type=int, default=900, help='interval of the synthetic readings')
+    parser.add_argument('--horizons', type=int, nargs='+', default=[24, 168], help='forecast windows, in hours')
+    parser.add_argument('--query', default='', help='extra query parameters, e.g. "auto_size=true&format=columnar"')
+    parser.add_argument('--timeout', type=float, default=600, help='client timeout per request')
+    parser.add_argument('--slo', type=float, default=30, help='latency target for the capacity estimate, seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='small mix and short steps, for a smoke run')
+    parser.add_argument('--output', default='loadtest_results.json')
+    args = parser.parse_args()
+    if args.quick:
+        args.series, args.history, args.horizons, args.duration = [1, 4], [672], [24], 10
+        args.payloads = args.payloads or [os.path.join(REPO_ROOT, 'example_payloads', 'payload_small.json')]
+        args.concurrency = args.concurrency or [1, 2]
+    if args.payloads is None:
+        args.payloads = sorted(
+            path for path in
+            (os.path.join(REPO_ROOT, 'example_payloads', name) for name in os.listdir(os.path.join(REPO_ROOT, 'example_payloads')))
+            if re.fullmatch(r'payload.*\.json', os.path.basename(path))
+        )
+    if args.rate:
+        steps = [('rate', rate) for rate in sorted(args.rate)]
+    else:
+        steps = [('concurrency', c) for c in sorted(args.concurrency or [1, 2, 4])]
+    api_key = args.api_key
+    if api_key is None:
+        with open(os.path.join(REPO_ROOT, 'api_keys.txt')) as f:
+            api_key = next(line.strip() for line in f if line.strip())
+
+    scenarios = list(payload_scenarios(args.payloads, args.horizons)) + list(synthetic_scenarios(args))
+    print(f"{len(scenarios)} scenarios:")
+    for s in scenarios:
+        print(f"  {s.name:40} series={s.series:<4} points={s.points:<8} body={len(s.body(0)) / 2**20:.1f}MB")
+
+    process = None
+    if args.url:
+        url, pid = args.url.rstrip('/'), args.pid
+    else:
+        process, url = start_server(args, free_port())
+        pid = process.pid
+    sampler = RssSampler(pid) if pid and os.path.isdir('/proc') else None
+    if sampler:
+        sampler.start()
+
+    client = Client(url, api_key, scenarios, args.query, args.timeout, args.seed)
+    summaries, step_records = [], []
+    try:
+        for _ in range(args.warmup):
+            client.send(*client.next_request())
+        print(f"\n{'step':>14} {'reqs':>6} {'req/s':>8} {'series/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'max ms':>8} {'errors':>7} {'rss MB':>8}")
+        for kind, level in steps:
+            if sampler:
+                sampler.reset()
+            began = time.perf_counter()
+            if kind == 'rate':
+                records = open_loop(client, level, args.duration, args.requests, args.max_inflight, args.seed)
+            else:
+                records = closed_loop(client, level, args.duration, args.requests)
+            summary = summarize(f"{kind}={level:g}", records, time.perf_counter() - began, sampler)
+            print_step(summary)
+            summaries.append(summary)
+            step_records.append(records)
+    finally:
+        if sampler:
+            sampler.stopped.set()
+        if process is not None:
+            stop_server(process)
+
+    model = fit_cost_model(step_records[0]) if step_records else None
+    plan = capacity(model, step_records[0], args.slo) if model else None
+    if model:
+        c = model['coefficients']
+        print(f"\nCost model ({summaries[0]['step']}, {model['samples']} requests, R^2={model['r2'] or 0:.3f}):")
+        print(f"  latency_s = {c['intercept']:.4f} + {c['points']:.3e} * points + {c['series']:.3e} * series"
+              f" + {c['trees']:.3e} * trees")
+        if model['rank'] < len(COST_TERMS) + 1:
+            print("  (the mix does not vary every term independently; add --series/--history values)")
+    if plan:
+        print(f"  largest batch admitted by .env ({plan['MAX_SERIES_PER_BATCH']} series x {plan['MAX_TRAIN_POINTS']}"
+              f" points, {plan['trees_per_series']:.0f} trees per series): ~{plan['largest_batch_latency_s']:.1f}s")
+        if plan['points_per_series_within_slo'] is not None:
+            print(f"  points per series for {plan['MAX_SERIES_PER_BATCH']} series within {args.slo:g}s:"
+                  f" ~{plan['points_per_series_within_slo']}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'environment': environment(args),
+            'scenarios': [{'name': s.name, 'series': s.series, 'points': s.points} for s in scenarios],
+            'steps': summaries,
+            'cost_model': model,
+            'capacity': plan,
+            'requests': [dict(r, step=s['step']) for s, records in zip(summaries, step_records) for r in records],
+        }, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from threading import Lock
+
+from flask import Flask, jsonify, request
+
+# Local stand-in for the NGSI-LD temporal API of a Context Broker, serving the
+# history of the example payloads, for trying out POST /ngsi-ld/pull_forecast.
+#
+# Usage (from the repository root):
+#   python testing/mock_broker.py                                # port 1026
+#   python testing/mock_broker.py --page-limit 50 --latency-ms 20
+#   BROKER_URL=http://localhost:1026 python src/app.py
+#
+# GET /ngsi-ld/v1/temporal/entities/<id>?timerel=between&timeAt=...&endTimeAt=...&attrs=...
+# answers with the entity in the normalized temporal representation. With
+# --page-limit, attributes with more instances are truncated and the answer is a
+# 206 with a date-time Content-Range, like brokers that cap temporal results.
+# GET /stats reports the requests served and the peak number of concurrent ones.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESERVED_KEYS = ('id', 'type', 'dateObserved', '@context')
+
+app = Flask(__name__)
+store = {}
+settings = {'page_limit': 0, 'latency': 0.0}
+counters = {'requests': 0, 'active': 0, 'peak': 0}
+lock = Lock()
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def load(paths):
+    """Temporal instances per entity and attribute, from payloads in the batch input format."""
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            entities = json.load(f)
+        for entity in entities:
+            if entity.get('id') in store:
+                continue
+            attrs = {}
+            for key, prop in entity.items():
+                if key in RESERVED_KEYS or not isinstance(prop, dict):
+                    continue
+                instances = [
+                    (parse_time(pt['observedAt']), {
+                        'type': 'Property', 'value': pt.get('value'), 'observedAt': pt['observedAt'],
+                        **pt.get('metadata', {})
+                    })
+                    for batch in prop.get('values', []) for pt in batch.get('values', []) if pt.get('observedAt')
+                ]
+                attrs[key] = sorted(instances, key=lambda item: item[0])
+            store[entity['id']] = {'type': entity.get('type'), '@context': entity.get('@context', []), 'attrs': attrs}
+
+
+@app.route('/ngsi-ld/v1/temporal/entities/<path:entity_id>', methods=['GET'])
+def temporal_entity(entity_id):
+    with lock:
+        counters['requests'] += 1
+        counters['active'] += 1
+        counters['peak'] = max(counters['peak'], counters['active'])
+    try:
+        if settings['latency']:
+            time.sleep(settings['latency'])
+        return query(entity_id)
+    finally:
+        with lock:
+            counters['active'] -= 1
+
+
+def query(entity_id):
+    entity = store.get(entity_id)
+    if entity is None:
+        return jsonify({'type': 'https://uri.etsi.org/ngsi-ld/errors/ResourceNotFound',
+                        'title': 'Entity not found', 'detail': entity_id}), 404
+
+    timerel = request.args.get('timerel')
+    time_at = parse_time(request.args['timeAt']) if request.args.get('timeAt') else None
+    end_time_at = parse_time(request.args['endTimeAt']) if request.args.get('endTimeAt') else None
+    attrs = [a for a in request.args.get('attrs', '').split(',') if a] or list(entity['attrs'])
+
+    def selected(t):
+        if timerel == 'between':
+            return time_at <= t < end_time_at
+        if timerel == 'before':
+            return t < time_at
+        if timerel == 'after':
+            return t >= time_at
+        return True
+
+    body = {'id': entity_id, 'type': entity['type']}
+    limit = settings['page_limit']
+    truncated = False
+    first = last = None
+    for attr in attrs:
+        items = [(t, item) for t, item in entity['attrs'].get(attr, []) if selected(t)]
+        if limit and len(items) > limit:
+            items = items[:limit]
+            truncated = True
+            last = items[-1][1]['observedAt'] if last is None or items[-1][0] < parse_time(last) else last
+        if items:
+            first = items[0][1]['observedAt'] if first is None or items[0][0] < parse_time(first) else first
+            body[attr] = [item for _, item in items]
+    if not truncated:
+        return jsonify(body)
+    response = jsonify(body)
+    response.status_code = 206
+    response.headers['Content-Range'] = f"date-time {first}-{last}/{limit}"
+    return response
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    with lock:
+        return jsonify({'requests': counters['requests'], 'peak_concurrency': counters['peak'], 'entities': len(store)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in NGSI-LD temporal API serving the example payloads.')
+    parser.add_argument('--port', type=int, default=1026)
+    parser.add_argument('--payload', action='append',
+                        help='payload file in the batch input format (repeatable; default example_payloads/payload.json)')
+    parser.add_argument('--page-limit', type=int, default=0,
+                        help='instances per attribute and answer before truncating with 206 (0 = no limit)')
+    parser.add_argument('--latency-ms', type=float, default=0, help='delay added to every answer')
+    args = parser.parse_args(argv)
+
+    load(args.payload or [os.path.join(REPO_ROOT, 'example_payloads', 'payload.json')])
+    settings['page_limit'] = args.page_limit
+    settings['latency'] = args.latency_ms / 1000
+    print(f"Serving {len(store)} entities on port {args.port}", file=sys.stderr)
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import admission as admission_module
+from admission import AdmissionController, AdmissionRejected, series_cost
+
+# ADMISSION_KEY_BUDGET and ADMISSION_INFLIGHT_BUDGET: requests are charged their
+# estimated cost against a refilling bucket per API key (429) and against the cost
+# of all running requests (503), with Retry-After telling clients when to retry.
+
+WINDOW = 'timerel=between&time=2025-07-20T00:00:00Z&endTime=2025-07-21T00:00:00Z'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission_module, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_series_cost_grows_with_rows_points_and_trees():
+    assert series_cost(0, 0, 300) == 1.0
+    assert series_cost(1000, 0, 300) == 2.0
+    assert series_cost(1000, 0, 600) > series_cost(1000, 96, 300) > series_cost(1000, 0, 300)
+
+
+def test_key_budget_rejects_with_retry_after_and_refills(clock):
+    admission = AdmissionController(key_budget=60, inflight_budget=0)
+    admission.admit('k', 50)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit('k', 20)
+    assert rejected.value.status == 429
+    assert rejected.value.reason == 'key_budget'
+    # 10 tokens missing at a refill of one per second
+    assert rejected.value.retry_after == 10
+    # other keys have their own bucket
+    admission.admit('other', 60)
+    clock[0] += 10
+    admission.admit('k', 20)
+
+
+def test_request_over_key_budget_is_charged_the_whole_budget(clock):
+    admission = AdmissionController(key_budget=60, inflight_budget=0)
+    admission.admit('k', 500)
+    with pytest.raises(AdmissionRejected):
+        admission.admit('k', 1)
+    clock[0] += 60
+    admission.admit('k', 500)
+
+
+def test_inflight_budget_rejects_while_others_run():
+    admission = AdmissionController(key_budget=0, inflight_budget=100)
+    first = admission.admit('a', 70)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit('b', 40)
+    assert rejected.value.status == 503
+    assert rejected.value.reason == 'inflight'
+    # a rejected request holds nothing
+    assert admission.inflight == 70
+    admission.release(first)
+    # alone, a request over the budget is admitted and charged the budget
+    assert admission.admit('b', 400) == admission.inflight == 100
+
+
+def test_background_jobs_are_not_charged_in_flight():
+    admission = AdmissionController(key_budget=100, inflight_budget=10)
+    admission.admit('a', 10)
+    assert admission.admit('a', 50, inflight=False) == 0
+    assert admission.inflight == 10
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit('a', 50, inflight=False)
+    assert rejected.value.reason == 'key_budget'
+
+
+def post(client, headers, payload):
+    response = client.post(f'/ngsi-ld/batch_forecast?{WINDOW}', data=json.dumps(payload),
+                           headers={**headers, 'Content-Type': 'application/json'})
+    response.close()
+    return response
+
+
+def test_endpoint_answers_429_once_the_key_budget_is_spent(client, headers, payload, service, monkeypatch):
+    admission = AdmissionController(key_budget=10, inflight_budget=0)
+    monkeypatch.setattr(service, 'admission', admission)
+    admission.admit(headers['X-API-KEY'], 10)
+    response = post(client, headers, payload[:2])
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert 'budget of this API key' in response.get_json()['error']
+
+
+def test_endpoint_answers_503_while_the_inflight_budget_is_taken(client, headers, payload, service, monkeypatch):
+    admission = AdmissionController(key_budget=0, inflight_budget=5)
+    monkeypatch.setattr(service, 'admission', admission)
+    held = admission.admit('another-key', 5)
+    response = post(client, headers, payload[:2])
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(admission.retry_after_seconds)
+    admission.release(held)
+    assert post(client, headers, payload[:2]).status_code == 200
+    # the finished request gave its cost back
+    assert admission.inflight == 0
@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+
+import pytest
+
+from coalesce import SingleFlight, canonical_fingerprint
+
+# Identical batches (request_flights) and series (series_flights) are computed
+# once for all concurrent callers and, for RESULT_CACHE_TTL_SECONDS, for repeats.
+
+WINDOW = 'timerel=between&time=2025-07-20T00:00:00Z&endTime=2025-07-21T00:00:00Z'
+
+
+def test_fingerprint_ignores_key_order():
+    assert canonical_fingerprint({'a': 1, 'b': [1, 2]}) == canonical_fingerprint({'b': [1, 2], 'a': 1})
+    assert canonical_fingerprint({'a': 1}) != canonical_fingerprint({'a': 2})
+
+
+def test_concurrent_callers_share_one_computation():
+    flights = SingleFlight(ttl_seconds=0)
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.run('k', compute)))
+    leader.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(flights.run('k', compute))) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    while flights.joined < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == [('result', False)] + [('result', True)] * 3
+    # without a TTL nothing is kept
+    assert flights.stats()['results'] == 0
+
+
+def test_failures_are_not_shared():
+    flights = SingleFlight(ttl_seconds=60)
+    flight, leader = flights.claim('k')
+    assert leader
+    waiter_result = []
+    waiter = threading.Thread(target=lambda: waiter_result.append(flights.run('k', lambda: 'own')))
+    waiter.start()
+    while flights.joined < 1:
+        time.sleep(0.001)
+    flights.publish('k', flight, error=RuntimeError('leader failed'))
+    waiter.join()
+    # the waiter computed its own result, which is cached for repeats
+    assert waiter_result == [('own', False)]
+    assert flights.run('k', lambda: 'again') == ('own', True)
+
+
+def test_results_are_cached_for_the_ttl_in_a_bounded_lru():
+    flights = SingleFlight(ttl_seconds=60, max_entries=2)
+    for key in ('a', 'b'):
+        flights.run(key, lambda key=key: key)
+    assert flights.run('a', lambda: 'recomputed') == ('a', True)
+    flights.run('c', lambda: 'c')
+    # 'b' was the least recently used
+    assert flights.run('b', lambda: 'recomputed') == ('recomputed', False)
+    assert flights.cached == 1
+
+
+def test_expired_results_are_recomputed():
+    flights = SingleFlight(ttl_seconds=0.01)
+    flights.run('k', lambda: 1)
+    time.sleep(0.02)
+    assert flights.run('k', lambda: 2) == (2, False)
+
+
+def post(client, headers, payload, query=''):
+    response = client.post(f'/ngsi-ld/batch_forecast?{WINDOW}{query}', data=json.dumps(payload),
+                           headers={**headers, 'Content-Type': 'application/json'})
+    response.close()
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_repeated_batch_is_served_from_the_result_cache(client, headers, payload, service, monkeypatch):
+    flights = SingleFlight(ttl_seconds=60)
+    monkeypatch.setattr(service, 'request_flights', flights)
+    first = post(client, headers, payload[:2])
+    # same payload, other key order
+    reordered = [dict(reversed(list(entity.items()))) for entity in payload[:2]]
+    assert post(client, headers, reordered) == first
+    assert flights.cached == 1
+    # other options are another request
+    post(client, headers, payload[:2], '&fast_path=false')
+    assert flights.cached == 1
+
+
+def forecast_properties(entity):
+    return [key for key, value in entity.items()
+            if key != 'dateObserved' and isinstance(value, dict) and 'values' in value]
+
+
+def test_series_repeated_in_a_batch_are_forecast_once(client, headers, payload, service, monkeypatch):
+    flights = SingleFlight(ttl_seconds=60)
+    monkeypatch.setattr(service, 'series_flights', flights)
+    first, second = post(client, headers, [payload[0], payload[0]])
+    assert forecast_properties(first)
+    # joined while running ahead on a pool, or served from the cache right after
+    assert flights.joined + flights.cached == len(forecast_properties(first))
+    assert first == second
+
+
+def test_series_of_another_batch_are_served_from_the_series_cache(client, headers, payload, service, monkeypatch):
+    flights = SingleFlight(ttl_seconds=60)
+    monkeypatch.setattr(service, 'series_flights', flights)
+    (alone,) = post(client, headers, payload[:1])
+    batch = post(client, headers, payload[:3])
+    assert flights.cached == len(forecast_properties(alone))
+    assert batch[0] == alone
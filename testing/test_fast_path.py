@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecaster import classify_series, closed_form_forecast, forecast_xgb_timeseries
+
+# fast_path=true: trivial series (constant, round-off noise, too short, sparse or
+# few-valued) get a closed-form forecast instead of a model, while real signals,
+# also small ones on a high level, still go to XGBoost.
+
+PERIOD = ['2025-07-11T00:00:00+00:00', '2025-07-12T00:00:00+00:00']
+
+
+def series(values, freq='h', observed=None):
+    index = pd.date_range('2025-07-01', periods=len(values), freq=freq, tz='UTC')
+    df = pd.DataFrame({'value': np.asarray(values, dtype=float)}, index=index)
+    if observed is not None:
+        df.attrs['observed'] = observed
+    return df
+
+
+def daily(hours, level=20.0, amplitude=5.0):
+    rng = np.random.default_rng(0)
+    return level + amplitude * np.sin(np.arange(hours) * 2 * np.pi / 24) + rng.normal(0, amplitude / 10, hours)
+
+
+@pytest.mark.parametrize('values, method', [
+    ([7.0] * 48, 'last_value'),
+    (daily(8), 'last_value'),
+    (1013.25 + np.tile([0.0, 1e-10], 24), 'mean'),
+    (np.tile([0.0, 1e-12], 24), 'mean'),
+    (np.tile([1.0, 2.0, 3.0], 16), 'seasonal_naive'),
+    (np.tile([1.0, 2.0], 8), 'mean'),
+    (daily(240), None),
+    # air pressure: a real daily cycle of half a hPa on a high level
+    (daily(240, level=1013.0, amplitude=0.5), None),
+])
+def test_classify_series(values, method):
+    assert classify_series(series(values)) == method
+
+
+def test_mostly_interpolated_series_is_seasonal_naive():
+    observed = np.zeros(240, dtype=bool)
+    observed[::24] = True
+    assert classify_series(series(daily(240), observed=observed)) == 'seasonal_naive'
+
+
+def test_seasonal_naive_repeats_the_last_day():
+    df = series(daily(72))
+    idx = pd.date_range('2025-07-04', periods=48, freq='h', tz='UTC')
+    np.testing.assert_allclose(closed_form_forecast(df, idx, 'seasonal_naive'), np.tile(df['value'].values[-24:], 2))
+    np.testing.assert_array_equal(closed_form_forecast(df, idx, 'last_value'), df['value'].values[-1])
+    with pytest.raises(ValueError):
+        closed_form_forecast(df, idx, 'unknown')
+
+
+def forecast(values, fast_path, model_size_modulator=0.2):
+    df = series(values)
+    return forecast_xgb_timeseries({'timestamp': df.index, 'value': df['value'].values}, PERIOD, 3600,
+                                   model_size_modulator=model_size_modulator, fast_path=fast_path)
+
+
+def test_trivial_series_skips_the_model_unless_disabled():
+    fast = forecast([7.0] * 240, fast_path=True)
+    assert (fast.attrs['path'], fast.attrs['trees_trained']) == ('last_value', 0)
+    np.testing.assert_array_equal(fast['forecast'].values, 7.0)
+    slow = forecast([7.0] * 240, fast_path=False)
+    assert (slow.attrs['path'], slow.attrs['trees_trained']) == ('xgboost', 20)
+    assert len(slow) == len(fast)
+
+
+def test_small_signal_on_a_high_level_is_not_flattened():
+    out = forecast(daily(240, level=1013.0, amplitude=0.5), fast_path=True, model_size_modulator=3.0)
+    assert out.attrs['path'] == 'xgboost'
+    assert np.ptp(out['forecast'].values) > 0.5
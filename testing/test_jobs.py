@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+
+import pytest
+from werkzeug.exceptions import BadRequest
+
+import jobs
+from jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JobQueue, QueueFull
+
+# POST /ngsi-ld/jobs: batches run in a bounded background queue whose jobs and
+# results are kept in JOB_STORE_DIR, so every worker sharing it can report them.
+
+WINDOW = 'timerel=between&time=2025-07-20T00:00:00Z&endTime=2025-07-21T00:00:00Z'
+
+
+def wait(queue, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job.status in (JOB_SUCCEEDED, JOB_FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_job_result_and_failures(tmp_path):
+    queue = JobQueue(store_dir=str(tmp_path))
+    assert wait(queue, queue.submit(lambda x: {'twice': 2 * x}, 21).id).result == {'twice': 42}
+
+    def invalid():
+        raise BadRequest('bad input')
+
+    failed = wait(queue, queue.submit(invalid).id)
+    assert (failed.status, failed.error, failed.error_status) == (JOB_FAILED, 'bad input', 400)
+
+    def broken():
+        raise ValueError('broken')
+
+    failed = wait(queue, queue.submit(broken).id)
+    assert (failed.error, failed.error_status) == ('broken', None)
+
+
+def test_queue_is_bounded():
+    queue = JobQueue(workers=1, max_depth=2)
+    release = threading.Event()
+    running = queue.submit(release.wait, 5)
+    queued = queue.submit(lambda: 'queued')
+    with pytest.raises(QueueFull):
+        queue.submit(lambda: 'one too many')
+    assert queue.get(queued.id).status == JOB_QUEUED
+    release.set()
+    wait(queue, running.id)
+    assert wait(queue, queued.id).result == 'queued'
+    assert queue.pending == 0
+
+
+def test_jobs_are_reported_by_every_queue_sharing_the_store(tmp_path):
+    submitting, other = JobQueue(store_dir=str(tmp_path)), JobQueue(store_dir=str(tmp_path))
+    release = threading.Event()
+    job = submitting.submit(lambda: release.wait(5) and {'value': 1}, owner='key')
+    while other.get(job.id).status != JOB_RUNNING:
+        time.sleep(0.01)
+    release.set()
+    wait(submitting, job.id)
+    seen = other.get(job.id)
+    assert (seen.status, seen.owner, seen.result) == (JOB_SUCCEEDED, 'key', {'value': 1})
+    assert other.get('0' * 32) is None
+    assert other.get('../not-a-job') is None
+
+
+def test_job_of_an_exited_process_is_reported_failed(tmp_path):
+    queue = JobQueue(store_dir=str(tmp_path))
+    job = jobs.Job(owner='key')
+    job.status, job.pid = JOB_RUNNING, 2 ** 22 + 1
+    queue._save(job)
+    seen = JobQueue(store_dir=str(tmp_path)).get(job.id)
+    assert seen.status == JOB_FAILED
+    assert 'exited' in seen.error
+
+
+def test_finished_jobs_expire(tmp_path):
+    queue = JobQueue(store_dir=str(tmp_path), result_ttl_seconds=0.05)
+    job = wait(queue, queue.submit(lambda: 'done').id)
+    time.sleep(0.1)
+    assert queue.get(job.id) is None
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.fixture
+def job_queue(service, tmp_path, monkeypatch):
+    queue = JobQueue(workers=1, max_depth=1, store_dir=str(tmp_path))
+    monkeypatch.setattr(service, 'job_queue', queue)
+    return queue
+
+
+def test_job_endpoint_returns_the_batch_result(client, headers, payload, job_queue, service, monkeypatch):
+    monkeypatch.setattr(service, 'VALID_KEYS', service.VALID_KEYS | {'another-key'})
+    body = json.dumps(payload[:2])
+    post_headers = {**headers, 'Content-Type': 'application/json'}
+    expected = client.post(f'/ngsi-ld/batch_forecast?{WINDOW}', data=body, headers=post_headers).get_json()
+
+    response = client.post(f'/ngsi-ld/jobs?{WINDOW}', data=body, headers=post_headers)
+    assert response.status_code == 202
+    location = response.headers['Location']
+    assert location == f"/ngsi-ld/jobs/{response.get_json()['jobId']}"
+    wait(job_queue, response.get_json()['jobId'])
+    assert client.get(location, headers=headers).get_json()['status'] == JOB_SUCCEEDED
+    assert client.get(location + '/result', headers=headers).get_json() == expected
+    # jobs are visible to the key that submitted them only
+    assert client.get(location, headers={'X-API-KEY': 'another-key'}).status_code == 404
+
+
+def test_job_endpoint_rejects_invalid_input_and_a_full_queue(client, headers, payload, job_queue):
+    post_headers = {**headers, 'Content-Type': 'application/json'}
+    assert client.post(f'/ngsi-ld/jobs?{WINDOW}', data='{', headers=post_headers).status_code == 400
+    release = threading.Event()
+    job_queue.submit(release.wait, 5)
+    try:
+        response = client.post(f'/ngsi-ld/jobs?{WINDOW}', data=json.dumps(payload[:1]), headers=post_headers)
+        assert response.status_code == 503
+        assert 'Retry-After' in response.headers
+    finally:
+        release.set()
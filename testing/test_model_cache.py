@@ -0,0 +1,83 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecaster import forecast_xgb_timeseries
+import model_cache
+from model_cache import ModelCache, series_fingerprint
+
+# MODEL_CACHE_SIZE: a repeated forecast of an unchanged history reuses the model
+# trained for it and only predicts.
+
+PERIOD = ['2025-07-11T00:00:00+00:00', '2025-07-12T00:00:00+00:00']
+
+
+def history(days=10, seed=0):
+    index = pd.date_range('2025-07-01', periods=days * 24, freq='h', tz='UTC')
+    rng = np.random.default_rng(seed)
+    values = 20 + 5 * np.sin(np.arange(len(index)) * 2 * np.pi / 24) + rng.normal(0, 0.5, len(index))
+    return {'timestamp': index, 'value': values}
+
+
+def forecast(data, cache, series_key=('urn:e', 'temperature'), **options):
+    return forecast_xgb_timeseries(data, PERIOD, 3600, model_size_modulator=0.5, fast_path=False,
+                                   model_cache=cache, series_key=series_key, **options)
+
+
+def test_unchanged_history_reuses_the_model():
+    cache = ModelCache(max_entries=8)
+    first = forecast(history(), cache)
+    second = forecast(history(), cache)
+    assert (first.attrs['trees_trained'], second.attrs['trees_trained']) == (50, 0)
+    pd.testing.assert_frame_equal(first, second)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize('change', ['data', 'series', 'options'])
+def test_any_change_trains_a_new_model(change):
+    cache = ModelCache(max_entries=8)
+    forecast(history(), cache)
+    if change == 'data':
+        out = forecast(history(seed=1), cache)
+    elif change == 'series':
+        out = forecast(history(), cache, series_key=('urn:e', 'humidity'))
+    else:
+        out = forecast(history(), cache, auto_size=True)
+    assert out.attrs['trees_trained'] > 0
+    assert cache.hits == 0
+
+
+def test_fingerprint_covers_identity_data_interval_and_options():
+    data = history()
+    index, values = data['timestamp'], data['value']
+    key = series_fingerprint(('e', 'p'), index, values, 3600, {'n_estimators': 50})
+    assert key == series_fingerprint(['e', 'p'], index, values.copy(), 3600, {'n_estimators': 50})
+    assert key != series_fingerprint(('e', 'q'), index, values, 3600, {'n_estimators': 50})
+    assert key != series_fingerprint(('e', 'p'), index, values + 1e-9, 3600, {'n_estimators': 50})
+    assert key != series_fingerprint(('e', 'p'), index, values, 900, {'n_estimators': 50})
+    assert key != series_fingerprint(('e', 'p'), index, values, 3600, {'n_estimators': 51})
+
+
+def test_cache_evicts_least_recently_used_and_expired_models(monkeypatch):
+    cache = ModelCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.evictions == 1
+
+    stored = time.monotonic()
+    monkeypatch.setattr(model_cache, 'time', SimpleNamespace(monotonic=lambda: stored + 61))
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 1
+
+
+def test_disabled_cache_keeps_nothing():
+    cache = ModelCache(max_entries=0)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert (cache.hits, cache.misses) == (0, 0)
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from broker import BrokerClient, BrokerError
+
+# Pull mode reads histories from a broker before anything is validated, so the
+# history window, the number of entities and the readings of a slice are capped
+# and an oversized pull is refused with 400 without (or before many) broker
+# requests.
+
+WINDOW = 'timerel=between&time=2025-07-20T00:00:00Z&endTime=2025-07-21T00:00:00Z'
+
+
+def pull_body(payload, **extra):
+    return {'entities': [{'id': entity['id'], '@context': entity.get('@context', [])} for entity in payload], **extra}
+
+
+def test_history_window_over_cap_is_refused_without_broker_requests(client, headers, payload, broker):
+    before = broker.requests
+    response = client.post(f'/ngsi-ld/pull_forecast?{WINDOW}', headers=headers, json=pull_body(
+        payload, historyStart='2000-01-01T00:00:00Z', historyEnd='2030-01-01T00:00:00Z'))
+    assert response.status_code == 400
+    assert b'History window too long' in response.data
+    assert broker.requests == before
+
+
+def test_too_many_entities_are_refused_without_broker_requests(client, headers, payload, broker, service):
+    before = broker.requests
+    entities = payload * (service.MAX_SERIES_PER_BATCH // len(payload) + 1)
+    response = client.post(f'/ngsi-ld/pull_forecast?{WINDOW}', headers=headers, json=pull_body(entities))
+    assert response.status_code == 400
+    assert b'Too many entities' in response.data
+    assert broker.requests == before
+
+
+def test_slice_over_reading_cap_stops_paging(broker, payload):
+    import mock_broker
+    client = BrokerClient(broker.base_url, max_points=20, slice_seconds=0)
+    mock_broker.settings['page_limit'] = 5
+    try:
+        with pytest.raises(BrokerError) as failed:
+            client.fetch_entities([{'id': payload[0]['id']}], datetime(2025, 1, 1, tzinfo=timezone.utc),
+                                  datetime(2025, 7, 20, tzinfo=timezone.utc))
+    finally:
+        mock_broker.settings['page_limit'] = 0
+    assert failed.value.status == 400
+    assert 'more than 20 readings' in failed.value.message
+    assert client.requests <= 5
@@ -0,0 +1,105 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from resample import interpolate_gaps, resample_mean
+
+# Regression tests for the fast paths that must not change forecasts: NumPy
+# resampling against pandas, streamed against buffered bodies and responses, and
+# pull mode (history read from a broker) against the same history posted. Outputs
+# are compared whole, forecastInfo (path, trees, autoSized) included.
+
+WINDOW = 'timerel=between&time=2025-07-20T00:00:00Z&endTime=2025-07-21T00:00:00Z'
+
+
+def post(client, headers, query, body, content_type='application/json'):
+    response = client.post(f'/ngsi-ld/batch_forecast?{WINDOW}{query}', data=body,
+                           headers={**headers, 'Content-Type': content_type})
+    data = response.data
+    response.close()
+    assert response.status_code == 200, data[:300]
+    if 'stream=ndjson' in query:
+        return [json.loads(line) for line in data.splitlines()]
+    return json.loads(data)
+
+
+@pytest.fixture(scope='module')
+def reference(client, headers, payload):
+    return post(client, headers, '', json.dumps(payload))
+
+
+# NumPy resampling
+
+def pandas_resample(epoch_ns, values, interval_seconds):
+    index = pd.DatetimeIndex(epoch_ns, tz='UTC')
+    frame = pd.DataFrame(values.reshape(len(values), -1), index=index).resample(f'{interval_seconds}S').mean()
+    return frame.index[0].value, frame.values, frame.interpolate().values
+
+
+@pytest.mark.parametrize('interval_seconds', [60, 900, 3600, 86400])
+@pytest.mark.parametrize('columns', [1, 3])
+def test_resample_matches_pandas(interval_seconds, columns):
+    rng = np.random.default_rng(interval_seconds + columns)
+    start = pd.Timestamp('2025-03-28T13:17:42Z').value
+    # irregular readings with duplicates, bursts and gaps several bins long
+    steps = rng.choice([0, 1, 17, 60, 600, 3599, 7 * 3600], size=3000, p=[.05, .1, .2, .3, .2, .1, .05])
+    epoch_ns = start + np.cumsum(steps).astype(np.int64) * 10**9
+    values = rng.normal(1013.0, 5.0, size=(len(epoch_ns), columns))
+    if columns == 1:
+        values = values[:, 0]
+
+    start_ns, means = resample_mean(epoch_ns, values, interval_seconds * 10**9)
+    expected_start, expected_means, expected_filled = pandas_resample(epoch_ns, values, interval_seconds)
+
+    assert start_ns == expected_start
+    means = means.reshape(len(means), -1)
+    np.testing.assert_array_equal(means, expected_means)
+    np.testing.assert_array_equal(interpolate_gaps(means), expected_filled)
+
+
+def test_resample_regular_input_matches_pandas():
+    epoch_ns = pd.date_range('2025-07-01', periods=500, freq='15min', tz='UTC').asi8
+    values = np.sin(np.arange(500) / 7.0)
+    start_ns, means = resample_mean(epoch_ns, values, 900 * 10**9)
+    expected_start, expected_means, _ = pandas_resample(epoch_ns, values, 900)
+    assert start_ns == expected_start
+    np.testing.assert_array_equal(means, expected_means[:, 0])
+
+
+# Streamed bodies and responses
+
+@pytest.mark.parametrize('body_format', ['array', 'stream_input', 'ndjson'])
+@pytest.mark.parametrize('stream', ['', 'json', 'ndjson'])
+def test_streamed_output_matches_buffered(client, headers, payload, reference, body_format, stream):
+    query = f'&stream={stream}' if stream else ''
+    if body_format == 'ndjson':
+        body, content_type = '\n'.join(json.dumps(entity) for entity in payload), 'application/x-ndjson'
+    else:
+        body, content_type = json.dumps(payload), 'application/json'
+        if body_format == 'stream_input':
+            query += '&stream_input=true'
+    if body_format == 'array' and not stream:
+        pytest.skip('the reference itself')
+    assert post(client, headers, query, body, content_type) == reference
+
+
+@pytest.mark.parametrize('option', ['&entity_model=true', '&global_model=true'])
+def test_streamed_output_matches_buffered_with_grouped_models(client, headers, payload, option):
+    expected = post(client, headers, option, json.dumps(payload))
+    ndjson = '\n'.join(json.dumps(entity) for entity in payload)
+    assert post(client, headers, option + '&stream=ndjson', ndjson, 'application/x-ndjson') == expected
+
+
+# Pull mode
+
+def test_pull_matches_push(client, headers, payload, reference, broker):
+    body = {'entities': [{
+        'id': entity['id'],
+        'attrs': [key for key in entity if key not in ('id', 'type', '@context', 'dateObserved')],
+        '@context': entity.get('@context', [])
+    } for entity in payload]}
+    response = client.post(f'/ngsi-ld/pull_forecast?{WINDOW}', json=body, headers=headers)
+    assert response.status_code == 200, response.data[:300]
+    assert response.get_json() == reference
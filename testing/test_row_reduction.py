@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecaster import REDUCE_MIN_TIER_ROWS, reduce_training_rows
+
+# MAX_FIT_ROWS: long histories are reduced to at most the cap, newest rows at full
+# resolution and older ones averaged into coarser bins that still cover all of it.
+
+
+def ramp(n):
+    # row i holds the value i, so an averaged row holds the midpoint of its bin
+    index = pd.date_range('2025-01-01', periods=n, freq='15min', tz='UTC')
+    return pd.DataFrame({'value': np.arange(n, dtype=float)}, index=index)
+
+
+def bins(reduced):
+    # (first, last) rows of the bins behind the reduced rows, rebuilt from their
+    # midpoints: bins are consecutive and start at the oldest row
+    first, spans = 0, []
+    for midpoint in reduced['value'].values:
+        last = int(round(2 * midpoint)) - first
+        spans.append((first, last))
+        first = last + 1
+    return spans
+
+
+@pytest.mark.parametrize('n, cap', [
+    (100000, 99999), (1001, 1000), (100000, 50000), (1000000, 5000), (10**6, 99999), (1000, 100),
+])
+def test_reduction_covers_history_within_cap(n, cap):
+    df = ramp(n)
+    reduced = reduce_training_rows(df, cap)
+    assert len(reduced) <= cap
+    spans = bins(reduced)
+    assert all(last >= first for first, last in spans)
+    assert spans[-1][1] == n - 1
+    # rows sit at the midpoints of their bins
+    offsets = (reduced.index.asi8 - df.index.asi8[0]) / (900 * 10**9)
+    np.testing.assert_allclose(offsets, reduced['value'].values)
+
+
+def test_history_just_above_cap_loses_only_rows_over_it():
+    reduced = reduce_training_rows(ramp(100000), 99999)
+    assert len(reduced) == 99999
+    spans = bins(reduced)
+    # a single bin of two rows, at the oldest end
+    assert [last - first + 1 for first, last in spans].count(2) == 1
+    assert spans[0] == (0, 1)
+
+
+def test_newest_half_of_cap_keeps_full_resolution():
+    df = ramp(50000)
+    reduced = reduce_training_rows(df, 4000)
+    assert len(reduced) == 4000
+    pd.testing.assert_frame_equal(reduced.iloc[-2000:], df.iloc[-2000:], check_freq=False)
+    # bins get coarser towards the past
+    sizes = [last - first + 1 for first, last in bins(reduced)]
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_history_within_cap_is_unchanged():
+    df = ramp(2 * REDUCE_MIN_TIER_ROWS)
+    assert reduce_training_rows(df, len(df)) is df
@@ -0,0 +1,128 @@
+import copy
+import json
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+# Streamed request bodies (NDJSON, or a JSON array with stream_input=true) are
+# forecast while they are read: a later entity that is invalid or over budget must
+# still fail the request with its status, or close a streamed response with an
+# error object once entities have been written.
+
+WINDOW = 'timerel=between&time=2025-07-20T00:00:00Z&endTime=2025-07-21T00:00:00Z'
+
+
+def invalid(entity):
+    entity = copy.deepcopy(entity)
+    entity['id'] += ':invalid'
+    prop = next(key for key, value in entity.items() if isinstance(value, dict) and 'values' in value)
+    entity[prop]['values'][3]['values'][0]['observedAt'] = 'not-a-time'
+    return entity
+
+
+def post_ndjson(client, headers, entities, query=''):
+    body = '\n'.join(json.dumps(entity) for entity in entities)
+    response = client.post(f'/ngsi-ld/batch_forecast?{WINDOW}{query}', data=body,
+                           headers={**headers, 'Content-Type': 'application/x-ndjson'})
+    data = response.data
+    response.close()
+    return response.status_code, data
+
+
+def test_invalid_later_entity_fails_buffered_response(client, headers, payload):
+    status, data = post_ndjson(client, headers, payload[:3] + [invalid(payload[3])])
+    assert status == 400
+    assert b'not-a-time' in data
+
+
+def test_invalid_entity_read_ahead_fails_before_streaming(client, headers, payload):
+    status, data = post_ndjson(client, headers, [payload[0], invalid(payload[1])] + payload[2:4], '&stream=ndjson')
+    assert status == 400
+    assert b'not-a-time' in data
+
+
+def test_invalid_entity_after_first_closes_ndjson_stream_with_error(client, headers, payload):
+    status, data = post_ndjson(client, headers, payload[:4] + [invalid(payload[4])], '&stream=ndjson')
+    lines = [json.loads(line) for line in data.splitlines()]
+    assert status == 200
+    assert [entity['id'] for entity in lines[:-1]] == [entity['id'] for entity in payload[:len(lines) - 1]]
+    assert lines[-1]['status'] == 400
+    assert 'not-a-time' in lines[-1]['error']
+
+
+def test_invalid_entity_after_first_closes_json_stream_with_error(client, headers, payload):
+    status, data = post_ndjson(client, headers, payload[:4] + [invalid(payload[4])], '&stream=json')
+    entities = json.loads(data)
+    assert status == 200
+    assert entities[-1]['status'] == 400
+    assert all('id' in entity for entity in entities[:-1])
+
+
+def entity_costs(service, entities):
+    with service.app.test_request_context(f'/ngsi-ld/batch_forecast?{WINDOW}'):
+        opts = service.batch_options()
+        return [service.plan_entity(entity, opts, [], [])[1] for entity in entities]
+
+
+@pytest.fixture
+def spent_key(service, headers, payload, monkeypatch):
+    # a key with the cost of four entities and a half left
+    admission = AdmissionController(key_budget=1000, inflight_budget=0)
+    monkeypatch.setattr(service, 'admission', admission)
+    costs = entity_costs(service, payload[:5])
+    admission.admit(headers['X-API-KEY'], 1000 - sum(costs[:4]) - costs[4] / 2)
+    return admission
+
+
+def test_later_entities_over_key_budget_stop_stream(client, headers, payload, spent_key):
+    status, data = post_ndjson(client, headers, payload[:6], '&stream=ndjson')
+    lines = [json.loads(line) for line in data.splitlines()]
+    assert status == 200
+    # entities read ahead on a pool may stop the stream before all four are written
+    assert 1 <= len(lines) - 1 <= 4
+    assert [entity['id'] for entity in lines[:-1]] == [entity['id'] for entity in payload[:len(lines) - 1]]
+    assert lines[-1]['status'] == 429
+    assert lines[-1]['retryAfter'] >= 1
+    assert spent_key.inflight == 0
+
+
+def test_later_entities_over_key_budget_fail_buffered_response(client, headers, payload, spent_key):
+    status, data = post_ndjson(client, headers, payload[:6])
+    assert status == 429
+    assert b'budget of this API key' in data
+
+
+def test_extend_charges_key_like_a_new_request():
+    admission = AdmissionController(key_budget=10, inflight_budget=0)
+    admission.admit('k', 5)
+    admission.admit('k', 2)
+    admission.extend('k', 2, 2, 0)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.extend('k', 2, 4, 0)
+    assert rejected.value.status == 429
+    assert rejected.value.reason == 'key_budget'
+
+
+def test_extend_rejects_past_inflight_budget_of_other_requests():
+    admission = AdmissionController(key_budget=0, inflight_budget=10)
+    other = admission.admit('a', 6)
+    charged = admission.admit('b', 2)
+    charged = admission.extend('b', 2, 2, charged)
+    assert admission.inflight == other + charged == 10
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.extend('b', 1, 4, charged)
+    assert rejected.value.status == 503
+    assert rejected.value.reason == 'inflight'
+    # a rejected extension leaves the charge as it was
+    assert admission.inflight == 10
+    admission.release(charged)
+    admission.release(other)
+    assert admission.inflight == 0
+
+
+def test_extend_lets_a_lone_request_grow_to_the_whole_budget():
+    admission = AdmissionController(key_budget=0, inflight_budget=10)
+    charged = admission.admit('a', 3)
+    charged = admission.extend('a', 30, 3, charged)
+    assert charged == admission.inflight == 10
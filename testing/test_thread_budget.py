@@ -0,0 +1,97 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from xgboost import XGBRegressor
+
+import forecaster
+from thread_budget import PREDICT_ROWS_PER_THREAD, ThreadBudget
+
+# FIT_THREADS: fits and long predictions take XGBoost threads from one budget, by
+# their number of rows and their fair share, and never hold more than the cores.
+
+
+def test_threads_follow_rows_up_to_cores():
+    budget = ThreadBudget(cores=4, rows_per_thread=1000)
+    assert budget.threads_for(10) == 1
+    assert budget.threads_for(2500) == 2
+    assert budget.threads_for(10**6) == 4
+    assert budget.threads_for(25000, rows_per_thread=10000) == 2
+
+
+def test_concurrent_reservations_never_exceed_cores():
+    budget = ThreadBudget(cores=4, rows_per_thread=1000)
+    peak, lock = [0], threading.Lock()
+
+    def fit():
+        with budget.reserve(10**6) as threads:
+            assert threads >= 1
+            with lock:
+                peak[0] = max(peak[0], budget.in_use)
+            time.sleep(0.01)
+
+    workers = [threading.Thread(target=fit) for _ in range(12)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert 1 <= peak[0] <= 4
+    assert budget.in_use == 0
+    assert budget.stats()['active'] == 0
+
+
+def test_reservation_waits_for_a_free_core():
+    budget = ThreadBudget(cores=2, rows_per_thread=1000)
+    granted = []
+
+    def fit():
+        with budget.reserve(10**6) as threads:
+            granted.append(threads)
+
+    with budget.reserve(10**6) as held:
+        assert held == 2
+        waiter = threading.Thread(target=fit)
+        waiter.start()
+        waiter.join(0.1)
+        assert waiter.is_alive() and not granted
+    waiter.join(1)
+    assert granted == [2]
+    assert budget.waits == 1
+
+
+@pytest.fixture(scope='module')
+def model():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(2000, 6)).astype(np.float32)
+    y = np.column_stack([x[:, 0] * 3 + np.sin(x[:, 1]), x[:, 2]])
+    return XGBRegressor(n_estimators=20, tree_method='hist', n_jobs=1).fit(x, y)
+
+
+def recorded(predict, calls):
+    def wrapper(pred_x):
+        calls.append(len(pred_x))
+        return predict(pred_x)
+    return wrapper
+
+
+def test_long_grid_is_predicted_in_blocks_with_the_same_result(model, monkeypatch):
+    monkeypatch.setattr(forecaster, 'thread_budget', ThreadBudget(cores=4))
+    pred_x = np.random.default_rng(1).normal(size=(3 * PREDICT_ROWS_PER_THREAD + 7, 6)).astype(np.float32)
+    calls = []
+    predictions = forecaster._predict(recorded(model.predict, calls), pred_x)
+    assert calls == [len(block) for block in np.array_split(pred_x, 3)]
+    np.testing.assert_array_equal(predictions, model.predict(pred_x))
+    assert forecaster.thread_budget.in_use == 0
+
+
+def test_short_grid_predicts_without_waiting_for_the_budget(model, monkeypatch):
+    budget = ThreadBudget(cores=2)
+    monkeypatch.setattr(forecaster, 'thread_budget', budget)
+    pred_x = np.zeros((96, 6), dtype=np.float32)
+    calls = []
+    with budget.reserve(10**9):
+        predictions = forecaster._predict(recorded(model.predict, calls), pred_x)
+    assert calls == [96]
+    assert budget.waits == 0
+    np.testing.assert_array_equal(predictions, model.predict(pred_x))
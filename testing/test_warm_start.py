@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from forecaster import MAX_WARM_START_GROWTH, forecast_xgb_timeseries
+from model_cache import ModelCache
+
+# incremental=true: a history that only appends readings to the one a cached model
+# was trained on continues that model with trees for the new rows; any other
+# change is a full retrain.
+
+PERIOD = ['2025-07-21T00:00:00+00:00', '2025-07-22T00:00:00+00:00']
+TREES = 50
+
+
+def history(hours, seed=0):
+    index = pd.date_range('2025-07-01', periods=hours, freq='h', tz='UTC')
+    rng = np.random.default_rng(seed)
+    values = 20 + 5 * np.sin(np.arange(hours) * 2 * np.pi / 24) + rng.normal(0, 0.5, hours)
+    return {'timestamp': index, 'value': values}
+
+
+def forecast(data, cache, incremental=True):
+    return forecast_xgb_timeseries(data, PERIOD, 3600, model_size_modulator=TREES / 100, fast_path=False,
+                                   model_cache=cache, series_key=('urn:e', 'temperature'), incremental=incremental)
+
+
+def appended(data, hours):
+    longer = history(len(data['timestamp']) + hours)
+    longer['value'][:len(data['value'])] = data['value']
+    return longer
+
+
+def test_appended_readings_continue_the_model():
+    cache = ModelCache(max_entries=8)
+    data = history(240)
+    forecast(data, cache)
+    out = forecast(appended(data, 24), cache)
+    assert cache.warm_starts == 1
+    # the last stored bin is trained on again with the 24 new rows
+    assert out.attrs['train_rows'] == 25
+    assert out.attrs['trees_trained'] == int(np.ceil(TREES * 25 / 264))
+    assert out.attrs['trees_used'] == TREES + out.attrs['trees_trained']
+
+
+def test_changed_history_is_retrained_from_scratch():
+    cache = ModelCache(max_entries=8)
+    data = history(240)
+    forecast(data, cache)
+    changed = appended(data, 24)
+    changed['value'][100] += 1.0
+    out = forecast(changed, cache)
+    assert cache.warm_starts == 0
+    assert out.attrs['trees_used'] == out.attrs['trees_trained'] == TREES
+
+
+def test_lineage_is_retrained_once_it_has_grown_too_large():
+    cache = ModelCache(max_entries=8)
+    data = history(240)
+    forecast(data, cache)
+    trees = [TREES]
+    for _ in range(20):
+        data = appended(data, 120)
+        trees.append(forecast(data, cache).attrs['trees_used'])
+        if trees[-1] >= MAX_WARM_START_GROWTH * TREES:
+            break
+    assert trees == sorted(trees) and trees[-1] >= MAX_WARM_START_GROWTH * TREES
+    out = forecast(appended(data, 24), cache)
+    assert out.attrs['trees_used'] == TREES
+    assert cache.warm_starts == len(trees) - 1
+
+
+def test_without_incremental_appended_readings_are_retrained():
+    cache = ModelCache(max_entries=8)
+    data = history(240)
+    forecast(data, cache, incremental=False)
+    out = forecast(appended(data, 24), cache, incremental=False)
+    assert cache.warm_starts == 0
+    assert out.attrs['trees_trained'] == TREES